@@ -19,6 +19,10 @@ app.conf.beat_schedule = {
         "task": "core.tasks.handler_task",
         "schedule": timedelta(seconds=10),
     },
+    "cleanup_stale_uploads": {
+        "task": "core.tasks.cleanup_uploads_task",
+        "schedule": timedelta(seconds=int(os.environ.get("UPLOAD_CLEANUP_INTERVAL", "3600"))),
+    },
 }
 
 
@@ -173,4 +173,85 @@ NEXARA_API_KEY=os.environ.get("NEXARA_API_KEY", "")
 
 # === Константы для YANDEX GPT ===
 YANDEX_OAUTH_TOKEN=os.environ.get("YANDEX_OAUTH_TOKEN", "")
-YANDEX_FOLDER_ID=os.environ.get("YANDEX_FOLDER_ID", "")
\ No newline at end of file
+YANDEX_FOLDER_ID=os.environ.get("YANDEX_FOLDER_ID", "")
+
+# === Локальный кэш артефактов на воркере ===
+ARTIFACT_CACHE_DIR = os.environ.get("ARTIFACT_CACHE_DIR", str(BASE_DIR / "artifact_cache"))
+ARTIFACT_CACHE_MAX_BYTES = int(os.environ.get("ARTIFACT_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# === Режим вызова YandexGPT: sync | deferred ===
+YANDEX_GPT_MODE = os.environ.get("YANDEX_GPT_MODE", "sync")
+YANDEX_GPT_POLL_INTERVAL = int(os.environ.get("YANDEX_GPT_POLL_INTERVAL", "5"))
+YANDEX_GPT_BATCH_POLL_INTERVAL = int(os.environ.get("YANDEX_GPT_BATCH_POLL_INTERVAL", "60"))
+YANDEX_GPT_POLL_MAX_ATTEMPTS = int(os.environ.get("YANDEX_GPT_POLL_MAX_ATTEMPTS", "720"))
+
+# === Тарифы провайдеров (руб.) ===
+NEXARA_PRICE_PER_MINUTE = os.environ.get("NEXARA_PRICE_PER_MINUTE", "0.50")
+YANDEX_GPT_PRICE_PER_1K_TOKENS = os.environ.get("YANDEX_GPT_PRICE_PER_1K_TOKENS", "1.20")
+YANDEX_GPT_ASYNC_PRICE_PER_1K_TOKENS = os.environ.get("YANDEX_GPT_ASYNC_PRICE_PER_1K_TOKENS", "0.60")
+
+# === LLM-провайдеры и маршрутизация (yandexgpt, caila, fake) ===
+LLM_PROVIDERS = [
+    name.strip() for name in os.environ.get("LLM_PROVIDERS", "yandexgpt").split(",") if name.strip()
+]
+LLM_TIMEOUT = int(os.environ.get("LLM_TIMEOUT", "180"))
+LLM_ROUTER_WINDOW = int(os.environ.get("LLM_ROUTER_WINDOW", "20"))
+LLM_ROUTER_MAX_ERROR_RATE = float(os.environ.get("LLM_ROUTER_MAX_ERROR_RATE", "0.5"))
+LLM_ROUTER_COOLDOWN = int(os.environ.get("LLM_ROUTER_COOLDOWN", "60"))
+LLM_FAKE_LATENCY = float(os.environ.get("LLM_FAKE_LATENCY", "0"))
+
+CAILA_API_KEY = os.environ.get("CAILA_API_KEY", "")
+CAILA_BASE_URL = os.environ.get("CAILA_BASE_URL", "https://caila.io/api/adapters/openai")
+CAILA_MODEL = os.environ.get("CAILA_MODEL", "just-ai/gigachat/GigaChat-2-Pro")
+CAILA_PRICE_PER_1K_TOKENS = os.environ.get("CAILA_PRICE_PER_1K_TOKENS", "2.25")
+
+# === Пулы соединений клиентов (на процесс) ===
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", "20"))
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "10"))
+
+# === S3-клиент (core.storage): ретраи, таймауты (сек), upload_fileobj — порог и часть (MB), потоки ===
+S3_MAX_ATTEMPTS = int(os.environ.get("S3_MAX_ATTEMPTS", "5"))
+S3_CONNECT_TIMEOUT = float(os.environ.get("S3_CONNECT_TIMEOUT", "10"))
+S3_READ_TIMEOUT = float(os.environ.get("S3_READ_TIMEOUT", "120"))
+S3_TRANSFER_THRESHOLD = int(os.environ.get("S3_TRANSFER_THRESHOLD_MB", "16")) * 1024 * 1024
+S3_TRANSFER_CHUNK_SIZE = int(os.environ.get("S3_TRANSFER_CHUNK_MB", "16")) * 1024 * 1024
+S3_TRANSFER_CONCURRENCY = int(os.environ.get("S3_TRANSFER_CONCURRENCY", "8"))
+
+# === Excel-отчёты: кэш разобранных шаблонов (число) и буфер рендеринга ===
+EXCEL_TEMPLATE_CACHE_SIZE = int(os.environ.get("EXCEL_TEMPLATE_CACHE_SIZE", "32"))
+REPORT_SPOOL_MAX_BYTES = int(os.environ.get("REPORT_SPOOL_MAX_MB", "32")) * 1024 * 1024
+
+# === PDF-отчёты: шрифт с кириллицей и кэш раскладок шаблонов (число) ===
+PDF_FONT_PATH = os.environ.get("PDF_FONT_PATH", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+PDF_FONT_BOLD_PATH = os.environ.get("PDF_FONT_BOLD_PATH", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf")
+PDF_LAYOUT_CACHE_SIZE = int(os.environ.get("PDF_LAYOUT_CACHE_SIZE", "32"))
+
+# === Прямая загрузка из браузера: размер части (MB), срок подписанных URL (сек) ===
+# Бакету нужен CORS с разрешённым PUT и ExposeHeaders: ETag
+DIRECT_UPLOAD_PART_SIZE = int(os.environ.get("DIRECT_UPLOAD_PART_SIZE_MB", "16")) * 1024 * 1024
+DIRECT_UPLOAD_URL_EXPIRES = int(os.environ.get("DIRECT_UPLOAD_URL_EXPIRES", "3600"))
+
+# === Серверная составная загрузка: потоки, лимит памяти (MB), целевое время части (сек), макс. часть (MB) ===
+UPLOAD_MAX_WORKERS = int(os.environ.get("UPLOAD_MAX_WORKERS", "8"))
+UPLOAD_MAX_IN_FLIGHT_BYTES = int(os.environ.get("UPLOAD_MAX_IN_FLIGHT_MB", "128")) * 1024 * 1024
+UPLOAD_TARGET_PART_SECONDS = float(os.environ.get("UPLOAD_TARGET_PART_SECONDS", "4"))
+UPLOAD_MAX_PART_SIZE = int(os.environ.get("UPLOAD_MAX_PART_SIZE_MB", "64")) * 1024 * 1024
+
+# === Сессии составной загрузки: сколько секунд без активности ждать продолжения ===
+UPLOAD_SESSION_MAX_AGE = int(os.environ.get("UPLOAD_SESSION_MAX_AGE", str(24 * 3600)))
+
+# === Потоковая загрузка: тело запроса уходит в S3 частями, без временного файла ===
+UPLOAD_STREAMING = os.environ.get("UPLOAD_STREAMING", "true").lower() in ("1", "true", "yes")
+
+# === Дедупликация: до какого размера (MB) браузер считает SHA-256 перед загрузкой,
+# через сколько секунд удалять дубликат прямой загрузки (его может ещё читать обработка) ===
+DEDUP_CLIENT_HASH_MAX_BYTES = int(os.environ.get("DEDUP_CLIENT_HASH_MAX_MB", "256")) * 1024 * 1024
+DEDUP_DUPLICATE_DELETE_DELAY = int(os.environ.get("DEDUP_DUPLICATE_DELETE_DELAY", "3600"))
+
+# === Пакетная загрузка: максимум файлов за раз, сколько файлов передаётся одновременно ===
+BULK_UPLOAD_MAX_FILES = int(os.environ.get("BULK_UPLOAD_MAX_FILES", "100"))
+BULK_UPLOAD_CONCURRENCY = int(os.environ.get("BULK_UPLOAD_CONCURRENCY", "4"))
+
+# === Извлечение аудио из видео: путь к ffmpeg, частота дискретизации речевого WAV (Гц) ===
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+AUDIO_EXTRACT_SAMPLE_RATE = int(os.environ.get("AUDIO_EXTRACT_SAMPLE_RATE", "16000"))
@@ -0,0 +1,83 @@
+"""
+Нормализованные ответы задач (MediaTaskAnswer) для аналитических выгрузок.
+
+Строки ответов пересобираются при каждом сохранении gpt_result, поэтому
+выгрузке матрицы ответов не нужно заново разбирать JSON каждой задачи.
+"""
+import json
+import re
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import MediaTaskAnswer, TemplateTypeChoices
+
+
+NUMBER_RE = re.compile(r"[-+]?\d+(?:[.,]\d+)?")
+
+
+def coerce_number(value, lenient=False):
+    """
+    Приводит ответ к числу. Строгий режим принимает только строку-число
+    ("7", "4,5"); мягкий (для SCORE-шаблонов) берёт число в начале ответа:
+    "8/10", "7 — в целом доволен".
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+
+    text = value.strip()
+    match = NUMBER_RE.fullmatch(text) or (lenient and NUMBER_RE.match(text))
+    if not match:
+        return None
+    return float(match.group(0).replace(",", "."))
+
+
+def _answer_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def store_task_answers(media_obj, answers):
+    """
+    Заменяет строки MediaTaskAnswer задачи ответами из answers ({id: ответ}).
+    Сохраняются только ответы на вопросы шаблона: лишние ключи, которые
+    вернула модель ("комментарий", "итог"), в матрицу ответов не попадают.
+    """
+    version = media_obj.template_version
+    lenient = bool(
+        version and version.template.template_type == TemplateTypeChoices.SCORE
+    )
+    if version and version.questions:
+        question_ids = {str(q["id"]) for q in version.questions}
+    else:
+        question_ids = None
+    max_length = MediaTaskAnswer._meta.get_field("question_id").max_length
+    answers = {
+        str(qid): value
+        for qid, value in (answers or {}).items()
+        if (str(qid) in question_ids if question_ids is not None else len(str(qid)) <= max_length)
+    }
+    now = timezone.now()
+    rows = [
+        MediaTaskAnswer(
+            media_task=media_obj,
+            project_id=media_obj.project_id,
+            template_version=version,
+            question_id=qid,
+            answer=_answer_text(value),
+            answer_number=coerce_number(value, lenient=lenient),
+            updated_at=now,
+        )
+        for qid, value in answers.items()
+    ]
+    with transaction.atomic():
+        MediaTaskAnswer.objects.filter(media_task=media_obj).delete()
+        MediaTaskAnswer.objects.bulk_create(rows)
+    return len(rows)
@@ -0,0 +1,162 @@
+"""
+Доступ к артефактам MediaTask (транскрипции, отчёты) для этапов конвейера.
+
+Артефакт читается из самого дешёвого источника:
+БД -> локальный LRU-кэш воркера на диске -> S3.
+"""
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+
+from core import storage
+
+
+class LocalArtifactCache:
+    """
+    Ограниченный по размеру дисковый LRU-кэш артефактов на воркере.
+
+    Время последнего обращения хранится в mtime файла: при чтении оно
+    обновляется, при переполнении удаляются самые старые файлы.
+    """
+
+    def __init__(self, root_dir, max_bytes):
+        self.root_dir = str(root_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root_dir, digest[:2], digest)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path, None)
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for dir_path, _, file_names in os.walk(self.root_dir):
+                for name in file_names:
+                    if name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(dir_path, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+
+_artifact_cache = None
+
+
+def get_artifact_cache():
+    global _artifact_cache
+    if _artifact_cache is None:
+        _artifact_cache = LocalArtifactCache(
+            settings.ARTIFACT_CACHE_DIR,
+            settings.ARTIFACT_CACHE_MAX_BYTES,
+        )
+    return _artifact_cache
+
+
+def split_storage_url(storage_url):
+    """
+    Разбирает публичный URL объекта вида {ENDPOINT_URL}/{bucket}/{key}
+    и возвращает пару (bucket, key).
+    """
+    prefix = f"{settings.ENDPOINT_URL}/"
+    if not storage_url or not storage_url.startswith(prefix):
+        raise ValueError(f"Неожиданный формат пути: {storage_url}")
+    bucket, _, key = storage_url[len(prefix):].partition("/")
+    if not bucket or not key:
+        raise ValueError(f"Неожиданный формат пути: {storage_url}")
+    return bucket, key
+
+
+def format_transcript(segments):
+    """
+    Формирует текст транскрипции посегментно (в порядке Nexara).
+    """
+    lines = []
+    for seg in segments:
+        speaker = seg.get("speaker", "unknown")
+        text = seg.get("text", "").strip()
+        if text:
+            lines.append(f"{speaker}: {text}")
+    return "\n".join(lines)
+
+
+def cache_artifact(storage_url, data):
+    """
+    Кладёт только что записанный в S3 артефакт в локальный кэш воркера.
+    """
+    get_artifact_cache().put(storage_url, data)
+
+
+def read_artifact(storage_url):
+    """
+    Возвращает байты артефакта: сначала из локального кэша, иначе из S3.
+    """
+    cache = get_artifact_cache()
+    data = cache.get(storage_url)
+    if data is not None:
+        print(f"📦 Артефакт взят из локального кэша: {storage_url}")
+        return data
+
+    bucket, key = split_storage_url(storage_url)
+    data = storage.get_bytes(key, bucket=bucket)
+    print(f"📥 Артефакт загружен из S3: {storage_url}")
+
+    cache.put(storage_url, data)
+    return data
+
+
+def read_transcript(media_obj):
+    """
+    Возвращает текст транскрипции MediaTask.
+
+    Если сегменты уже лежат в MediaTask.diarization_segments, текст
+    собирается из БД без обращения к хранилищу.
+    """
+    if media_obj.diarization_segments:
+        print(f"📦 Транскрипция MediaTask #{media_obj.id} собрана из БД")
+        return format_transcript(media_obj.diarization_segments)
+
+    if not media_obj.transcribation_path:
+        return None
+
+    return read_artifact(media_obj.transcribation_path).decode("utf-8")
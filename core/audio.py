@@ -0,0 +1,166 @@
+"""
+Разбор заголовков аудиофайлов без чтения файла целиком.
+
+WavHeaderParser получает байты потоком (по мере загрузки) и извлекает
+из RIFF-заголовка формат, частоту, число каналов и длительность.
+probe_media определяет те же параметры у файла при загрузке: WAV —
+по заголовку, остальные форматы — через mutagen, который читает только
+служебные блоки файла.
+"""
+import os
+import struct
+
+from mutagen import File as MutagenFile
+
+
+# Сколько байт ждать чанк "data", прежде чем признать заголовок нераспознанным
+WAV_HEADER_LIMIT = 1024 * 1024
+PROBE_CHUNK_SIZE = 64 * 1024
+
+VIDEO_EXTENSIONS = ("mp4", "mov", "avi", "mkv")
+
+
+class WavHeaderParser:
+    """
+    Потоковый разбор WAV-заголовка: feed() вызывается с очередными
+    кусками файла, после нахождения чанка "data" буфер больше не растёт.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.done = False
+        self.valid = False
+        self.channels = None
+        self.sample_rate = None
+        self.byte_rate = None
+        self.bits_per_sample = None
+        self.data_offset = None
+        self.data_size = None
+
+    def feed(self, data):
+        if self.done:
+            return
+        self._buffer.extend(data)
+        self._parse()
+        if not self.done and len(self._buffer) > WAV_HEADER_LIMIT:
+            self.done = True
+
+    def _parse(self):
+        buffer = self._buffer
+        if len(buffer) < 12:
+            return
+        if buffer[:4] not in (b"RIFF", b"RF64") or buffer[8:12] != b"WAVE":
+            self.done = True
+            return
+
+        offset = 12
+        while offset + 8 <= len(buffer):
+            chunk_id = bytes(buffer[offset:offset + 4])
+            chunk_size = struct.unpack_from("<I", buffer, offset + 4)[0]
+            body = offset + 8
+
+            if chunk_id == b"fmt ":
+                if body + 16 > len(buffer):
+                    return
+                (_, self.channels, self.sample_rate, self.byte_rate,
+                 _, self.bits_per_sample) = struct.unpack_from("<HHIIHH", buffer, body)
+            elif chunk_id == b"data":
+                self.data_offset = body
+                # 0 и 0xFFFFFFFF пишут при потоковой записи, когда размер неизвестен
+                self.data_size = chunk_size if chunk_size not in (0, 0xFFFFFFFF) else None
+                self.valid = self.byte_rate is not None
+                self.done = True
+                self._buffer = bytearray()
+                return
+
+            # Чанки выравниваются по чётной границе
+            offset = body + chunk_size + (chunk_size & 1)
+
+    def duration(self, total_size=None):
+        """
+        Длительность в секундах. Если размер данных в заголовке не указан,
+        считается по фактическому размеру файла total_size.
+        """
+        if not self.valid or not self.byte_rate:
+            return None
+        data_size = self.data_size
+        if data_size is None and total_size is not None:
+            data_size = total_size - self.data_offset
+        if data_size is None:
+            return None
+        if total_size is not None:
+            data_size = min(data_size, total_size - self.data_offset)
+        return max(data_size, 0) / self.byte_rate
+
+    def media_fields(self, total_size=None):
+        """
+        Поля MediaTask по разобранному заголовку ({} если он не распознан).
+        """
+        if not self.valid:
+            return {}
+        return {
+            "audio_duration_seconds": self.duration(total_size),
+            "audio_sample_rate": self.sample_rate,
+            "audio_channels": self.channels,
+        }
+
+
+def patch_wav_sizes(header, data_offset, total_size):
+    """
+    Проставляет в начале WAV-файла размеры RIFF и чанка "data", когда
+    они стали известны (при записи в поток они не заполняются).
+    """
+    header = bytearray(header)
+    struct.pack_into("<I", header, 4, min(total_size - 8, 0xFFFFFFFF))
+    struct.pack_into("<I", header, data_offset - 4, min(total_size - data_offset, 0xFFFFFFFF))
+    return bytes(header)
+
+
+def _probe_wav(fileobj, size):
+    parser = WavHeaderParser()
+    while not parser.done:
+        chunk = fileobj.read(PROBE_CHUNK_SIZE)
+        if not chunk:
+            break
+        parser.feed(chunk)
+    return parser.media_fields(size)
+
+
+def _probe_mutagen(fileobj, video):
+    media = MutagenFile(fileobj)
+    info = getattr(media, "info", None)
+    if info is None:
+        return {}
+    fields = {
+        "duration_seconds" if video else "audio_duration_seconds": getattr(info, "length", None) or None,
+        "audio_sample_rate": getattr(info, "sample_rate", None) or None,
+        "audio_channels": getattr(info, "channels", None) or None,
+    }
+    return {name: value for name, value in fields.items() if value is not None}
+
+
+def probe_media(fileobj, name, size=None):
+    """
+    Длительность, частота и число каналов файла по его заголовку — как
+    словарь полей MediaTask (пустой, если формат не распознан). fileobj
+    должен поддерживать seek; позиция в нём восстанавливается.
+    """
+    ext = name.rsplit(".", 1)[-1].lower()
+    position = fileobj.tell()
+    try:
+        if size is None:
+            size = fileobj.seek(0, os.SEEK_END)
+        fileobj.seek(0)
+        if ext == "wav":
+            return _probe_wav(fileobj, size)
+        return _probe_mutagen(fileobj, ext in VIDEO_EXTENSIONS)
+    except Exception as e:
+        print(f"⚠️ Не удалось определить параметры {name}: {e}")
+        return {}
+    finally:
+        fileobj.seek(position)
+
+
+def probe_media_path(path, name=None):
+    with open(path, "rb") as f:
+        return probe_media(f, name or os.path.basename(path))
@@ -0,0 +1,123 @@
+"""
+Дедупликация медиафайлов по содержимому.
+
+Каждый уникальный файл (по SHA-256) регистрируется в StoredBlob один раз.
+Повторная загрузка того же содержимого не создаёт новый объект: задача
+ссылается на уже сохранённый, а счётчик ссылок растёт.
+
+Объекты в бакете публичные, но их URL приватен за счёт случайного ключа.
+Поэтому проверка по хэшу без передачи байтов (find_blob) ищет только
+среди файлов своей интеграции: иначе знание SHA-256 и размера чужого
+файла давало бы задачу с его аудио, расшифровкой и анализом. Дедупликация
+уже загруженных байтов (dedupe_upload) общая: загрузивший и так их знает.
+"""
+import hashlib
+import re
+
+from django.db import transaction
+from django.db.models import F
+
+from core import storage
+from core.models import MediaTask, StoredBlob
+
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def find_blob(sha256, integration, size=None):
+    """
+    StoredBlob с содержимым sha256, если на него уже ссылается задача
+    интеграции integration.
+    """
+    if not MediaTask.objects.filter(integration=integration, audio_sha256=sha256).exists():
+        return None
+    queryset = StoredBlob.objects.filter(sha256=sha256)
+    if size is not None:
+        queryset = queryset.filter(size=size)
+    return queryset.first()
+
+
+def acquire_blob(sha256, key, size):
+    """
+    Добавляет ссылку на содержимое sha256, загруженное под ключом key.
+    Возвращает (blob, duplicate): duplicate=True, если такое содержимое
+    уже хранится под другим ключом и объект key больше не нужен.
+    """
+    with transaction.atomic():
+        blob, created = StoredBlob.objects.select_for_update().get_or_create(
+            sha256=sha256,
+            defaults={"key": key, "size": size},
+        )
+        StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") + 1)
+    return blob, not created and blob.key != key
+
+
+def release_blob(sha256, key):
+    """
+    Снимает ссылку задачи на объект key. Последняя ссылка удаляет
+    и запись, и объект в хранилище (после коммита транзакции).
+    """
+    with transaction.atomic():
+        blob = StoredBlob.objects.select_for_update().filter(sha256=sha256, key=key).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") - 1)
+            return
+        blob.delete()
+        transaction.on_commit(lambda: delete_object(key))
+
+
+def dedupe_upload(sha256, key, size):
+    """
+    Регистрирует только что загруженный объект key. Если такое содержимое
+    уже есть, лишний объект удаляется и возвращается URL существующего.
+    Вызывать до того, как на key сослалась какая-либо задача.
+    """
+    blob, duplicate = acquire_blob(sha256, key, size)
+    if duplicate:
+        print(f"♻️ Файл {sha256[:12]} уже есть в хранилище: {blob.key}")
+        delete_object(key)
+    return storage.object_url(blob.key)
+
+
+class HashingReader:
+    """
+    Обёртка файлового объекта для последовательного чтения: попутно
+    считает SHA-256 и размер прочитанных данных.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.digest.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+def hash_object(key):
+    """
+    SHA-256 и размер объекта в хранилище; читается потоком по частям.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in storage.stream(key, chunk_size=HASH_CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def delete_object(key):
+    try:
+        storage.delete(key)
+        print(f"🗑 Объект {key} удалён из хранилища")
+    except Exception as e:
+        print(f"⚠️ Не удалось удалить объект {key}: {e}")
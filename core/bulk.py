@@ -0,0 +1,228 @@
+"""
+Пакетная загрузка: много файлов или ZIP-архив за один запрос.
+
+Файлы (и WAV из архивов) передаются в хранилище параллельно, по
+BULK_UPLOAD_CONCURRENCY одновременно; потоки и память составной загрузки
+делятся между ними. SHA-256 и параметры аудио считаются попутно.
+Задачи и события создаются через bulk_create в одной транзакции, а при
+выбранном шаблоне сразу создаётся и TEMPLATE_SELECTED — обработка
+начинается без выбора шаблона для каждого файла.
+"""
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from core import storage
+from core.audio import probe_media
+from core.blobs import HashingReader, dedupe_upload, release_blob
+from core.models import EventTypeChoices, MediaTask, MediaTaskStatusChoices, OutboxEvent
+from core.uploads import ParallelUploader, media_upload_key
+
+
+BULK_EXTENSIONS = ("wav",)
+ARCHIVE_EXTENSIONS = ("zip",)
+# Флаг ZIP: имя члена архива записано в UTF-8
+ZIP_UTF8_FLAG = 0x800
+
+
+class BulkUploadError(Exception):
+    pass
+
+
+def _extension(name):
+    return name.rsplit(".", 1)[-1].lower() if "." in name else ""
+
+
+def _member_name(info):
+    name = info.filename
+    if not info.flag_bits & ZIP_UTF8_FLAG:
+        # Архиваторы Windows пишут имена в OEM-кодировке (для русской локали — cp866)
+        try:
+            name = name.encode("cp437").decode("cp866")
+        except UnicodeError:
+            pass
+    return os.path.basename(name)
+
+
+class BulkItem:
+    """
+    Один файл пакета: файл из запроса или член ZIP-архива.
+    open() возвращает контекстный менеджер с файловым объектом.
+    """
+
+    def __init__(self, name, size, opener):
+        self.name = name
+        self.size = size
+        self.opener = opener
+        self.saved_name = None
+        self.key = None
+
+    def open(self):
+        return self.opener()
+
+
+def collect_bulk_items(files):
+    """
+    Раскрывает загруженные файлы в список BulkItem: WAV берутся как есть,
+    из ZIP-архивов — вложенные WAV. Возвращает (items, пропущенные имена).
+    """
+    items = []
+    skipped = []
+    for file in files:
+        ext = _extension(file.name)
+        if ext in BULK_EXTENSIONS:
+            items.append(BulkItem(file.name, file.size, lambda file=file: nullcontext(file)))
+        elif ext in ARCHIVE_EXTENSIONS:
+            try:
+                archive = zipfile.ZipFile(file)
+            except zipfile.BadZipFile:
+                skipped.append(file.name)
+                continue
+            for info in archive.infolist():
+                name = _member_name(info)
+                if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                    continue
+                if _extension(name) in BULK_EXTENSIONS:
+                    items.append(BulkItem(name, info.file_size, lambda archive=archive, info=info: archive.open(info)))
+                else:
+                    skipped.append(name)
+        else:
+            skipped.append(file.name)
+
+    if len(items) > settings.BULK_UPLOAD_MAX_FILES:
+        raise BulkUploadError(f"слишком много файлов ({len(items)}), максимум {settings.BULK_UPLOAD_MAX_FILES}")
+
+    # Одноимённые файлы из разных папок архива не должны затирать друг друга
+    used_keys = set()
+    for item in items:
+        item.saved_name, item.key = media_upload_key(item.name)
+        copy = 1
+        while item.key in used_keys:
+            copy += 1
+            item.saved_name, item.key = media_upload_key(f"{copy}_{item.name}")
+        used_keys.add(item.key)
+    return items, skipped
+
+
+class BulkUploader:
+    """
+    Передаёт файлы пакета в хранилище параллельно и создаёт по ним задачи.
+    """
+
+    def __init__(self, project, user, concurrency=None):
+        self.project = project
+        self.user = user
+        self.concurrency = concurrency or settings.BULK_UPLOAD_CONCURRENCY
+
+    def _upload_item(self, item):
+        try:
+            return self._store_item(item)
+        finally:
+            # Соединения с БД, открытые в потоке пула, сами не закроются
+            connections.close_all()
+
+    def _store_item(self, item):
+        with item.open() as fileobj:
+            media_fields = probe_media(fileobj, item.name, item.size)
+            reader = HashingReader(fileobj)
+            # Потоки и память составной загрузки делятся между одновременными файлами
+            ParallelUploader(
+                max_workers=max(settings.UPLOAD_MAX_WORKERS // self.concurrency, 1),
+                max_in_flight_bytes=max(settings.UPLOAD_MAX_IN_FLIGHT_BYTES // self.concurrency, 1),
+            ).upload(
+                reader,
+                item.key,
+                total_size=item.size,
+                project=self.project,
+                user=self.user,
+                original_name=item.name,
+                saved_name=item.saved_name,
+            )
+        sha256 = reader.hexdigest()
+        public_url = dedupe_upload(sha256, item.key, reader.size)
+        return dict(media_fields, audio_sha256=sha256, audio_storage_url=public_url)
+
+    def upload(self, items):
+        """
+        Загружает items. Возвращает (загруженные [(item, поля задачи)],
+        ошибки [(item, исключение)]); сбой одного файла не останавливает остальные.
+        """
+        uploaded = []
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bulk-upload") as pool:
+            futures = [(item, pool.submit(self._upload_item, item)) for item in items]
+            for item, future in futures:
+                try:
+                    uploaded.append((item, future.result()))
+                    print(f"✅ Пакетная загрузка: {item.name}")
+                except Exception as e:
+                    print(f"❌ Пакетная загрузка {item.name}: {e}")
+                    failed.append((item, e))
+        return uploaded, failed
+
+    def create_tasks(self, uploaded, template=None):
+        """
+        Создаёт задачи и события AUDIO_UPLOADED_TO_YANDEX одной транзакцией;
+        с шаблоном — ещё и TEMPLATE_SELECTED с закреплённой версией.
+        Если транзакция не удалась, загруженные файлы освобождаются.
+        """
+        version = None
+        if template is not None:
+            if not template.current_version_id:
+                template.save()
+            version = template.current_version
+
+        try:
+            with transaction.atomic():
+                tasks = MediaTask.objects.bulk_create([
+                    MediaTask(
+                        project=self.project,
+                        integration=self.user.integration,
+                        audio_uploaded_title=item.name,
+                        audio_title_saved=item.saved_name,
+                        audio_extension_uploaded=_extension(item.name),
+                        status=MediaTaskStatusChoices.LOADED,
+                        cast_template=template,
+                        template_version=version,
+                        **fields
+                    )
+                    for item, fields in uploaded
+                ])
+
+                events = []
+                for task, (item, fields) in zip(tasks, uploaded):
+                    events.append(OutboxEvent(
+                        media_task=task,
+                        event_type=EventTypeChoices.AUDIO_UPLOADED_TO_YANDEX,
+                        payload={
+                            "filename": item.saved_name,
+                            "extension": _extension(item.name),
+                            "uploaded_by": self.user.username,
+                            "project_id": self.project.pk,
+                            "storage_url": fields["audio_storage_url"],
+                            "upload_mode": "bulk",
+                        },
+                    ))
+                    if template is not None:
+                        events.append(OutboxEvent(
+                            media_task=task,
+                            event_type=EventTypeChoices.TEMPLATE_SELECTED,
+                            payload={
+                                "cast_template": template.id,
+                                "selected_by": self.user.username,
+                            },
+                        ))
+                OutboxEvent.objects.bulk_create(events)
+        except Exception:
+            self.release(uploaded)
+            raise
+        return tasks
+
+    def release(self, uploaded):
+        prefix = storage.object_url("")
+        for item, fields in uploaded:
+            release_blob(fields["audio_sha256"], fields["audio_storage_url"][len(prefix):])
@@ -0,0 +1,128 @@
+"""
+Реестр внешних клиентов на время жизни процесса (S3, HTTP, LLM).
+
+Клиенты создаются один раз на процесс: в воркерах Celery — по сигналу
+worker_process_init, в веб-процессе и в solo-воркере — при первом обращении.
+Так TLS-соединения, gRPC-каналы и токены переиспользуются между задачами.
+S3-клиент регистрирует и настраивает core.storage.
+"""
+import os
+import threading
+import time
+
+import openai
+import requests
+from celery.signals import worker_process_init
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from yandex_cloud_ml_sdk import YCloudML
+
+
+class ClientRegistry:
+    def __init__(self):
+        self._factories = {}
+        self._clients = {}
+        self._checked_at = {}
+        self._lock = threading.RLock()
+
+    def register(self, name, factory, health_check=None, check_interval=300):
+        self._factories[name] = (factory, health_check, check_interval)
+
+    def get(self, name):
+        factory, health_check, check_interval = self._factories[name]
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                return self._create(name)
+
+            if health_check and time.monotonic() - self._checked_at[name] > check_interval:
+                try:
+                    health_check(client)
+                    self._checked_at[name] = time.monotonic()
+                except Exception as e:
+                    print(f"⚠️ Клиент {name} не прошёл проверку, переподключаемся: {e}")
+                    return self._create(name)
+            return client
+
+    def _create(self, name):
+        factory, _, _ = self._factories[name]
+        client = factory()
+        self._clients[name] = client
+        self._checked_at[name] = time.monotonic()
+        return client
+
+    def reset(self, name=None):
+        """
+        Сбрасывает клиента (или все): следующий get() создаст новый.
+        """
+        with self._lock:
+            if name is None:
+                self._clients.clear()
+                self._checked_at.clear()
+            else:
+                self._clients.pop(name, None)
+                self._checked_at.pop(name, None)
+
+    def _after_fork(self):
+        # В дочернем процессе блокировка могла остаться захваченной родителем
+        self._lock = threading.RLock()
+        self._clients = {}
+        self._checked_at = {}
+
+    def init_all(self):
+        for name in self._factories:
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"⚠️ Не удалось инициализировать клиента {name}: {e}")
+
+
+def _make_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.HTTP_POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _make_yandex_sdk():
+    return YCloudML(
+        folder_id=settings.YANDEX_FOLDER_ID,
+        auth=settings.YANDEX_OAUTH_TOKEN,
+    )
+
+
+def _make_caila_client():
+    return openai.OpenAI(
+        api_key=settings.CAILA_API_KEY,
+        base_url=settings.CAILA_BASE_URL,
+        max_retries=0,
+    )
+
+
+registry = ClientRegistry()
+registry.register("http", _make_http_session)
+registry.register("yandexgpt", _make_yandex_sdk)
+registry.register("caila", _make_caila_client)
+
+
+def get_http_session():
+    return registry.get("http")
+
+
+def get_yandex_sdk():
+    return registry.get("yandexgpt")
+
+
+def get_caila_client():
+    return registry.get("caila")
+
+
+# gRPC-каналы и пулы соединений нельзя наследовать через fork
+os.register_at_fork(after_in_child=registry._after_fork)
+
+
+@worker_process_init.connect
+def init_worker_clients(**kwargs):
+    registry.reset()
+    registry.init_all()
@@ -0,0 +1,338 @@
+"""
+Работа с Excel-шаблонами отчётов.
+
+Разбор xlsx (XML, стили, объединённые ячейки) дорогой, а сотни задач
+используют несколько одних и тех же шаблонов. Поэтому разобранная книга
+хранится в LRU-кэше воркера как pickle-снимок: восстановить из него копию
+для очередной задачи на порядок дешевле, чем заново вызвать load_workbook.
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from xml.etree.ElementTree import iterparse
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter, range_boundaries
+
+from core import storage
+
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Раскладка шаблона: вопросы (тип, цель, текст) в столбцах A-C начиная
+# с 4-й строки, ответ — в столбец D той же строки
+QUESTIONS_FIRST_ROW = 4
+QUESTION_COLUMNS = 3
+ANSWER_COLUMN = 4
+
+MERGE_CELL_TAG = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}mergeCell"
+
+
+class ExcelTemplateCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_workbook(self, key, loader):
+        """
+        Возвращает независимую копию книги для key; при промахе разбирает
+        её через loader() и кладёт снимок в кэш.
+        """
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if snapshot is not None:
+                self._entries.move_to_end(key)
+
+        if snapshot is None:
+            workbook = loader()
+            snapshot = pickle.dumps(workbook, protocol=pickle.HIGHEST_PROTOCOL)
+            with self._lock:
+                self._entries[key] = snapshot
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            print(f"📄 Excel-шаблон разобран и закэширован: {key}")
+
+        return pickle.loads(snapshot)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_template_cache = None
+
+
+def get_template_cache():
+    global _template_cache
+    if _template_cache is None:
+        _template_cache = ExcelTemplateCache(settings.EXCEL_TEMPLATE_CACHE_SIZE)
+    return _template_cache
+
+
+def load_template_workbook(version):
+    """
+    Книга Excel-шаблона версии CastTemplateVersion, готовая к заполнению.
+    Ключ кэша — шаблон, файл и его mtime/размер, так что замена файла
+    на диске сбрасывает закэшированную копию.
+    """
+    path = default_storage.path(version.excel_file)
+    stat = os.stat(path)
+    key = (version.template_id, version.excel_file, stat.st_mtime_ns, stat.st_size)
+    return get_template_cache().get_workbook(key, lambda: load_workbook(path))
+
+
+def report_object_name(media_obj, extension="xlsx", digest=None):
+    """
+    Ключ отчёта в хранилище. Каталог с id задачи не даёт отчётам разных
+    задач с одинаковым audio_title_saved перезаписывать друг друга;
+    digest (см. report_digest) отделяет отчёты по разным результатам.
+    """
+    file_base = media_obj.audio_title_saved or f"media_task_{media_obj.id}"
+    if digest:
+        return f"excel_uploads/{media_obj.id}/{digest}/{file_base}.{extension}"
+    return f"excel_uploads/{media_obj.id}/{file_base}.{extension}"
+
+
+def report_url(object_name):
+    return storage.object_url(object_name)
+
+
+def new_report_buffer():
+    """
+    Буфер для рендеринга отчёта: в памяти, на диск — только сверх лимита.
+    """
+    return tempfile.SpooledTemporaryFile(max_size=settings.REPORT_SPOOL_MAX_BYTES)
+
+
+def upload_report(buffer, object_name, content_type=XLSX_CONTENT_TYPE):
+    """
+    Загружает отчёт из буфера прямо в S3 и возвращает публичный URL.
+    """
+    buffer.seek(0)
+    return storage.upload_fileobj(buffer, object_name, content_type=content_type)
+
+
+def report_exists(object_name):
+    return storage.exists(object_name)
+
+
+def report_digest(media_obj, version):
+    """
+    Отчёт однозначно определяется версией шаблона и результатом GPT.
+    """
+    digest = hashlib.sha256()
+    digest.update(version.content_hash.encode("utf-8"))
+    digest.update((media_obj.gpt_result or "").encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def fill_template_workbook(version, answers):
+    """
+    Копия книги шаблона версии с ответами answers ({id вопроса: ответ}).
+    """
+    workbook = load_template_workbook(version)
+    sheet = workbook.active
+
+    if version.cell_map:
+        # Ответы пишутся прямо в ячейки, записанные при загрузке шаблона;
+        # вопросы в одной объединённой ячейке не затирают ответы друг друга
+        cell_answers = {}
+        for key, answer in answers.items():
+            cell = version.cell_map.get(str(key))
+            if not cell:
+                print(f"⚠️ Для вопроса {key} нет ячейки в карте шаблона")
+                continue
+            cell_answers.setdefault(cell, []).append(answer)
+        for cell, cell_values in cell_answers.items():
+            sheet[cell] = cell_values[0] if len(cell_values) == 1 else "\n\n".join(map(str, cell_values))
+    else:
+        # Версии без карты ячеек: ответы подряд в столбец D с 4-й строки
+        row = QUESTIONS_FIRST_ROW
+        for key in sorted(answers.keys(), key=lambda x: int(x)):
+            sheet.cell(row=row, column=ANSWER_COLUMN).value = answers[key]
+            row += 1
+    return workbook
+
+
+def ensure_task_report(media_obj, version):
+    """
+    Возвращает URL Excel-отчёта задачи, формируя его только при отсутствии
+    в хранилище. Ключ зависит от хеша gpt_result и версии шаблона, поэтому
+    повторный запрос того же результата не рендерит книгу заново, а новый
+    результат получает новый отчёт. Обновляет media_obj.excel_path.
+    """
+    object_name = report_object_name(media_obj, digest=report_digest(media_obj, version))
+    public_url = report_url(object_name)
+
+    if media_obj.excel_path == public_url or report_exists(object_name):
+        print(f"📦 Excel-отчёт уже в хранилище: {public_url}")
+    else:
+        answers = json.loads(media_obj.gpt_result)
+        workbook = fill_template_workbook(version, answers)
+        with new_report_buffer() as buffer:
+            workbook.save(buffer)
+            workbook.close()
+            upload_report(buffer, object_name)
+        print(f"✅ Excel-отчёт сформирован: {public_url}")
+
+    if media_obj.excel_path != public_url:
+        media_obj.excel_path = public_url
+        media_obj.save(update_fields=["excel_path"])
+    return public_url
+
+
+class MergedRangeIndex:
+    """
+    Интервальный индекс объединённых диапазонов: для каждого столбца —
+    отсортированные по первой строке диапазоны. Диапазоны не пересекаются,
+    поэтому поиск — один bisect, без разворачивания в карту по ячейкам.
+    """
+
+    def __init__(self, ranges):
+        self._columns = {}
+        for min_col, min_row, max_col, max_row in ranges:
+            for col in range(min_col, max_col + 1):
+                self._columns.setdefault(col, []).append((min_row, max_row, min_col))
+        self._starts = {}
+        for col, intervals in self._columns.items():
+            intervals.sort()
+            self._starts[col] = [interval[0] for interval in intervals]
+
+    def anchor(self, row, col):
+        """
+        Левая верхняя ячейка диапазона, содержащего (row, col), или None.
+        """
+        starts = self._starts.get(col)
+        if not starts:
+            return None
+        idx = bisect_right(starts, row) - 1
+        if idx < 0:
+            return None
+        min_row, max_row, min_col = self._columns[col][idx]
+        if row > max_row:
+            return None
+        return min_row, min_col
+
+    def first_row(self, max_col):
+        """
+        Наименьшая первая строка диапазонов, задевающих столбцы 1..max_col.
+        """
+        rows = [self._starts[col][0] for col in range(1, max_col + 1) if self._starts.get(col)]
+        return min(rows) if rows else None
+
+
+def read_merged_ranges(workbook, sheet, source):
+    """
+    Объединённые диапазоны листа read_only-книги: такие листы не разбирают
+    <mergeCells>, поэтому они читаются из XML листа потоково.
+
+    Архив книги и путь листа — закрытые атрибуты openpyxl (_archive,
+    _worksheet_path). Если в другой версии их нет, диапазоны берутся
+    из полной (не read_only) загрузки source — медленнее, но через
+    публичный API.
+    """
+    # У ReadOnlyWorksheet нет merged_cells: берём XML листа из архива книги
+    try:
+        xml_file = workbook._archive.open(sheet._worksheet_path)
+    except (AttributeError, KeyError) as e:
+        print(f"⚠️ Нет доступа к XML листа ({e!r}), объединённые ячейки читаются полной загрузкой книги")
+        return read_merged_ranges_full(source)
+
+    ranges = []
+    with xml_file:
+        for _, element in iterparse(xml_file):
+            if element.tag == MERGE_CELL_TAG:
+                ranges.append(range_boundaries(element.get("ref")))
+            element.clear()
+    return ranges
+
+
+def read_merged_ranges_full(source):
+    """
+    Объединённые диапазоны активного листа через обычную загрузку книги.
+    """
+    if hasattr(source, "seek"):
+        source.seek(0)
+    wb = load_workbook(source, data_only=True)
+    try:
+        return [merged_range.bounds for merged_range in wb.active.merged_cells.ranges]
+    finally:
+        wb.close()
+
+
+def parse_template_questions(source):
+    """
+    Разбирает Excel-шаблон и возвращает пару (questions, cell_map):
+    questions — {"1": "Вопрос типа: ..., цель вопроса: ..., вопрос: ...", ...},
+    cell_map — {"1": "D4", ...}, адрес ячейки для ответа на каждый вопрос.
+
+    source — путь или файловый объект. Книга читается в режиме read_only
+    построчно, значения объединённых ячеек берутся из интервального индекса.
+    Пустые строки пропускаются, а строки-продолжения вертикально
+    объединённых ячеек A–C, как и раньше, считаются отдельными вопросами
+    со значениями объединённой ячейки — номера вопросов в старых шаблонах
+    не меняются. Адрес ответа берётся из строки самого вопроса, а не
+    вычисляется по порядковому номеру.
+    """
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheet = wb.active
+        merged = MergedRangeIndex(read_merged_ranges(wb, sheet, source))
+
+        # Значения левых верхних ячеек нужны и для диапазонов, начинающихся выше
+        first_row = min(QUESTIONS_FIRST_ROW, merged.first_row(QUESTION_COLUMNS) or QUESTIONS_FIRST_ROW)
+        anchor_values = {}
+
+        questions_dict = {}
+        cell_map = {}
+        for row_idx, values in enumerate(
+            sheet.iter_rows(min_row=first_row, max_col=QUESTION_COLUMNS, values_only=True),
+            start=first_row,
+        ):
+            values = list(values) + [None] * (QUESTION_COLUMNS - len(values))
+            for col, value in enumerate(values, start=1):
+                if value is not None and merged.anchor(row_idx, col) == (row_idx, col):
+                    anchor_values[(row_idx, col)] = value
+
+            if row_idx < QUESTIONS_FIRST_ROW:
+                continue
+
+            values = [
+                value or anchor_values.get(merged.anchor(row_idx, col))
+                for col, value in enumerate(values, start=1)
+            ]
+            if not any(values):
+                # пустая строка
+                continue
+            type_q, goal_q, question_text = values
+
+            qid = str(len(questions_dict) + 1)
+            questions_dict[qid] = (
+                f"Вопрос типа: {type_q or '(не указан тип)'}, "
+                f"цель вопроса: {goal_q or '(не указана цель)'}, "
+                f"вопрос: {question_text or '(текст вопроса не найден)'}"
+            )
+            # В объединённую ячейку можно писать только через левую верхнюю
+            answer_row, answer_col = merged.anchor(row_idx, ANSWER_COLUMN) or (row_idx, ANSWER_COLUMN)
+            cell_map[qid] = f"{get_column_letter(answer_col)}{answer_row}"
+    finally:
+        wb.close()
+
+    shared_cells = {}
+    for qid, cell in cell_map.items():
+        shared_cells.setdefault(cell, []).append(qid)
+    for cell, qids in shared_cells.items():
+        if len(qids) > 1:
+            print(f"⚠️ Вопросы {', '.join(qids)} попадают в одну объединённую ячейку {cell}: ответы будут записаны в неё вместе")
+
+    print(f"✅ Распарсено вопросов: {len(questions_dict)}")
+    return questions_dict, cell_map
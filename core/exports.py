@@ -0,0 +1,321 @@
+"""
+Выгрузки проекта: строка на MediaTask, столбец на вопрос шаблона.
+
+Сводный отчёт (xlsx/csv) собирается из задач, матрица ответов для
+аналитики (Parquet или типизированный CSV) — из MediaTaskAnswer.
+Строки читаются из БД курсором (.iterator()) и сразу пишутся в файл:
+xlsxwriter в режиме constant_memory сбрасывает каждую строку на диск,
+CSV и Parquet пишутся порциями. Поэтому память не зависит от числа интервью.
+"""
+import codecs
+import csv
+import json
+from itertools import groupby
+from operator import itemgetter
+
+import xlsxwriter
+from django.utils import timezone
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from core.excel import XLSX_CONTENT_TYPE, new_report_buffer, upload_report
+from core.models import (
+    CastTemplateVersion,
+    ExportFormatChoices,
+    ExportKindChoices,
+    MediaTask,
+    MediaTaskAnswer,
+    MediaTaskStatusChoices,
+    ProjectExportStatusChoices,
+    TemplateTypeChoices,
+)
+
+
+CSV_CONTENT_TYPE = "text/csv; charset=utf-8"
+PARQUET_CONTENT_TYPE = "application/vnd.apache.parquet"
+ITERATOR_CHUNK_SIZE = 500
+# Строк матрицы ответов в одной порции (row group в Parquet)
+MATRIX_CHUNK_ROWS = 5000
+# Ограничение Excel на длину текста в ячейке
+XLSX_MAX_CELL_LENGTH = 32767
+
+FIXED_COLUMNS = ["ID задачи", "Название", "Статус", "Длительность, сек", "Стоимость, ₽"]
+STATUS_LABELS = dict(MediaTaskStatusChoices.choices)
+
+
+def project_question_columns(project):
+    """
+    Столбцы вопросов для выгрузки, отображение версия -> {id вопроса: столбец}
+    и множество числовых столбцов.
+
+    В проекте могут встречаться разные шаблоны и их версии: вопросы
+    с одинаковым текстом сводятся в один столбец. Столбец числовой,
+    если все его вопросы взяты из SCORE-шаблонов и каждый непустой ответ
+    приводится к числу: иначе текстовые ответы (например, «Почему такая
+    оценка?») потерялись бы.
+    """
+    version_ids = set()
+    pairs = (
+        MediaTask.objects
+        .filter(project=project)
+        .values_list("template_version_id", "cast_template__current_version_id")
+        .distinct()
+    )
+    for pinned_id, current_id in pairs:
+        if pinned_id or current_id:
+            version_ids.add(pinned_id or current_id)
+
+    columns = []
+    column_index = {}
+    version_columns = {}
+    numeric_columns = set()
+    text_columns = set()
+    versions = (
+        CastTemplateVersion.objects
+        .filter(id__in=version_ids)
+        .select_related("template")
+        .only("id", "questions", "template__template_type")
+        .order_by("id")
+    )
+    for version in versions:
+        is_score = version.template.template_type == TemplateTypeChoices.SCORE
+        mapping = {}
+        for question in version.questions:
+            text = question["text"]
+            if text not in column_index:
+                column_index[text] = len(columns)
+                columns.append(text)
+            idx = column_index[text]
+            mapping[str(question["id"])] = idx
+            (numeric_columns if is_score else text_columns).add(idx)
+        version_columns[version.id] = mapping
+
+    numeric_columns -= text_columns
+    if numeric_columns:
+        uncoerced = (
+            MediaTaskAnswer.objects
+            .filter(project=project, template_version_id__in=version_ids, answer_number__isnull=True)
+            .exclude(answer="")
+            .values_list("template_version_id", "question_id")
+            .distinct()
+        )
+        for version_id, qid in uncoerced:
+            numeric_columns.discard(version_columns.get(version_id, {}).get(qid))
+
+    return columns, version_columns, numeric_columns
+
+
+def _cell_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def iter_project_rows(project, columns, version_columns):
+    """
+    Строки выгрузки в порядке id задач. Читает только нужные поля
+    серверным курсором, не создавая объектов моделей.
+    """
+    tasks = (
+        MediaTask.objects
+        .filter(project=project)
+        .order_by("id")
+        .values_list(
+            "id",
+            "audio_uploaded_title",
+            "video_uploaded_title",
+            "status",
+            "audio_duration_seconds_nexara",
+            "total_price",
+            "gpt_result",
+            "template_version_id",
+            "cast_template__current_version_id",
+        )
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    )
+    for (task_id, audio_title, video_title, status, duration, price,
+         gpt_result, pinned_id, current_id) in tasks:
+        answers_row = [""] * len(columns)
+        if gpt_result:
+            try:
+                answers = json.loads(gpt_result)
+            except json.JSONDecodeError:
+                answers = {}
+            mapping = version_columns.get(pinned_id or current_id, {})
+            for qid, answer in answers.items():
+                idx = mapping.get(str(qid))
+                if idx is not None:
+                    answers_row[idx] = _cell_value(answer)
+
+        yield [
+            task_id,
+            audio_title or video_title or "Без названия",
+            STATUS_LABELS.get(status, status),
+            duration if duration is not None else "",
+            float(price) if price is not None else "",
+        ] + answers_row
+
+
+def _write_xlsx(buffer, header, rows):
+    workbook = xlsxwriter.Workbook(buffer, {"constant_memory": True})
+    worksheet = workbook.add_worksheet("Интервью")
+    header_format = workbook.add_format({"bold": True, "text_wrap": True, "valign": "top", "border": 1})
+    wrap_format = workbook.add_format({"text_wrap": True, "valign": "top"})
+
+    worksheet.set_column(0, 0, 10)
+    worksheet.set_column(1, 1, 40)
+    worksheet.set_column(2, len(FIXED_COLUMNS) - 1, 18)
+    if len(header) > len(FIXED_COLUMNS):
+        worksheet.set_column(len(FIXED_COLUMNS), len(header) - 1, 50, wrap_format)
+    worksheet.freeze_panes(1, 2)
+    worksheet.write_row(0, 0, header, header_format)
+
+    count = 0
+    for count, row in enumerate(rows, start=1):
+        row = [
+            value[:XLSX_MAX_CELL_LENGTH] if isinstance(value, str) else value
+            for value in row
+        ]
+        worksheet.write_row(count, 0, row)
+
+    workbook.close()
+    return count
+
+
+def _csv_writer(buffer, encoding):
+    """
+    csv.writer поверх байтового буфера. Не TextIOWrapper: в Python 3.10
+    у SpooledTemporaryFile нет readable(), и обёртка падает.
+    """
+    return csv.writer(codecs.getwriter(encoding)(buffer))
+
+
+def _write_csv(buffer, header, rows):
+    # utf-8-sig — чтобы Excel открыл файл с кириллицей без ручного импорта
+    writer = _csv_writer(buffer, "utf-8-sig")
+    writer.writerow(header)
+    count = 0
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+    return count
+
+
+def iter_answer_chunks(project, columns, version_columns, numeric_columns):
+    """
+    Порции строк матрицы ответов [(id задачи, [значения столбцов]), ...]
+    из MediaTaskAnswer без разбора gpt_result. Числовые столбцы
+    получают answer_number, остальные — текст ответа.
+    """
+    answers = (
+        MediaTaskAnswer.objects
+        .filter(project=project)
+        .order_by("media_task_id")
+        .values_list("media_task_id", "template_version_id", "question_id", "answer", "answer_number")
+        .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    )
+    chunk = []
+    for task_id, task_answers in groupby(answers, key=itemgetter(0)):
+        row = [None] * len(columns)
+        for _, version_id, qid, answer, answer_number in task_answers:
+            idx = version_columns.get(version_id, {}).get(qid)
+            if idx is not None:
+                row[idx] = answer_number if idx in numeric_columns else answer
+        chunk.append((task_id, row))
+        if len(chunk) >= MATRIX_CHUNK_ROWS:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _write_matrix_parquet(buffer, columns, numeric_columns, chunks):
+    schema = pa.schema(
+        [pa.field("media_task_id", pa.int64())]
+        + [
+            pa.field(name, pa.float64() if idx in numeric_columns else pa.string())
+            for idx, name in enumerate(columns)
+        ]
+    )
+    writer = pq.ParquetWriter(buffer, schema)
+    count = 0
+    for chunk in chunks:
+        arrays = [pa.array([task_id for task_id, _ in chunk], type=pa.int64())]
+        for idx in range(len(columns)):
+            arrays.append(pa.array([row[idx] for _, row in chunk], type=schema.field(idx + 1).type))
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        count += len(chunk)
+    writer.close()
+    return count
+
+
+def _write_matrix_csv(buffer, columns, numeric_columns, chunks):
+    # Числа пишутся с точкой, пустая ячейка — нет ответа
+    writer = _csv_writer(buffer, "utf-8")
+    writer.writerow(["media_task_id"] + columns)
+    count = 0
+    for chunk in chunks:
+        writer.writerows(
+            [task_id] + ["" if value is None else value for value in row]
+            for task_id, row in chunk
+        )
+        count += len(chunk)
+    return count
+
+
+def _report_writer(export, project):
+    columns, version_columns, _ = project_question_columns(project)
+    header = FIXED_COLUMNS + columns
+    rows = iter_project_rows(project, columns, version_columns)
+
+    if export.export_format == ExportFormatChoices.CSV:
+        return "csv", CSV_CONTENT_TYPE, lambda buffer: _write_csv(buffer, header, rows)
+    return "xlsx", XLSX_CONTENT_TYPE, lambda buffer: _write_xlsx(buffer, header, rows)
+
+
+def _answer_matrix_writer(export, project):
+    columns, version_columns, numeric_columns = project_question_columns(project)
+    chunks = iter_answer_chunks(project, columns, version_columns, numeric_columns)
+
+    if export.export_format == ExportFormatChoices.PARQUET and pq is None:
+        print("⚠️ pyarrow не установлен, матрица ответов будет выгружена в CSV")
+        export.export_format = ExportFormatChoices.CSV
+        export.save(update_fields=["export_format"])
+
+    if export.export_format == ExportFormatChoices.PARQUET:
+        return "parquet", PARQUET_CONTENT_TYPE, lambda buffer: _write_matrix_parquet(
+            buffer, columns, numeric_columns, chunks
+        )
+    return "csv", CSV_CONTENT_TYPE, lambda buffer: _write_matrix_csv(
+        buffer, columns, numeric_columns, chunks
+    )
+
+
+def build_project_export(export):
+    """
+    Формирует файл выгрузки ProjectExport, загружает его в S3
+    и отмечает выгрузку готовой.
+    """
+    project = export.project
+    if export.kind == ExportKindChoices.ANSWER_MATRIX:
+        extension, content_type, write = _answer_matrix_writer(export, project)
+    else:
+        extension, content_type, write = _report_writer(export, project)
+
+    object_name = f"exports/project_{project.id}/{export.kind}_{export.id}.{extension}"
+    with new_report_buffer() as buffer:
+        rows_count = write(buffer)
+        storage_url = upload_report(buffer, object_name, content_type)
+
+    export.storage_url = storage_url
+    export.rows_count = rows_count
+    export.status = ProjectExportStatusChoices.READY
+    export.finished_at = timezone.now()
+    export.save(update_fields=["storage_url", "rows_count", "status", "finished_at"])
+    print(f"✅ Выгрузка проекта #{project.id}: {rows_count} строк, {storage_url}")
+    return export
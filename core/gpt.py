@@ -0,0 +1,261 @@
+"""
+Общие шаги этапа извлечения данных через YandexGPT.
+
+Используются синхронным gpt_task, отложенным режимом (run_deferred + опрос)
+и пакетной обработкой (batch) — все три режима формируют запрос
+и сохраняют результат одинаково.
+"""
+import json
+
+from core.answers import store_task_answers
+from core.artifacts import read_transcript
+from core.clients import get_yandex_sdk
+from core.json_extract import extract_answers
+from core.models import OutboxEvent, EventTypeChoices, MediaTaskStatusChoices
+
+
+GPT_MODEL_NAME = "yandexgpt"
+GPT_TEMPERATURE = 0.3
+
+
+def get_sdk():
+    return get_yandex_sdk()
+
+
+def get_completions_model(sdk):
+    return sdk.models.completions(GPT_MODEL_NAME).configure(temperature=GPT_TEMPERATURE)
+
+
+def get_template_version(media_obj):
+    """
+    Версия шаблона, закреплённая за задачей. Если задача ещё не закреплена
+    (например, создана до появления версий), закрепляет текущую версию шаблона.
+    """
+    if media_obj.template_version_id:
+        return media_obj.template_version
+
+    template = getattr(media_obj, "cast_template", None)
+    if not template:
+        return None
+    if not template.current_version_id:
+        template.save()
+
+    media_obj.template_version = template.current_version
+    media_obj.save(update_fields=["template_version"])
+    return media_obj.template_version
+
+
+def build_gpt_messages(media_obj, question_ids=None):
+    """
+    Собирает сообщения для YandexGPT: system prompt с вопросами шаблона
+    и текст интервью. Возвращает None, если данных для запроса нет.
+
+    question_ids ограничивает запрос указанными вопросами (переспрос).
+    """
+    # --- Получаем текст транскрипции (БД -> локальный кэш -> S3) ---
+    interview_text = read_transcript(media_obj)
+    if not interview_text:
+        print(f"❌ У MediaTask #{media_obj.id} отсутствует транскрипция")
+        return None
+    print(f"✅ Транскрипция получена ({len(interview_text)} символов)")
+
+    # --- Вопросы берём из закреплённой версии шаблона ---
+    version = get_template_version(media_obj)
+    if not version or not version.questions:
+        print(f"❌ У MediaTask #{media_obj.id} отсутствует шаблон с вопросами")
+        return None
+
+    print(f"✅ Загружено {len(version.questions)} вопросов для GPT (версия {version.content_hash[:12]})")
+
+    # --- Формируем system prompt ---
+    if question_ids:
+        # Переспрос: только вопросы без ответа
+        questions = [q for q in version.questions if q["id"] in question_ids]
+        system_prompt = (
+            (version.promt or "")
+            + "\n".join(f"{q['id']}. {q['text']}" for q in questions)
+            + "\n\nОтветь строго JSON-объектом только на вопросы с номерами: "
+            + ", ".join(q["id"] for q in questions)
+        )
+    else:
+        system_prompt = version.prompt
+
+    user_prompt = f"Интервью:\n{interview_text}"
+
+    return [
+        {"role": "system", "text": system_prompt},
+        {"role": "user", "text": user_prompt},
+    ]
+
+
+def _expected_question_ids(media_obj):
+    version = get_template_version(media_obj)
+    if not version:
+        return []
+    return [q["id"] for q in version.questions]
+
+
+def _store_answers(media_obj, answers):
+    # Строки для аналитики вторичны: их сбой не должен останавливать обработку
+    try:
+        store_task_answers(media_obj, answers)
+    except Exception as e:
+        print(f"⚠️ Не удалось сохранить ответы MediaTask #{media_obj.id} для аналитики: {e}")
+
+
+def _finish_gpt_result(media_obj, gpt_json):
+    if not gpt_json:
+        print(f"❌ Не удалось извлечь ответы для MediaTask #{media_obj.id}")
+        media_obj.gpt_result = None
+        media_obj.status = MediaTaskStatusChoices.FAILED
+        media_obj.save(update_fields=["gpt_raw_response", "gpt_result", "status"])
+        _store_answers(media_obj, {})
+        return
+
+    media_obj.gpt_result = json.dumps(gpt_json, ensure_ascii=False, indent=2)
+    media_obj.status = MediaTaskStatusChoices.DATA_EXTRACTION_SUCCESS
+    media_obj.save(update_fields=["gpt_raw_response", "gpt_result", "status"])
+
+    # --- OutboxEvent ---
+    OutboxEvent.objects.create(
+        media_task=media_obj,
+        event_type=EventTypeChoices.GPT_RESULT_READY,
+        payload={"media_task_id": media_obj.id},
+    )
+    _store_answers(media_obj, gpt_json)
+
+
+def save_gpt_result(media_obj, gpt_raw_text, allow_reask=True):
+    """
+    Извлекает ответы из текста модели и сохраняет их в MediaTask.
+
+    Если часть вопросов осталась без ответа и переспрос разрешён, частичный
+    результат сохраняется, а функция возвращает список id вопросов, которые
+    нужно переспросить. Иначе результат финализируется: GPT_RESULT_READY
+    при наличии ответов, статус FAILED — если извлечь ничего не удалось.
+    """
+    print(f"=== 📝 Ответ GPT ===\n{gpt_raw_text}")
+
+    answers, missing_ids = extract_answers(gpt_raw_text, _expected_question_ids(media_obj))
+    print(f"✅ Распознано ответов: {len(answers)}, без ответа: {len(missing_ids)}")
+
+    media_obj.gpt_raw_response = gpt_raw_text
+    if missing_ids and allow_reask:
+        media_obj.gpt_result = json.dumps(answers, ensure_ascii=False, indent=2) if answers else None
+        media_obj.save(update_fields=["gpt_raw_response", "gpt_result"])
+        print(f"🔁 Нужен переспрос по вопросам: {', '.join(missing_ids)}")
+        return missing_ids
+
+    _finish_gpt_result(media_obj, answers)
+    return []
+
+
+def merge_gpt_reask_result(media_obj, gpt_raw_text, question_ids):
+    """
+    Дополняет сохранённый частичный результат ответами переспроса
+    и финализирует его.
+    """
+    print(f"=== 📝 Ответ GPT на переспрос ===\n{gpt_raw_text}")
+
+    answers = json.loads(media_obj.gpt_result) if media_obj.gpt_result else {}
+    reask_answers, missing_ids = extract_answers(gpt_raw_text, question_ids)
+    answers.update({qid: value for qid, value in reask_answers.items() if qid in question_ids})
+
+    # --- Возвращаем порядок вопросов шаблона ---
+    expected_ids = _expected_question_ids(media_obj)
+    ordered = {qid: answers[qid] for qid in expected_ids if qid in answers}
+    ordered.update({qid: value for qid, value in answers.items() if qid not in ordered})
+    if missing_ids:
+        print(f"⚠️ После переспроса без ответа: {', '.join(missing_ids)}")
+
+    media_obj.gpt_raw_response = f"{media_obj.gpt_raw_response or ''}\n\n--- reask ---\n{gpt_raw_text}"
+    _finish_gpt_result(media_obj, ordered)
+
+
+def finish_partial_gpt_result(media_obj):
+    """
+    Финализирует сохранённый частичный результат, если переспрос не удался:
+    по уже полученным ответам формируется отчёт, а без них задача получает FAILED.
+    """
+    media_obj.refresh_from_db()
+    if media_obj.status in (MediaTaskStatusChoices.DATA_EXTRACTION_SUCCESS, MediaTaskStatusChoices.FAILED):
+        return
+    answers = json.loads(media_obj.gpt_result) if media_obj.gpt_result else {}
+    print(f"⚠️ MediaTask #{media_obj.id}: завершаем с частичным результатом ({len(answers)} ответов)")
+    _finish_gpt_result(media_obj, answers)
+
+
+def batch_request_line(messages):
+    """
+    Строка датасета TextToTextGenerationRequest для пакетной обработки.
+    """
+    return json.dumps({"request": messages}, ensure_ascii=False)
+
+
+def _batch_record_response(record):
+    response = record.get("response")
+    if isinstance(response, str):
+        try:
+            response = json.loads(response)
+        except json.JSONDecodeError:
+            return response
+    if isinstance(response, list):
+        response = response[0] if response else {}
+    return response
+
+
+def batch_record_text(record):
+    """
+    Достаёт текст ответа модели из строки результирующего датасета batch.
+    """
+    response = _batch_record_response(record)
+    if isinstance(response, str):
+        return response
+    if not isinstance(response, dict):
+        return None
+
+    alternatives = response.get("alternatives") or []
+    if alternatives:
+        message = alternatives[0].get("message") or {}
+        return message.get("text")
+    return response.get("text")
+
+
+def batch_record_usage(record):
+    """
+    Пара (входные, выходные) токены из строки результата batch, если она есть.
+    """
+    response = _batch_record_response(record)
+    if not isinstance(response, dict):
+        return None
+    usage = response.get("usage") or {}
+    input_tokens = usage.get("inputTextTokens", usage.get("input_text_tokens"))
+    output_tokens = usage.get("completionTokens", usage.get("completion_tokens"))
+    if input_tokens is None and output_tokens is None:
+        return None
+    return int(input_tokens or 0), int(output_tokens or 0)
+
+
+def batch_request_key(messages):
+    """
+    Ключ запроса batch: роли и тексты всех сообщений (промт шаблона
+    и интервью). По нему строка результата сопоставляется с MediaTask.
+    """
+    return tuple((m.get("role"), m.get("text")) for m in messages if isinstance(m, dict))
+
+
+def batch_record_request_key(record):
+    """
+    Ключ запроса (см. batch_request_key) из строки результата batch.
+    """
+    request = record.get("request")
+    if isinstance(request, str):
+        try:
+            request = json.loads(request)
+        except json.JSONDecodeError:
+            return None
+    if isinstance(request, dict):
+        request = request.get("messages") or request.get("request")
+    if not isinstance(request, list):
+        return None
+    return batch_request_key(request)
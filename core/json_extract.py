@@ -0,0 +1,197 @@
+"""
+Устойчивое извлечение JSON с ответами из текста модели.
+
+Модель может обернуть JSON в ```json ... ```, добавить пояснения до и после,
+оставить висячие запятые или назвать ключи "Вопрос 1" вместо "1".
+Извлечение выполняется за один проход по тексту без повторных запросов.
+"""
+import json
+import re
+
+
+FENCE_RE = re.compile(r"```[a-zA-Z0-9_-]*[ \t]*\n?(.*?)```", re.DOTALL)
+KEY_NUMBER_RE = re.compile(r"\d+")
+
+
+def strip_fences(text):
+    """
+    Возвращает содержимое первого блока ```lang ... ```, если он есть.
+    """
+    match = FENCE_RE.search(text)
+    if match:
+        return match.group(1)
+    return text
+
+
+def _remove_trailing_commas(candidate):
+    """
+    Убирает запятые перед } и ] вне строковых литералов.
+    """
+    result = []
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(candidate):
+        if in_string:
+            result.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch == ",":
+            rest = candidate[i + 1:].lstrip()
+            if rest[:1] in ("}", "]"):
+                continue
+        result.append(ch)
+    return "".join(result)
+
+
+# Сколько раз повторить проход после незакрытой скобки (см. _balanced_candidates)
+MAX_RESCANS = 4
+
+
+def _scan_balanced(text, offset, unclosed):
+    """
+    Один проход по text с позиции offset со стеком открытых скобок.
+    Выдаёт сбалансированные спаны верхнего уровня; если внешняя скобка
+    так и не закрылась (или закрылась не той) — вложенные в неё спаны.
+    Позиции брошенных внешних скобок добавляются в unclosed.
+    """
+    pairs = {"{": "}", "[": "]"}
+    # Кадр стека: [закрывающая скобка, начало, закрытые вложенные спаны]
+    stack = []
+    in_string = False
+    escaped = False
+
+    def orphans():
+        unclosed.append(stack[0][1])
+        spans = [span for frame in stack for span in frame[2]]
+        stack.clear()
+        return spans
+
+    for i in range(offset, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            # Кавычки вне скобок — обычный текст ответа
+            in_string = bool(stack)
+        elif ch in pairs:
+            stack.append([pairs[ch], i, []])
+        elif ch in ("}", "]") and stack:
+            if stack[-1][0] != ch:
+                yield from orphans()
+                continue
+            _, start, _ = stack.pop()
+            span = text[start:i + 1]
+            if stack:
+                stack[-1][2].append(span)
+            else:
+                yield span
+    if stack:
+        yield from orphans()
+
+
+def _balanced_candidates(text):
+    """
+    Подстроки text от { или [ до парной скобки (с учётом строк
+    и экранирования). Проход линейный; если скобка в прозе ("{" в кавычках,
+    смайлик) сбила разбор, проход повторяется с позиции сразу за ней —
+    не больше MAX_RESCANS раз.
+    """
+    offset = 0
+    for _ in range(MAX_RESCANS + 1):
+        unclosed = []
+        yield from _scan_balanced(text, offset, unclosed)
+        if not unclosed:
+            return
+        offset = unclosed[0] + 1
+
+
+def _loads(candidate):
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(_remove_trailing_commas(candidate))
+    except json.JSONDecodeError:
+        return None
+
+
+def find_json(text):
+    """
+    Первый JSON-объект или массив в тексте модели, либо None.
+    """
+    if not text:
+        return None
+    for source in (strip_fences(text), text):
+        parsed = _loads(source.strip())
+        if parsed is not None:
+            return parsed
+        for candidate in _balanced_candidates(source):
+            parsed = _loads(candidate)
+            if isinstance(parsed, (dict, list)):
+                return parsed
+    return None
+
+
+def normalize_key(key, expected_ids=None):
+    """
+    Приводит ключ вида "Вопрос 1", "1.", "q1" к id вопроса "1".
+    """
+    key = str(key).strip()
+    if expected_ids and key in expected_ids:
+        return key
+    match = KEY_NUMBER_RE.search(key)
+    if match:
+        return str(int(match.group(0)))
+    return key
+
+
+def _as_answer_dict(parsed, expected_ids):
+    if isinstance(parsed, list):
+        # [{"id": 1, "answer": "..."}, ...]
+        answers = {}
+        for item in parsed:
+            if not isinstance(item, dict):
+                continue
+            qid = item.get("id", item.get("question_id", item.get("номер")))
+            if qid is None:
+                continue
+            answers[qid] = item.get("answer", item.get("ответ", item.get("text")))
+        return answers
+
+    if isinstance(parsed, dict) and len(parsed) == 1:
+        # {"answers": {...}} — разворачиваем обёртку
+        (only_key, only_value), = parsed.items()
+        if isinstance(only_value, (dict, list)) and normalize_key(only_key, expected_ids) not in (expected_ids or ()):
+            return _as_answer_dict(only_value, expected_ids)
+
+    return parsed if isinstance(parsed, dict) else {}
+
+
+def extract_answers(text, expected_ids=None):
+    """
+    Возвращает (answers, missing_ids): словарь {id вопроса: ответ}
+    с нормализованными ключами и список id, на которые ответа нет.
+    """
+    expected_ids = [str(qid) for qid in (expected_ids or [])]
+    parsed = find_json(text)
+    answers = {}
+    for key, value in _as_answer_dict(parsed, expected_ids).items():
+        answers[normalize_key(key, expected_ids)] = value
+
+    missing_ids = [qid for qid in expected_ids if qid not in answers]
+    return answers, missing_ids
@@ -0,0 +1,259 @@
+"""
+Провайдеры LLM и маршрутизатор между ними.
+
+Маршрутизатор держит скользящую статистику задержек и ошибок по каждому
+провайдеру в рамках процесса воркера, отправляет запрос самому быстрому
+здоровому провайдеру и переключается на следующий при таймаутах и 5xx.
+"""
+import json
+import re
+import threading
+import time
+from collections import deque
+
+import grpc
+import openai
+from django.conf import settings
+
+from core.clients import get_caila_client, registry
+from core.gpt import get_completions_model, get_sdk
+
+
+class LLMError(Exception):
+    """Ошибка провайдера, при которой нет смысла повторять запрос в другом месте."""
+
+
+class LLMRetryableError(LLMError):
+    """Таймаут, недоступность или 5xx — запрос можно отдать другому провайдеру."""
+
+
+class LLMResponse:
+    def __init__(self, text, provider, unit_price, input_tokens=0, output_tokens=0):
+        self.text = text
+        self.provider = provider
+        self.unit_price = unit_price
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+
+class BaseLLMProvider:
+    name = None
+
+    @property
+    def unit_price(self):
+        """Цена за 1000 токенов."""
+        raise NotImplementedError
+
+    def complete(self, messages, timeout):
+        """
+        Выполняет запрос. messages — список {"role": ..., "text": ...}.
+        """
+        raise NotImplementedError
+
+
+class YandexGPTProvider(BaseLLMProvider):
+    name = "yandexgpt"
+
+    RETRYABLE_CODES = {
+        grpc.StatusCode.DEADLINE_EXCEEDED,
+        grpc.StatusCode.UNAVAILABLE,
+        grpc.StatusCode.INTERNAL,
+        grpc.StatusCode.RESOURCE_EXHAUSTED,
+    }
+
+    @property
+    def unit_price(self):
+        return settings.YANDEX_GPT_PRICE_PER_1K_TOKENS
+
+    def complete(self, messages, timeout):
+        model = get_completions_model(get_sdk())
+        try:
+            result = model.run(messages, timeout=timeout)
+        except grpc.RpcError as e:
+            if e.code() in self.RETRYABLE_CODES:
+                if e.code() == grpc.StatusCode.UNAVAILABLE:
+                    registry.reset("yandexgpt")
+                raise LLMRetryableError(f"YandexGPT: {e.code().name}") from e
+            raise LLMError(f"YandexGPT: {e}") from e
+        except TimeoutError as e:
+            raise LLMRetryableError("YandexGPT: таймаут") from e
+
+        usage = getattr(result, "usage", None)
+        return LLMResponse(
+            text=result[0].text if result else "{}",
+            provider=self.name,
+            unit_price=self.unit_price,
+            input_tokens=usage.input_text_tokens if usage else 0,
+            output_tokens=usage.completion_tokens if usage else 0,
+        )
+
+
+class CailaGigaChatProvider(BaseLLMProvider):
+    """
+    GigaChat через OpenAI-совместимый адаптер Caila.
+    """
+    name = "caila"
+
+    @property
+    def unit_price(self):
+        return settings.CAILA_PRICE_PER_1K_TOKENS
+
+    def complete(self, messages, timeout):
+        if not settings.CAILA_API_KEY:
+            raise LLMError("Caila: не задан CAILA_API_KEY")
+
+        client = get_caila_client().with_options(timeout=timeout)
+        try:
+            completion = client.chat.completions.create(
+                model=settings.CAILA_MODEL,
+                messages=[{"role": m["role"], "content": m["text"]} for m in messages],
+            )
+        except (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError) as e:
+            if isinstance(e, openai.APIConnectionError):
+                registry.reset("caila")
+            raise LLMRetryableError(f"Caila: {e}") from e
+        except openai.APIStatusError as e:
+            if e.status_code >= 500:
+                raise LLMRetryableError(f"Caila: HTTP {e.status_code}") from e
+            raise LLMError(f"Caila: HTTP {e.status_code}") from e
+
+        usage = getattr(completion, "usage", None)
+        return LLMResponse(
+            text=completion.choices[0].message.content or "{}",
+            provider=self.name,
+            unit_price=self.unit_price,
+            input_tokens=usage.prompt_tokens if usage else 0,
+            output_tokens=usage.completion_tokens if usage else 0,
+        )
+
+
+class FakeLLMProvider(BaseLLMProvider):
+    """
+    Локальная заглушка для разработки: отвечает JSON с пустыми ответами
+    на все вопросы из system prompt, ничего не отправляя наружу.
+    """
+    name = "fake"
+    unit_price = "0"
+
+    QUESTION_RE = re.compile(r"^(\d+)\.\s", re.MULTILINE)
+
+    def complete(self, messages, timeout):
+        if settings.LLM_FAKE_LATENCY:
+            time.sleep(settings.LLM_FAKE_LATENCY)
+        system_text = next((m["text"] for m in messages if m["role"] == "system"), "")
+        answers = {qid: "Нет данных" for qid in self.QUESTION_RE.findall(system_text)}
+        return LLMResponse(
+            text=json.dumps(answers, ensure_ascii=False),
+            provider=self.name,
+            unit_price=self.unit_price,
+        )
+
+
+PROVIDER_CLASSES = {
+    YandexGPTProvider.name: YandexGPTProvider,
+    CailaGigaChatProvider.name: CailaGigaChatProvider,
+    FakeLLMProvider.name: FakeLLMProvider,
+}
+
+
+class ProviderStats:
+    """
+    Скользящее окно последних вызовов провайдера: (задержка, успех).
+    """
+
+    def __init__(self, window):
+        self.calls = deque(maxlen=window)
+        self.cooldown_until = 0.0
+
+    def add(self, latency, ok):
+        self.calls.append((latency, ok))
+
+    def end_cooldown(self, now):
+        """
+        По истечении паузы окно очищается: ошибки, из-за которых провайдер
+        был отключён, больше не учитываются, и следующий вызов становится
+        пробным. Новая ошибка снова отправит провайдера на паузу.
+        """
+        if self.cooldown_until and now >= self.cooldown_until:
+            self.calls.clear()
+            self.cooldown_until = 0.0
+
+    @property
+    def avg_latency(self):
+        latencies = [latency for latency, ok in self.calls if ok]
+        if not latencies:
+            return 0.0
+        return sum(latencies) / len(latencies)
+
+    @property
+    def error_rate(self):
+        if not self.calls:
+            return 0.0
+        return sum(1 for _, ok in self.calls if not ok) / len(self.calls)
+
+
+class LLMRouter:
+    def __init__(self, providers, window=20, max_error_rate=0.5, cooldown=60):
+        self.providers = providers
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self._stats = {p.name: ProviderStats(window) for p in providers}
+        self._lock = threading.Lock()
+
+    def is_healthy(self, provider):
+        stats = self._stats[provider.name]
+        now = time.monotonic()
+        stats.end_cooldown(now)
+        return now >= stats.cooldown_until and stats.error_rate <= self.max_error_rate
+
+    def ordered_providers(self):
+        """
+        Здоровые провайдеры по возрастанию средней задержки,
+        остальные — в конце как последний шанс.
+        """
+        with self._lock:
+            healthy = [p for p in self.providers if self.is_healthy(p)]
+            unhealthy = [p for p in self.providers if not self.is_healthy(p)]
+            healthy.sort(key=lambda p: self._stats[p.name].avg_latency)
+            unhealthy.sort(key=lambda p: self._stats[p.name].error_rate)
+        return healthy + unhealthy
+
+    def _record(self, provider, latency, ok):
+        with self._lock:
+            stats = self._stats[provider.name]
+            stats.add(latency, ok)
+            if not ok and stats.error_rate > self.max_error_rate:
+                stats.cooldown_until = time.monotonic() + self.cooldown
+
+    def complete(self, messages, timeout=None):
+        timeout = timeout or settings.LLM_TIMEOUT
+        errors = []
+        for provider in self.ordered_providers():
+            started = time.monotonic()
+            try:
+                print(f"🤖 Отправляем запрос провайдеру {provider.name}...")
+                response = provider.complete(messages, timeout)
+            except LLMRetryableError as e:
+                self._record(provider, time.monotonic() - started, ok=False)
+                print(f"⚠️ Провайдер {provider.name} недоступен, переключаемся: {e}")
+                errors.append(str(e))
+                continue
+            self._record(provider, time.monotonic() - started, ok=True)
+            return response
+
+        raise LLMError(f"Все LLM-провайдеры недоступны: {'; '.join(errors)}")
+
+
+_router = None
+
+
+def get_llm_router():
+    global _router
+    if _router is None:
+        _router = LLMRouter(
+            [PROVIDER_CLASSES[name]() for name in settings.LLM_PROVIDERS],
+            window=settings.LLM_ROUTER_WINDOW,
+            max_error_rate=settings.LLM_ROUTER_MAX_ERROR_RATE,
+            cooldown=settings.LLM_ROUTER_COOLDOWN,
+        )
+    return _router
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import MediaTask
+from core.tasks import gpt_batch_task, gpt_task
+
+
+class Command(BaseCommand):
+    help = "Повторное извлечение данных через YandexGPT для набора MediaTask."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--project", type=int, help="ID проекта, все задачи которого нужно переобработать")
+        parser.add_argument("--ids", type=int, nargs="+", help="ID конкретных MediaTask")
+        parser.add_argument(
+            "--batch",
+            action="store_true",
+            help="Отправить все транскрипты одной batch-задачей вместо отдельных запросов",
+        )
+
+    def handle(self, *args, **options):
+        queryset = MediaTask.objects.filter(cast_template__isnull=False)
+        if options["project"]:
+            queryset = queryset.filter(project_id=options["project"])
+        if options["ids"]:
+            queryset = queryset.filter(id__in=options["ids"])
+        if not options["project"] and not options["ids"]:
+            raise CommandError("Укажите --project или --ids")
+
+        media_task_ids = list(queryset.values_list("id", flat=True))
+        if not media_task_ids:
+            self.stdout.write("Нет задач для переобработки")
+            return
+
+        if options["batch"]:
+            gpt_batch_task.delay(media_task_ids)
+            self.stdout.write(f"📦 Batch-задача поставлена в очередь: {len(media_task_ids)} MediaTask")
+        else:
+            for media_task_id in media_task_ids:
+                gpt_task.delay(media_task_id)
+            self.stdout.write(f"🤖 Поставлено в очередь gpt_task: {len(media_task_ids)} шт.")
@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.answers import store_task_answers
+from core.gpt import get_template_version
+from core.models import MediaTask
+
+
+class Command(BaseCommand):
+    help = "Пересобирает MediaTaskAnswer из gpt_result для уже обработанных задач."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--project", type=int, help="ID проекта; по умолчанию — все проекты")
+
+    def handle(self, *args, **options):
+        queryset = (
+            MediaTask.objects
+            .filter(gpt_result__isnull=False)
+            .select_related("cast_template", "template_version__template")
+            .order_by("id")
+        )
+        if options["project"]:
+            queryset = queryset.filter(project_id=options["project"])
+
+        tasks_count = 0
+        answers_count = 0
+        for media_obj in queryset.iterator(chunk_size=500):
+            try:
+                answers = json.loads(media_obj.gpt_result)
+            except json.JSONDecodeError:
+                self.stdout.write(f"⚠️ MediaTask #{media_obj.id}: gpt_result не JSON, пропускаем")
+                continue
+            get_template_version(media_obj)
+            answers_count += store_task_answers(media_obj, answers)
+            tasks_count += 1
+
+        self.stdout.write(f"✅ Пересобрано ответов: {answers_count} в {tasks_count} задачах")
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_mediatask_audio_local_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediatask',
+            name='gpt_batch_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True, verbose_name='ID batch-задачи GPT'),
+        ),
+        migrations.AddField(
+            model_name='mediatask',
+            name='gpt_operation_id',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='ID отложенной операции GPT'),
+        ),
+    ]
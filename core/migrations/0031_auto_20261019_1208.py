@@ -0,0 +1,49 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_auto_20261019_1208'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(choices=[('transcription', 'Транскрибация'), ('data_extraction', 'Извлечение данных')], max_length=32, verbose_name='Этап')),
+                ('provider', models.CharField(max_length=64, verbose_name='Провайдер')),
+                ('input_tokens', models.PositiveIntegerField(default=0, verbose_name='Входные токены')),
+                ('output_tokens', models.PositiveIntegerField(default=0, verbose_name='Выходные токены')),
+                ('audio_seconds', models.FloatField(default=0, verbose_name='Секунды аудио')),
+                ('unit_price', models.DecimalField(decimal_places=4, help_text='За 1000 токенов для LLM или за минуту аудио для транскрибации', max_digits=10, verbose_name='Цена за единицу')),
+                ('cost', models.DecimalField(decimal_places=4, max_digits=12, verbose_name='Стоимость')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Когда записано')),
+                ('cast_template', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='usage_records', to='core.casttemplate', verbose_name='Шаблон обработки')),
+                ('integration', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='usage_records', to='core.integration', verbose_name='Интеграция')),
+                ('media_task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_records', to='core.mediatask', verbose_name='Задача')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='usage_records', to='core.project', verbose_name='Проект')),
+            ],
+            options={
+                'verbose_name': 'Запись потребления',
+                'verbose_name_plural': 'Записи потребления',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='usagerecord',
+            index=models.Index(fields=['project', 'created_at'], name='core_usager_project_ea0345_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usagerecord',
+            index=models.Index(fields=['integration', 'created_at'], name='core_usager_integra_1ef258_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usagerecord',
+            index=models.Index(fields=['cast_template', 'created_at'], name='core_usager_cast_te_60c8d6_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_auto_20261019_1208'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='casttemplate',
+            name='compiled_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True, verbose_name='Хеш скомпилированного промта'),
+        ),
+        migrations.AddField(
+            model_name='casttemplate',
+            name='compiled_prompt',
+            field=models.TextField(blank=True, null=True, verbose_name='Итоговый system prompt'),
+        ),
+        migrations.AddField(
+            model_name='casttemplate',
+            name='compiled_questions',
+            field=models.JSONField(blank=True, help_text='Список объектов {id, text} в порядке шаблона.', null=True, verbose_name='Нормализованный список вопросов'),
+        ),
+        migrations.AddField(
+            model_name='casttemplate',
+            name='compiled_token_count',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Количество токенов в system prompt'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_auto_20261019_1212'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CastTemplateVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='Хеш содержимого')),
+                ('promt', models.TextField(blank=True, null=True, verbose_name='Промт')),
+                ('questions', models.JSONField(default=list, verbose_name='Нормализованный список вопросов')),
+                ('prompt', models.TextField(blank=True, null=True, verbose_name='Итоговый system prompt')),
+                ('prompt_hash', models.CharField(blank=True, max_length=64, null=True, verbose_name='Хеш скомпилированного промта')),
+                ('token_count', models.PositiveIntegerField(blank=True, null=True, verbose_name='Количество токенов в system prompt')),
+                ('excel_file', models.CharField(blank=True, max_length=255, null=True, verbose_name='Файл Excel-шаблона в хранилище')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Когда версия создана')),
+                ('template', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='core.casttemplate', verbose_name='Шаблон')),
+            ],
+            options={
+                'verbose_name': 'Версия шаблона',
+                'verbose_name_plural': 'Версии шаблонов',
+                'unique_together': {('template', 'content_hash')},
+            },
+        ),
+        migrations.AddField(
+            model_name='casttemplate',
+            name='current_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.casttemplateversion', verbose_name='Текущая версия шаблона'),
+        ),
+        migrations.AddField(
+            model_name='mediatask',
+            name='template_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='media_tasks', to='core.casttemplateversion', verbose_name='Версия шаблона'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_auto_20261019_1213'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='casttemplate',
+            name='excel_cell_map',
+            field=models.JSONField(blank=True, help_text='Словарь {id вопроса: адрес ячейки для ответа}, строится при загрузке Excel.', null=True, verbose_name='Карта ячеек ответов'),
+        ),
+        migrations.AddField(
+            model_name='casttemplateversion',
+            name='cell_map',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Карта ячеек ответов'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_auto_20261019_1216'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectExport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('export_format', models.CharField(choices=[('xlsx', 'Excel'), ('csv', 'CSV')], default='xlsx', max_length=8, verbose_name='Формат')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('processing', 'Формируется'), ('ready', 'Готов'), ('failed', 'Ошибка')], default='pending', max_length=16, verbose_name='Статус')),
+                ('storage_url', models.CharField(blank=True, max_length=500, null=True, verbose_name='Путь к отчёту в хранилище')),
+                ('rows_count', models.PositiveIntegerField(default=0, verbose_name='Количество строк')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Текст ошибки')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Когда запрошен')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Когда сформирован')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exports', to='core.project', verbose_name='Проект')),
+            ],
+            options={
+                'verbose_name': 'Выгрузка проекта',
+                'verbose_name_plural': 'Выгрузки проектов',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
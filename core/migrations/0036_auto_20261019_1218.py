@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_projectexport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectexport',
+            name='kind',
+            field=models.CharField(choices=[('report', 'Сводный отчёт'), ('answer_matrix', 'Матрица ответов')], default='report', max_length=16, verbose_name='Вид выгрузки'),
+        ),
+        migrations.AlterField(
+            model_name='projectexport',
+            name='export_format',
+            field=models.CharField(choices=[('xlsx', 'Excel'), ('csv', 'CSV'), ('parquet', 'Parquet')], default='xlsx', max_length=8, verbose_name='Формат'),
+        ),
+        migrations.CreateModel(
+            name='MediaTaskAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question_id', models.CharField(max_length=16, verbose_name='ID вопроса')),
+                ('answer', models.TextField(blank=True, default='', verbose_name='Ответ')),
+                ('answer_number', models.FloatField(blank=True, null=True, verbose_name='Числовое значение ответа')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Когда обновлён')),
+                ('media_task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='core.mediatask', verbose_name='Задача')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='answers', to='core.project', verbose_name='Проект')),
+                ('template_version', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='answers', to='core.casttemplateversion', verbose_name='Версия шаблона')),
+            ],
+            options={
+                'verbose_name': 'Ответ задачи',
+                'verbose_name_plural': 'Ответы задач',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='mediataskanswer',
+            index=models.Index(fields=['project', 'media_task'], name='core_mediat_project_0e405c_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='mediataskanswer',
+            unique_together={('media_task', 'question_id')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_auto_20261019_1218'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='integrationsettings',
+            name='excel_mode',
+            field=models.CharField(choices=[('eager', 'Сразу после обработки'), ('lazy', 'При первом скачивании')], default='eager', max_length=10, verbose_name='Формирование Excel-отчёта'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0037_integrationsettings_excel_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='casttemplate',
+            name='parse_status',
+            field=models.CharField(choices=[('pending', 'Вопросы извлекаются'), ('ready', 'Вопросы извлечены'), ('failed', 'Ошибка разбора Excel')], default='ready', max_length=16, verbose_name='Статус разбора Excel'),
+        ),
+    ]
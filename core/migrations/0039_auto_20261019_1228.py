@@ -0,0 +1,47 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0038_casttemplate_parse_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_name', models.CharField(blank=True, default='', max_length=255, verbose_name='Исходное имя файла')),
+                ('saved_name', models.CharField(blank=True, default='', max_length=255, verbose_name='Имя сохранённого файла')),
+                ('key', models.CharField(max_length=500, verbose_name='Ключ объекта в хранилище')),
+                ('upload_id', models.CharField(max_length=255, unique=True, verbose_name='UploadId')),
+                ('total_size', models.BigIntegerField(blank=True, null=True, verbose_name='Размер файла, байт')),
+                ('part_size', models.PositiveIntegerField(blank=True, null=True, verbose_name='Размер части, байт')),
+                ('parts', models.JSONField(blank=True, default=dict, help_text='{"номер части": {"ETag": "...", "Size": байт}}', verbose_name='Подтверждённые части')),
+                ('status', models.CharField(choices=[('active', 'Загружается'), ('completed', 'Завершена'), ('aborted', 'Отменена')], default='active', max_length=16, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Когда начата')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Когда обновлена')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_sessions', to='core.project', verbose_name='Проект')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Сессия загрузки',
+                'verbose_name_plural': 'Сессии загрузки',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='uploadsession',
+            index=models.Index(fields=['status', 'updated_at'], name='core_upload_status_f56ba6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadsession',
+            index=models.Index(fields=['key', 'status'], name='core_upload_key_4e133f_idx'),
+        ),
+    ]
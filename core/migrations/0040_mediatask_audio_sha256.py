@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0039_auto_20261019_1228'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediatask',
+            name='audio_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True, verbose_name='SHA-256 загруженного аудио'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:35
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0040_mediatask_audio_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('key', models.CharField(max_length=500, verbose_name='Ключ объекта в хранилище')),
+                ('size', models.BigIntegerField(verbose_name='Размер, байт')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='Число ссылающихся задач')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Когда загружен')),
+            ],
+            options={
+                'verbose_name': 'Файл в хранилище',
+                'verbose_name_plural': 'Файлы в хранилище',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0041_storedblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediatask',
+            name='audio_channels',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Число каналов аудио'),
+        ),
+        migrations.AddField(
+            model_name='mediatask',
+            name='audio_sample_rate',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Частота дискретизации аудио (Гц)'),
+        ),
+    ]
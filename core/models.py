@@ -1,3 +1,6 @@
+import hashlib
+import json
+
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils import timezone
@@ -27,6 +30,11 @@ class UploadChoices(models.TextChoices):
     PARTS = "parts", "Parts"
 
 
+class ExcelModeChoices(models.TextChoices):
+    EAGER = "eager", "Сразу после обработки"
+    LAZY = "lazy", "При первом скачивании"
+
+
 class IntegrationSettings(models.Model):
     integration = models.OneToOneField(  # ✅ ВАЖНО
         Integration,
@@ -39,6 +47,12 @@ class IntegrationSettings(models.Model):
         default=UploadChoices.FULL,
         verbose_name="Режим загрузки"
     )
+    excel_mode = models.CharField(
+        max_length=10,
+        choices=ExcelModeChoices.choices,
+        default=ExcelModeChoices.EAGER,
+        verbose_name="Формирование Excel-отчёта"
+    )
 
     def __str__(self):
         return f"Настройки для {self.integration}"
@@ -77,6 +91,12 @@ class TemplateTypeChoices(models.TextChoices):
     CUSTOM = "custom", "Custom"
 
 
+class TemplateParseStatusChoices(models.TextChoices):
+    PENDING = "pending", "Вопросы извлекаются"
+    READY = "ready", "Вопросы извлечены"
+    FAILED = "failed", "Ошибка разбора Excel"
+
+
 class CastTemplate(models.Model):
     """
     Шаблон для обработки кастдева или транскрипта.
@@ -120,6 +140,18 @@ class CastTemplate(models.Model):
         blank=True,
         verbose_name="Вопросы (JSON)"
     )
+    excel_cell_map = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name="Карта ячеек ответов",
+        help_text="Словарь {id вопроса: адрес ячейки для ответа}, строится при загрузке Excel."
+    )
+    parse_status = models.CharField(
+        max_length=16,
+        choices=TemplateParseStatusChoices.choices,
+        default=TemplateParseStatusChoices.READY,
+        verbose_name="Статус разбора Excel"
+    )
     template_type = models.CharField(
         max_length=20,
         choices=TemplateTypeChoices.choices,
@@ -141,11 +173,190 @@ class CastTemplate(models.Model):
         null=True,
         help_text="Промт"
     )
+    # === Скомпилированный промт (собирается при сохранении) ===
+    compiled_questions = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name="Нормализованный список вопросов",
+        help_text="Список объектов {id, text} в порядке шаблона."
+    )
+    compiled_prompt = models.TextField(
+        null=True,
+        blank=True,
+        verbose_name="Итоговый system prompt"
+    )
+    compiled_hash = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        db_index=True,
+        verbose_name="Хеш скомпилированного промта"
+    )
+    compiled_token_count = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Количество токенов в system prompt"
+    )
+    current_version = models.ForeignKey(
+        "CastTemplateVersion",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="Текущая версия шаблона"
+    )
 
+    COMPILED_FIELDS = ["compiled_questions", "compiled_prompt", "compiled_hash", "compiled_token_count"]
 
     def __str__(self):
         return f"Шаблон (ID {self.id})"
 
+    def compile_prompt(self):
+        """
+        Нормализует вопросы (поле questions может быть dict или str),
+        собирает итоговый system prompt и считает его хеш.
+        Количество токенов сбрасывается, если промт изменился.
+        """
+        questions = self.questions
+        if isinstance(questions, str):
+            try:
+                questions = json.loads(questions)
+            except json.JSONDecodeError:
+                print("⚠️ Ошибка парсинга JSON с вопросами, используем пустой список")
+                questions = {}
+        if not isinstance(questions, dict):
+            questions = {}
+
+        compiled_questions = [{"id": str(qid), "text": str(qtext)} for qid, qtext in questions.items()]
+        questions_text = "\n".join(f"{q['id']}. {q['text']}" for q in compiled_questions)
+        compiled_prompt = (self.promt or "") + questions_text
+
+        digest = hashlib.sha256()
+        digest.update(compiled_prompt.encode("utf-8"))
+        digest.update(json.dumps(compiled_questions, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+        compiled_hash = digest.hexdigest()
+
+        if compiled_hash != self.compiled_hash:
+            self.compiled_token_count = None
+        self.compiled_questions = compiled_questions
+        self.compiled_prompt = compiled_prompt
+        self.compiled_hash = compiled_hash
+
+    def version_hash(self):
+        """
+        Хеш содержимого версии: скомпилированный промт, файл Excel-шаблона
+        и карта ячеек ответов.
+        """
+        digest = hashlib.sha256()
+        digest.update((self.compiled_hash or "").encode("utf-8"))
+        digest.update((self.excel_file.name or "").encode("utf-8"))
+        if self.excel_cell_map:
+            digest.update(json.dumps(self.excel_cell_map, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.compile_prompt()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | set(self.COMPILED_FIELDS)
+        super().save(*args, **kwargs)
+        self.snapshot_version()
+
+    def snapshot_version(self):
+        """
+        Фиксирует неизменяемый снимок текущего содержимого шаблона.
+        Повторное сохранение без изменений возвращает существующую версию.
+        """
+        version, created = CastTemplateVersion.objects.get_or_create(
+            template=self,
+            content_hash=self.version_hash(),
+            defaults={
+                "promt": self.promt,
+                "questions": self.compiled_questions,
+                "prompt": self.compiled_prompt,
+                "prompt_hash": self.compiled_hash,
+                "token_count": self.compiled_token_count,
+                "excel_file": self.excel_file.name or None,
+                "cell_map": self.excel_cell_map or {},
+            },
+        )
+        if created:
+            print(f"📌 Создана версия {version.content_hash[:12]} шаблона #{self.id}")
+        if self.current_version_id != version.id:
+            CastTemplate.objects.filter(pk=self.pk).update(current_version=version)
+            self.current_version = version
+        return version
+
+
+class CastTemplateVersion(models.Model):
+    """
+    Неизменяемый снимок CastTemplate, на который ссылаются задачи.
+    Идентифицируется хешем содержимого в пределах шаблона.
+    """
+    template = models.ForeignKey(
+        CastTemplate,
+        on_delete=models.CASCADE,
+        related_name="versions",
+        verbose_name="Шаблон"
+    )
+    content_hash = models.CharField(
+        max_length=64,
+        verbose_name="Хеш содержимого"
+    )
+    promt = models.TextField(
+        null=True,
+        blank=True,
+        verbose_name="Промт"
+    )
+    questions = models.JSONField(
+        default=list,
+        verbose_name="Нормализованный список вопросов"
+    )
+    prompt = models.TextField(
+        null=True,
+        blank=True,
+        verbose_name="Итоговый system prompt"
+    )
+    prompt_hash = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        verbose_name="Хеш скомпилированного промта"
+    )
+    token_count = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Количество токенов в system prompt"
+    )
+    excel_file = models.CharField(
+        max_length=255,
+        null=True,
+        blank=True,
+        verbose_name="Файл Excel-шаблона в хранилище"
+    )
+    cell_map = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Карта ячеек ответов"
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Когда версия создана"
+    )
+
+    class Meta:
+        verbose_name = "Версия шаблона"
+        verbose_name_plural = "Версии шаблонов"
+        unique_together = [("template", "content_hash")]
+
+    def __str__(self):
+        return f"Шаблон #{self.template_id} v{self.content_hash[:12]}"
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Версия шаблона неизменяема")
+        super().save(*args, **kwargs)
+
 
 class MediaTaskStatusChoices(models.TextChoices):
     LOADED = "loaded", "Загружен"
@@ -188,6 +399,14 @@ class MediaTask(models.Model):
         related_name="media_tasks",
         verbose_name="Шаблон обработки"
     )
+    template_version = models.ForeignKey(
+        "CastTemplateVersion",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="media_tasks",
+        verbose_name="Версия шаблона"
+    )
     video_uploaded_title = models.CharField(
         max_length=255,
         verbose_name="Оригинальное название видео",
@@ -247,6 +466,16 @@ class MediaTask(models.Model):
         blank=True,
         null=True
     )
+    audio_sample_rate = models.PositiveIntegerField(
+        verbose_name="Частота дискретизации аудио (Гц)",
+        blank=True,
+        null=True
+    )
+    audio_channels = models.PositiveSmallIntegerField(
+        verbose_name="Число каналов аудио",
+        blank=True,
+        null=True
+    )
     audio_extension_uploaded = models.CharField(
         max_length=20,
         verbose_name="Расширение загруженного аудиофайла",
@@ -258,6 +487,13 @@ class MediaTask(models.Model):
         blank=True,
         null=True
     )
+    audio_sha256 = models.CharField(
+        max_length=64,
+        verbose_name="SHA-256 загруженного аудио",
+        blank=True,
+        null=True,
+        db_index=True
+    )
     # === Статус обработки ===
     nexara_status = models.CharField(
         max_length=20,
@@ -318,6 +554,19 @@ class MediaTask(models.Model):
         null=True,
         blank=True
     )
+    gpt_operation_id = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+        verbose_name="ID отложенной операции GPT"
+    )
+    gpt_batch_id = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+        db_index=True,
+        verbose_name="ID batch-задачи GPT"
+    )
     token_count = models.PositiveIntegerField(
         null=True,
         blank=True,
@@ -354,6 +603,365 @@ class MediaTask(models.Model):
         verbose_name="Дата и время завершения"
     )
 
+    @property
+    def known_duration_seconds(self):
+        """
+        Лучшая известная длительность: от Nexara, а до транскрибации —
+        по заголовку файла, определённому при загрузке.
+        """
+        return self.audio_duration_seconds_nexara or self.audio_duration_seconds or self.duration_seconds
+
+
+class UsageStageChoices(models.TextChoices):
+    TRANSCRIPTION = "transcription", "Транскрибация"
+    DATA_EXTRACTION = "data_extraction", "Извлечение данных"
+
+
+class UsageRecord(models.Model):
+    """
+    Потребление ресурсов провайдера на одном этапе обработки MediaTask.
+    Проект, интеграция и шаблон продублированы для агрегации без JOIN.
+    """
+    media_task = models.ForeignKey(
+        "MediaTask",
+        on_delete=models.CASCADE,
+        related_name="usage_records",
+        verbose_name="Задача"
+    )
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="usage_records",
+        verbose_name="Проект"
+    )
+    integration = models.ForeignKey(
+        Integration,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="usage_records",
+        verbose_name="Интеграция"
+    )
+    cast_template = models.ForeignKey(
+        CastTemplate,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="usage_records",
+        verbose_name="Шаблон обработки"
+    )
+    stage = models.CharField(
+        max_length=32,
+        choices=UsageStageChoices.choices,
+        verbose_name="Этап"
+    )
+    provider = models.CharField(
+        max_length=64,
+        verbose_name="Провайдер"
+    )
+    input_tokens = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Входные токены"
+    )
+    output_tokens = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Выходные токены"
+    )
+    audio_seconds = models.FloatField(
+        default=0,
+        verbose_name="Секунды аудио"
+    )
+    unit_price = models.DecimalField(
+        max_digits=10,
+        decimal_places=4,
+        verbose_name="Цена за единицу",
+        help_text="За 1000 токенов для LLM или за минуту аудио для транскрибации"
+    )
+    cost = models.DecimalField(
+        max_digits=12,
+        decimal_places=4,
+        verbose_name="Стоимость"
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Когда записано"
+    )
+
+    class Meta:
+        verbose_name = "Запись потребления"
+        verbose_name_plural = "Записи потребления"
+        indexes = [
+            models.Index(fields=["project", "created_at"]),
+            models.Index(fields=["integration", "created_at"]),
+            models.Index(fields=["cast_template", "created_at"]),
+        ]
+
+
+class MediaTaskAnswer(models.Model):
+    """
+    Ответ на один вопрос шаблона: нормализованная копия gpt_result,
+    которая обновляется при каждом сохранении результата задачи.
+    Числовое значение заполняется, если ответ приводится к числу.
+    """
+    media_task = models.ForeignKey(
+        "MediaTask",
+        on_delete=models.CASCADE,
+        related_name="answers",
+        verbose_name="Задача"
+    )
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="answers",
+        verbose_name="Проект"
+    )
+    template_version = models.ForeignKey(
+        CastTemplateVersion,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="answers",
+        verbose_name="Версия шаблона"
+    )
+    question_id = models.CharField(
+        max_length=16,
+        verbose_name="ID вопроса"
+    )
+    answer = models.TextField(
+        blank=True,
+        default="",
+        verbose_name="Ответ"
+    )
+    answer_number = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name="Числовое значение ответа"
+    )
+    updated_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Когда обновлён"
+    )
+
+    class Meta:
+        verbose_name = "Ответ задачи"
+        verbose_name_plural = "Ответы задач"
+        unique_together = [("media_task", "question_id")]
+        indexes = [
+            models.Index(fields=["project", "media_task"]),
+        ]
+
+
+class ExportFormatChoices(models.TextChoices):
+    XLSX = "xlsx", "Excel"
+    CSV = "csv", "CSV"
+    PARQUET = "parquet", "Parquet"
+
+
+class ExportKindChoices(models.TextChoices):
+    REPORT = "report", "Сводный отчёт"
+    ANSWER_MATRIX = "answer_matrix", "Матрица ответов"
+
+
+class ProjectExportStatusChoices(models.TextChoices):
+    PENDING = "pending", "В очереди"
+    PROCESSING = "processing", "Формируется"
+    READY = "ready", "Готов"
+    FAILED = "failed", "Ошибка"
+
+
+class ProjectExport(models.Model):
+    """
+    Сводный отчёт по всем задачам проекта: строка на MediaTask,
+    столбец на вопрос. Формируется фоновой задачей и хранится в S3.
+    """
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.CASCADE,
+        related_name="exports",
+        verbose_name="Проект"
+    )
+    kind = models.CharField(
+        max_length=16,
+        choices=ExportKindChoices.choices,
+        default=ExportKindChoices.REPORT,
+        verbose_name="Вид выгрузки"
+    )
+    export_format = models.CharField(
+        max_length=8,
+        choices=ExportFormatChoices.choices,
+        default=ExportFormatChoices.XLSX,
+        verbose_name="Формат"
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=ProjectExportStatusChoices.choices,
+        default=ProjectExportStatusChoices.PENDING,
+        verbose_name="Статус"
+    )
+    storage_url = models.CharField(
+        max_length=500,
+        null=True,
+        blank=True,
+        verbose_name="Путь к отчёту в хранилище"
+    )
+    rows_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Количество строк"
+    )
+    error = models.TextField(
+        null=True,
+        blank=True,
+        verbose_name="Текст ошибки"
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Когда запрошен"
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Когда сформирован"
+    )
+
+    class Meta:
+        verbose_name = "Выгрузка проекта"
+        verbose_name_plural = "Выгрузки проектов"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Выгрузка #{self.id} проекта #{self.project_id}"
+
+
+class UploadSessionStatusChoices(models.TextChoices):
+    ACTIVE = "active", "Загружается"
+    COMPLETED = "completed", "Завершена"
+    ABORTED = "aborted", "Отменена"
+
+
+class UploadSession(models.Model):
+    """
+    Составная (multipart) загрузка в S3: UploadId и подтверждённые части
+    с ETag. По сессии незавершённую загрузку можно продолжить с последней
+    подтверждённой части, а брошенные сессии отменяет фоновая задача.
+    """
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="upload_sessions",
+        verbose_name="Проект"
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="upload_sessions",
+        verbose_name="Пользователь"
+    )
+    original_name = models.CharField(
+        max_length=255,
+        blank=True,
+        default="",
+        verbose_name="Исходное имя файла"
+    )
+    saved_name = models.CharField(
+        max_length=255,
+        blank=True,
+        default="",
+        verbose_name="Имя сохранённого файла"
+    )
+    key = models.CharField(
+        max_length=500,
+        verbose_name="Ключ объекта в хранилище"
+    )
+    upload_id = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name="UploadId"
+    )
+    total_size = models.BigIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Размер файла, байт"
+    )
+    part_size = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Размер части, байт"
+    )
+    parts = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Подтверждённые части",
+        help_text='{"номер части": {"ETag": "...", "Size": байт}}'
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=UploadSessionStatusChoices.choices,
+        default=UploadSessionStatusChoices.ACTIVE,
+        verbose_name="Статус"
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Когда начата"
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Когда обновлена"
+    )
+
+    class Meta:
+        verbose_name = "Сессия загрузки"
+        verbose_name_plural = "Сессии загрузки"
+        indexes = [
+            models.Index(fields=["status", "updated_at"]),
+            models.Index(fields=["key", "status"]),
+        ]
+
+    def __str__(self):
+        return f"Загрузка {self.key} ({self.get_status_display()})"
+
+
+class StoredBlob(models.Model):
+    """
+    Медиафайл в хранилище, адресуемый по содержимому (SHA-256).
+    Одинаковые файлы хранятся один раз, ref_count — сколько задач
+    ссылается на объект; при обнулении объект удаляется из хранилища.
+    """
+    sha256 = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name="SHA-256"
+    )
+    key = models.CharField(
+        max_length=500,
+        verbose_name="Ключ объекта в хранилище"
+    )
+    size = models.BigIntegerField(
+        verbose_name="Размер, байт"
+    )
+    ref_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Число ссылающихся задач"
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Когда загружен"
+    )
+
+    class Meta:
+        verbose_name = "Файл в хранилище"
+        verbose_name_plural = "Файлы в хранилище"
+
+    def __str__(self):
+        return f"{self.sha256[:12]} → {self.key}"
+
 
 class EventTypeChoices(models.TextChoices):
     VIDEO_UPLOADED_LOCAL = "video_uploaded", "Видео загружено"
@@ -0,0 +1,173 @@
+"""
+PDF-отчёт по задаче: вопросы шаблона и ответы из gpt_result.
+
+Рендеринг на reportlab (чистый Python, без внешних сервисов) нагружает CPU,
+поэтому выполняется в отдельной очереди "pdf". Подготовленная раскладка
+шаблона (экранированные тексты вопросов, стили, ширины столбцов) кэшируется
+на воркере по версии шаблона и переиспользуется для всех его задач.
+"""
+import json
+import threading
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from core.excel import new_report_buffer, report_digest, report_exists, report_object_name, report_url, upload_report
+
+
+PDF_CONTENT_TYPE = "application/pdf"
+FONT_NAME = "ReportSans"
+FONT_BOLD_NAME = "ReportSans-Bold"
+
+_fonts_lock = threading.Lock()
+_fonts_registered = False
+
+
+def register_fonts():
+    """
+    Регистрирует TTF-шрифт с кириллицей (встроенные шрифты PDF её не содержат).
+    """
+    global _fonts_registered
+    with _fonts_lock:
+        if _fonts_registered:
+            return
+        pdfmetrics.registerFont(TTFont(FONT_NAME, settings.PDF_FONT_PATH))
+        pdfmetrics.registerFont(TTFont(FONT_BOLD_NAME, settings.PDF_FONT_BOLD_PATH))
+        pdfmetrics.registerFontFamily(FONT_NAME, normal=FONT_NAME, bold=FONT_BOLD_NAME)
+        _fonts_registered = True
+
+
+class PdfLayout:
+    """
+    Неизменяемая часть отчёта для версии шаблона: готовые к вставке
+    тексты вопросов, стили и ширины столбцов таблицы.
+    """
+
+    def __init__(self, version):
+        register_fonts()
+        self.title_style = ParagraphStyle("title", fontName=FONT_BOLD_NAME, fontSize=15, leading=19, spaceAfter=4 * mm)
+        self.meta_style = ParagraphStyle("meta", fontName=FONT_NAME, fontSize=9, leading=12, textColor=colors.grey)
+        self.header_style = ParagraphStyle("header", fontName=FONT_BOLD_NAME, fontSize=9, leading=12)
+        self.cell_style = ParagraphStyle("cell", fontName=FONT_NAME, fontSize=9, leading=12)
+
+        width = A4[0] - 30 * mm
+        self.col_widths = [10 * mm, (width - 10 * mm) * 0.45, (width - 10 * mm) * 0.55]
+        self.table_style = TableStyle([
+            ("GRID", (0, 0), (-1, -1), 0.4, colors.HexColor("#b0b0b0")),
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#e8f5e9")),
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ])
+        self.header = [Paragraph(text, self.header_style) for text in ("№", "Вопрос", "Ответ")]
+        self.questions = [(str(q["id"]), escape(str(q["text"]))) for q in version.questions]
+
+
+class PdfLayoutCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_layout(self, version):
+        key = (version.template_id, version.content_hash)
+        with self._lock:
+            layout = self._entries.get(key)
+            if layout is not None:
+                self._entries.move_to_end(key)
+                return layout
+
+        layout = PdfLayout(version)
+        with self._lock:
+            self._entries[key] = layout
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return layout
+
+
+_layout_cache = None
+
+
+def get_layout_cache():
+    global _layout_cache
+    if _layout_cache is None:
+        _layout_cache = PdfLayoutCache(settings.PDF_LAYOUT_CACHE_SIZE)
+    return _layout_cache
+
+
+def _answer_markup(value):
+    if value is None or value == "":
+        return "—"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False, indent=1)
+    return escape(str(value)).replace("\n", "<br/>")
+
+
+def render_task_pdf(buffer, media_obj, version, answers):
+    """
+    Пишет PDF-отчёт задачи в buffer. Ответы те же, что и в Excel-отчёте:
+    gpt_result по id вопросов закреплённой версии шаблона.
+    """
+    layout = get_layout_cache().get_layout(version)
+    title = media_obj.audio_uploaded_title or media_obj.video_uploaded_title or f"Задача #{media_obj.id}"
+
+    rows = [layout.header]
+    for qid, question_markup in layout.questions:
+        rows.append([
+            Paragraph(qid, layout.cell_style),
+            Paragraph(question_markup, layout.cell_style),
+            Paragraph(_answer_markup(answers.get(qid)), layout.cell_style),
+        ])
+    table = Table(rows, colWidths=layout.col_widths, repeatRows=1)
+    table.setStyle(layout.table_style)
+
+    meta = [f"Задача #{media_obj.id}"]
+    if media_obj.project_id:
+        meta.append(f"Проект: {escape(media_obj.project.project_title)}")
+    if media_obj.audio_duration_seconds_nexara:
+        meta.append(f"Длительность: {round(media_obj.audio_duration_seconds_nexara)} сек")
+
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        leftMargin=15 * mm,
+        rightMargin=15 * mm,
+        topMargin=15 * mm,
+        bottomMargin=15 * mm,
+        title=title,
+    )
+    doc.build([
+        Paragraph(escape(title), layout.title_style),
+        Paragraph(" · ".join(meta), layout.meta_style),
+        Spacer(1, 5 * mm),
+        table,
+    ])
+
+
+def ensure_task_pdf(media_obj, version):
+    """
+    Возвращает URL PDF-отчёта задачи, формируя его только при отсутствии
+    в хранилище (ключ — как у Excel-отчёта). Обновляет media_obj.pdf_path.
+    """
+    object_name = report_object_name(media_obj, extension="pdf", digest=report_digest(media_obj, version))
+    public_url = report_url(object_name)
+
+    if media_obj.pdf_path == public_url or report_exists(object_name):
+        print(f"📦 PDF-отчёт уже в хранилище: {public_url}")
+    else:
+        answers = json.loads(media_obj.gpt_result)
+        with new_report_buffer() as buffer:
+            render_task_pdf(buffer, media_obj, version, answers)
+            upload_report(buffer, object_name, PDF_CONTENT_TYPE)
+        print(f"✅ PDF-отчёт сформирован: {public_url}")
+
+    if media_obj.pdf_path != public_url:
+        media_obj.pdf_path = public_url
+        media_obj.save(update_fields=["pdf_path"])
+    return public_url
@@ -1,7 +1,8 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import Integration, CastTemplate, IntegrationSettings
+from .models import Integration, CastTemplate, IntegrationSettings, MediaTask
 
 User = get_user_model()
 
@@ -21,3 +22,38 @@ def create_user_integration(sender, instance, created, **kwargs):
                 template_type=template.template_type,
                 default=True,
             )
+
+
+@receiver(post_save, sender=CastTemplate)
+def tokenize_compiled_template(sender, instance, **kwargs):
+    """
+    Токены скомпилированного промта считаются один раз в фоне после изменения шаблона.
+    """
+    if instance.compiled_token_count is not None or not instance.compiled_prompt:
+        return
+
+    from core.tasks import tokenize_template_task
+
+    def enqueue():
+        try:
+            tokenize_template_task.delay(instance.id, instance.compiled_hash)
+        except Exception as e:
+            print(f"⚠️ Не удалось поставить подсчёт токенов шаблона #{instance.id}: {e}")
+
+    transaction.on_commit(enqueue)
+
+
+@receiver(post_delete, sender=MediaTask)
+def release_media_blob(sender, instance, **kwargs):
+    """
+    Удалённая задача больше не ссылается на свой файл в хранилище.
+    """
+    if not instance.audio_sha256 or not instance.audio_storage_url:
+        return
+
+    from core.blobs import release_blob
+    from core.storage import object_url
+
+    prefix = object_url("")
+    if instance.audio_storage_url.startswith(prefix):
+        release_blob(instance.audio_sha256, instance.audio_storage_url[len(prefix):])
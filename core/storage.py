@@ -0,0 +1,214 @@
+"""
+Объектное хранилище (Yandex Object Storage, S3 API).
+
+Здесь создаётся единственный на процесс S3-клиент (через реестр
+core.clients): пул соединений под параллельные загрузки, ретраи,
+таймауты и keep-alive. Все обращения к бакету из вьюх и задач идут
+через функции этого модуля, а не через клиент, собранный на месте.
+"""
+import io
+import os
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+from core.clients import registry
+
+
+NOT_FOUND_CODES = ("404", "NoSuchKey", "NotFound")
+STREAM_CHUNK_SIZE = 8 * 1024 * 1024
+RANGE_BUFFER_SIZE = 256 * 1024
+
+
+def make_client():
+    # Соединений должно хватать всем потокам составной загрузки и upload_fileobj
+    pool_size = max(
+        settings.S3_MAX_POOL_CONNECTIONS,
+        settings.UPLOAD_MAX_WORKERS + settings.S3_TRANSFER_CONCURRENCY,
+    )
+    session = boto3.session.Session()
+    return session.client(
+        service_name="s3",
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        endpoint_url=settings.ENDPOINT_URL,
+        region_name=settings.REGION,
+        config=Config(
+            max_pool_connections=pool_size,
+            retries={"max_attempts": settings.S3_MAX_ATTEMPTS, "mode": "standard"},
+            connect_timeout=settings.S3_CONNECT_TIMEOUT,
+            read_timeout=settings.S3_READ_TIMEOUT,
+            tcp_keepalive=True,
+        ),
+    )
+
+
+def check_client(client):
+    client.head_bucket(Bucket=settings.BUCKET_NAME)
+
+
+registry.register("s3", make_client, health_check=check_client)
+
+
+def get_client():
+    return registry.get("s3")
+
+
+_transfer_config = None
+
+
+def get_transfer_config():
+    """
+    Настройки upload_fileobj/download_fileobj: с какого размера файл
+    делится на части, размер части и число потоков.
+    """
+    global _transfer_config
+    if _transfer_config is None:
+        _transfer_config = TransferConfig(
+            multipart_threshold=settings.S3_TRANSFER_THRESHOLD,
+            multipart_chunksize=settings.S3_TRANSFER_CHUNK_SIZE,
+            max_concurrency=settings.S3_TRANSFER_CONCURRENCY,
+            use_threads=True,
+        )
+    return _transfer_config
+
+
+def object_url(key):
+    return f"{settings.ENDPOINT_URL}/{settings.BUCKET_NAME}/{key}"
+
+
+def _extra_args(content_type=None, public=False):
+    extra = {}
+    if content_type:
+        extra["ContentType"] = content_type
+    if public:
+        extra["ACL"] = "public-read"
+    return extra
+
+
+def put_bytes(key, data, content_type=None, public=False):
+    """
+    Кладёт небольшой объект одним запросом и возвращает его URL.
+    """
+    get_client().put_object(
+        Bucket=settings.BUCKET_NAME,
+        Key=key,
+        Body=data,
+        **_extra_args(content_type, public)
+    )
+    return object_url(key)
+
+
+def upload_fileobj(fileobj, key, content_type=None, public=False):
+    """
+    Загружает файловый объект (частями, если он большой) и возвращает URL.
+    """
+    get_client().upload_fileobj(
+        fileobj,
+        settings.BUCKET_NAME,
+        key,
+        ExtraArgs=_extra_args(content_type, public) or None,
+        Config=get_transfer_config(),
+    )
+    return object_url(key)
+
+
+def get_bytes(key, bucket=None):
+    response = get_client().get_object(Bucket=bucket or settings.BUCKET_NAME, Key=key)
+    return response["Body"].read()
+
+
+def stream(key, chunk_size=STREAM_CHUNK_SIZE, bucket=None):
+    """
+    Читает объект потоком, порциями по chunk_size байт.
+    """
+    response = get_client().get_object(Bucket=bucket or settings.BUCKET_NAME, Key=key)
+    body = response["Body"]
+    try:
+        yield from body.iter_chunks(chunk_size=chunk_size)
+    finally:
+        body.close()
+
+
+class ObjectReader(io.RawIOBase):
+    """
+    Файловый объект только для чтения поверх объекта в бакете: каждое
+    чтение — запрос диапазона байт. Подходит для разбора заголовков,
+    которым нужно несколько небольших кусков файла, а не он целиком.
+    """
+
+    def __init__(self, key, size=None):
+        super().__init__()
+        self.key = key
+        self.name = key
+        if size is None:
+            size = get_client().head_object(Bucket=settings.BUCKET_NAME, Key=key)["ContentLength"]
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.position = max(offset, 0)
+        return self.position
+
+    def readinto(self, buffer):
+        end = min(self.position + len(buffer), self.size)
+        if end <= self.position:
+            return 0
+        response = get_client().get_object(
+            Bucket=settings.BUCKET_NAME,
+            Key=self.key,
+            Range=f"bytes={self.position}-{end - 1}",
+        )
+        data = response["Body"].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def open_object(key, size=None, buffer_size=RANGE_BUFFER_SIZE):
+    """
+    Открывает объект для чтения с произвольным доступом (см. ObjectReader).
+    """
+    return io.BufferedReader(ObjectReader(key, size), buffer_size=buffer_size)
+
+
+def exists(key):
+    try:
+        get_client().head_object(Bucket=settings.BUCKET_NAME, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in NOT_FOUND_CODES:
+            return False
+        raise
+    return True
+
+
+def delete(key):
+    get_client().delete_object(Bucket=settings.BUCKET_NAME, Key=key)
+
+
+def presign(operation, expires, **params):
+    """
+    Подписанный URL для операции S3 (get_object, upload_part, ...)
+    над объектом в бакете; params — параметры операции кроме Bucket.
+    """
+    return get_client().generate_presigned_url(
+        operation,
+        Params={"Bucket": settings.BUCKET_NAME, **params},
+        ExpiresIn=expires,
+    )
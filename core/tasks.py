@@ -2,23 +2,60 @@
 
 import os
 import json
-import io
-import boto3
-from boto3.session import Session
+import tempfile
 import xlsxwriter
 from botocore.exceptions import BotoCoreError, ClientError
 from django.conf import settings
-import requests
 from django.utils import timezone
-from openpyxl import load_workbook
-from yandex_cloud_ml_sdk import YCloudML
 
 
-from core.models import OutboxEvent, EventTypeChoices, MediaTask, MediaTaskStatusChoices
+from core import storage
+from core.clients import get_http_session
+from core.artifacts import cache_artifact, format_transcript
+from core.audio import probe_media
+from core.blobs import acquire_blob, delete_object, hash_object, release_blob
+from core.excel import ensure_task_report, new_report_buffer, parse_template_questions, report_object_name, \
+    upload_report
+from core.exports import build_project_export
+from core.pdf import ensure_task_pdf
+from core.uploads import abort_stale_uploads, media_upload_key, upload_media_file
+from core.video import AudioExtractionError, extract_audio
+from core.gpt import (
+    batch_record_text,
+    batch_record_usage,
+    batch_record_request_key,
+    batch_request_key,
+    batch_request_line,
+    build_gpt_messages,
+    finish_partial_gpt_result,
+    get_completions_model,
+    get_sdk,
+    get_template_version,
+    merge_gpt_reask_result,
+    save_gpt_result,
+)
+from core.llm import get_llm_router
+from core.usage import record_gpt_result_usage, record_llm_usage, record_transcription_usage
+from core.models import OutboxEvent, EventTypeChoices, MediaTask, MediaTaskStatusChoices, CastTemplate, \
+    CastTemplateVersion, ProjectExport, ProjectExportStatusChoices, ExcelModeChoices, IntegrationSettings, \
+    TemplateParseStatusChoices
 
 from backend.celery import app as celery_app
 
 
+def get_excel_mode(media_obj):
+    """
+    Режим формирования Excel из настроек интеграции задачи.
+    """
+    mode = (
+        IntegrationSettings.objects
+        .filter(integration_id=media_obj.integration_id)
+        .values_list("excel_mode", flat=True)
+        .first()
+    )
+    return mode or ExcelModeChoices.EAGER
+
+
 @celery_app.task(queue="handler")
 def handler_task():
     """
@@ -59,6 +96,11 @@ def handler_task():
             else:
                 print(f"Нет AUDIO_UPLOADED_TO_YANDEX для MediaTask #{media_task_id}, ждем...")
 
+        if event.event_type == EventTypeChoices.VIDEO_UPLOADED_LOCAL:
+            print(f"Обнаружено событие VIDEO_UPLOADED_LOCAL для MediaTask #{media_task_id}")
+            extract_audio_task.delay(media_task_id)
+            event.delete()
+            print(f"Удалено событие VIDEO_UPLOADED_LOCAL для MediaTask #{media_task_id}")
         if event.event_type == EventTypeChoices.AUDIO_TRANSCRIBATION_READY:
             print(f"Обнаружен событие AUDIO_TRANSCRIBATION_READY для MediaTask #{media_task_id}")
             gpt_task.delay(media_task_id)
@@ -66,7 +108,11 @@ def handler_task():
             print(f"Удалено событие AUDIO_TRANSCRIBATION_READY для MediaTask #{media_task_id}")
         if event.event_type == EventTypeChoices.GPT_RESULT_READY:
             print(f"Обнаружено событие GPT_RESULT_READY для MediaTask #{media_task_id}")
-            save_excel_task.delay(media_task_id)
+            if get_excel_mode(event.media_task) == ExcelModeChoices.LAZY:
+                print(f"⏸ Отчёты для MediaTask #{media_task_id} будут сформированы при скачивании")
+            else:
+                save_excel_task.delay(media_task_id)
+                save_pdf_task.delay(media_task_id)
             event.delete()
             print(f"Удалено событие GPT_RESULT_READY для MediaTask #{media_task_id}")
 
@@ -84,46 +130,26 @@ def save_transcription_to_s3(media_obj, segments):
     Возвращает публичный URL.
     """
     # --- Формируем текст посегментно ---
-    lines = []
-    for seg in segments:
-        speaker = seg.get("speaker", "unknown")
-        text = seg.get("text", "").strip()
-        if text:
-            lines.append(f"{speaker}: {text}")
-
-    # --- Объединяем строки в один текст ---
-    txt_content = "\n".join(lines)
+    txt_content = format_transcript(segments)
 
     # DEBUG
     print("[DEBUG] Текст для сохранения:")
     print(txt_content[:1000])
 
     # --- Преобразуем в байты ---
-    byte_stream = io.BytesIO(txt_content.encode("utf-8"))
+    txt_bytes = txt_content.encode("utf-8")
 
     # --- Имя и путь в S3 ---
     txt_filename = f"{media_obj.audio_title_saved.rsplit('.', 1)[0]}.txt"
     s3_txt_path = f"media_transcripts/{txt_filename}"
 
-    # --- S3 клиент ---
-    session = Session()
-    s3_client = session.client(
-        service_name="s3",
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        endpoint_url=settings.ENDPOINT_URL,
-        region_name=settings.REGION
-    )
-
     # --- Загрузка в S3 ---
-    s3_client.put_object(
-        Bucket=settings.BUCKET_NAME,
-        Key=s3_txt_path,
-        Body=byte_stream,
-        ContentType="text/plain; charset=utf-8"
-    )
+    storage_url = storage.put_bytes(s3_txt_path, txt_bytes, content_type="text/plain; charset=utf-8")
+
+    # --- Кладём в локальный кэш, чтобы следующие этапы не ходили в S3 ---
+    cache_artifact(storage_url, txt_bytes)
 
-    return f"{settings.ENDPOINT_URL}/{settings.BUCKET_NAME}/{s3_txt_path}"
+    return storage_url
 
 
 @celery_app.task(queue="processing")
@@ -160,7 +186,7 @@ def transcribe_task(media_task_id):
             "url": audio_yandex_url
         }
 
-        response = requests.post(url, headers=headers, data=data)
+        response = get_http_session().post(url, headers=headers, data=data)
         print(f"Nexara ответила со статусом {response.status_code}")
 
         if response.status_code != 200:
@@ -203,6 +229,13 @@ def transcribe_task(media_task_id):
             payload={"info": "Диаризация успешно выполнена"}
         )
 
+        # --- Учёт стоимости транскрибации: его сбой не должен останавливать обработку ---
+        try:
+            billed_seconds = duration or (segments[-1].get("end") if segments else 0)
+            record_transcription_usage(media_obj, billed_seconds)
+        except Exception as e:
+            print(f"⚠️ Не удалось учесть стоимость транскрибации MediaTask #{media_task_id}: {e}")
+
         print("✅ Транскрибация и сохранение завершены")
 
     except MediaTask.DoesNotExist:
@@ -219,13 +252,6 @@ def upload_audio_to_yandex_task(media_task_id):
     Задача по загрузке аудио-файла из Сервиса в хранилище Яндекс.
     """
     print("=== Запуск upload_audio_to_yandex_task ===")
-    # === Константы для S3 ===
-    AWS_ACCESS_KEY_ID = settings.AWS_ACCESS_KEY_ID
-    AWS_SECRET_ACCESS_KEY = settings.AWS_SECRET_ACCESS_KEY
-    BUCKET_NAME = settings.BUCKET_NAME
-    REGION = settings.REGION
-    ENDPOINT_URL = settings.ENDPOINT_URL
-
     try:
         media_obj = MediaTask.objects.get(id=media_task_id)
         file_name = media_obj.audio_title_saved
@@ -239,21 +265,20 @@ def upload_audio_to_yandex_task(media_task_id):
 
         print(f"📤 Загружаем файл {local_file_path} в {object_name}...")
 
-        session = boto3.session.Session()
-        s3_client = session.client(
-            service_name="s3",
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-            endpoint_url=ENDPOINT_URL,
-            region_name=REGION
-        )
-
-        # Загрузка в бакет
+        # Загрузка в бакет: части отправляются параллельно, после сбоя
+        # повторный запуск продолжит с последней подтверждённой части
         with open(local_file_path, "rb") as f:
-            s3_client.put_object(Bucket=BUCKET_NAME, Key=object_name, Body=f)
+            public_url = upload_media_file(
+                f,
+                object_name,
+                total_size=os.fstat(f.fileno()).st_size,
+                resumable=True,
+                project=media_obj.project,
+                original_name=file_name,
+                saved_name=file_name,
+            )
 
         # Обновляем URL в MediaTask
-        public_url = f"{ENDPOINT_URL}/{BUCKET_NAME}/{object_name}"
         media_obj.audio_storage_url = public_url
         media_obj.save()
 
@@ -288,13 +313,6 @@ def upload_task(media_task_id):
     Задача по загрузке медиа-файла из Сервиса в хранилище Яндекс.
     """
 
-    # === Константы для S3 ===
-    AWS_ACCESS_KEY_ID = settings.AWS_ACCESS_KEY_ID
-    AWS_SECRET_ACCESS_KEY = settings.AWS_SECRET_ACCESS_KEY
-    BUCKET_NAME = settings.BUCKET_NAME
-    REGION = settings.REGION
-    ENDPOINT_URL = settings.ENDPOINT_URL
-
     # Вывод всех настроек S3 для отладки
     print("=== 🌐 Настройки S3 из settings.py ===")
     print(f"AWS_ACCESS_KEY_ID: {settings.AWS_ACCESS_KEY_ID}")
@@ -317,21 +335,20 @@ def upload_task(media_task_id):
 
         print(f"📤 Загружаем файл {local_file_path} в {object_name}...")
 
-        session = boto3.session.Session()
-        s3_client = session.client(
-            service_name="s3",
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-            endpoint_url=ENDPOINT_URL,
-            region_name=REGION
-        )
-
-        # Загрузка в бакет
+        # Загрузка в бакет: части отправляются параллельно, после сбоя
+        # повторный запуск продолжит с последней подтверждённой части
         with open(local_file_path, "rb") as f:
-            s3_client.put_object(Bucket=BUCKET_NAME, Key=object_name, Body=f)
+            public_url = upload_media_file(
+                f,
+                object_name,
+                total_size=os.fstat(f.fileno()).st_size,
+                resumable=True,
+                project=media_obj.project,
+                original_name=file_name,
+                saved_name=file_name,
+            )
 
         # Обновляем URL
-        public_url = f"{ENDPOINT_URL}/{BUCKET_NAME}/{object_name}"
         media_obj.storage_url = public_url
         media_obj.save()
 
@@ -362,138 +379,453 @@ def gpt_task(media_task_id):
         media_obj.status = MediaTaskStatusChoices.PROCESS_DATA_EXTRACTION
         media_obj.save()
 
-        # --- Проверяем наличие пути к транскрипции ---
-        transcribation_path = media_obj.transcribation_path
-        if not transcribation_path:
-            print(f"❌ У MediaTask #{media_task_id} отсутствует transcribation_path")
+        messages = build_gpt_messages(media_obj)
+        if not messages:
             return
 
-        print(f"📥 Загружаем файл из Object Storage: {transcribation_path}")
+        if settings.YANDEX_GPT_MODE == "deferred":
+            # --- Отложенный режим: отправляем запрос и освобождаем воркер ---
+            print("🤖 Отправляем отложенный запрос в YandexGPT...")
+            operation = get_completions_model(get_sdk()).run_deferred(messages)
+            media_obj.gpt_operation_id = operation.id
+            media_obj.save(update_fields=["gpt_operation_id"])
 
-        # === Настройки доступа ===
-        ENDPOINT_URL = "https://storage.yandexcloud.net"
-        BUCKET_NAME = "bucketnew"
+            poll_gpt_operation_task.apply_async(
+                (media_task_id,),
+                countdown=settings.YANDEX_GPT_POLL_INTERVAL,
+            )
+            print(f"⏳ Операция {operation.id} поставлена на опрос")
+            return
 
-        # --- Создаём S3 клиент ---
-        session = Session()
-        s3_client = session.client(
-            service_name="s3",
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            endpoint_url=ENDPOINT_URL,
-            region_name=settings.REGION,
+        # --- Синхронный режим: самый быстрый здоровый провайдер ---
+        response = get_llm_router().complete(messages)
+        record_llm_usage(
+            media_obj,
+            response.input_tokens,
+            response.output_tokens,
+            provider=response.provider,
+            unit_price=response.unit_price,
         )
+        missing_ids = save_gpt_result(media_obj, response.text)
+        if missing_ids:
+            gpt_reask_task.delay(media_task_id, missing_ids)
 
-        # --- Извлекаем object_key ---
-        prefix = f"{ENDPOINT_URL}/{BUCKET_NAME}/"
-        if not transcribation_path.startswith(prefix):
-            print(f"⚠️ Неожиданный формат пути: {transcribation_path}")
-            return
-        object_key = transcribation_path[len(prefix):]
+        print("✅ GPT-задача завершена успешно")
 
-        print(f"[DEBUG] bucket_name={BUCKET_NAME}")
-        print(f"[DEBUG] object_key={object_key}")
+    except MediaTask.DoesNotExist:
+        print(f"❌ MediaTask #{media_task_id} не найден")
 
-        # --- Загружаем текст транскрипции ---
-        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=object_key)
-        interview_text = response["Body"].read().decode("utf-8")
-        print(f"✅ Файл считан ({len(interview_text)} символов)")
+    except Exception as e:
+        print(f"❌ Ошибка при работе с gpt_task: {e}")
 
-        # --- Загружаем и обрабатываем список вопросов ---
-        template = getattr(media_obj, "cast_template", None)
-        if not template or not template.questions:
-            print(f"❌ У MediaTask #{media_task_id} отсутствует шаблон с вопросами")
+
+
+@celery_app.task(queue="processing")
+def tokenize_template_task(template_id, compiled_hash):
+    """
+    Считает токены скомпилированного system prompt шаблона.
+    Результат записывается, только если шаблон с тех пор не менялся.
+    """
+    try:
+        template = CastTemplate.objects.get(id=template_id)
+        if template.compiled_hash != compiled_hash or not template.compiled_prompt:
             return
 
-        # Универсальный парсинг
-        if isinstance(template.questions, dict):
-            questions_dict = template.questions
-        elif isinstance(template.questions, str):
-            try:
-                questions_dict = json.loads(template.questions)
-            except json.JSONDecodeError:
-                print("⚠️ Ошибка парсинга JSON с вопросами, используем пустой список")
-                questions_dict = {}
-        else:
-            print(f"⚠️ Неожиданный тип поля questions: {type(template.questions)}")
-            questions_dict = {}
+        model = get_completions_model(get_sdk())
+        tokenized = model.tokenize([{"role": "system", "text": template.compiled_prompt}])
 
-        questions_text = "\n".join([f"{qid}. {qtext}" for qid, qtext in questions_dict.items()])
-        print(f"✅ Загружено {len(questions_dict)} вопросов для GPT")
+        CastTemplate.objects.filter(id=template_id, compiled_hash=compiled_hash).update(
+            compiled_token_count=len(tokenized)
+        )
+        CastTemplateVersion.objects.filter(template_id=template_id, prompt_hash=compiled_hash).update(
+            token_count=len(tokenized)
+        )
+        print(f"🔢 Шаблон #{template_id}: {len(tokenized)} токенов в system prompt")
 
-        # --- Формируем system prompt ---
-        system_prompt_start = template.promt
+    except CastTemplate.DoesNotExist:
+        print(f"❌ CastTemplate #{template_id} не найден")
 
-        user_prompt = f"Интервью:\n{interview_text}"
+    except Exception as e:
+        print(f"⚠️ Не удалось подсчитать токены шаблона #{template_id}: {e}")
 
-        messages = [
-            {"role": "system", "text": system_prompt_start + questions_text},
-            {"role": "user", "text": user_prompt},
-        ]
 
-        # --- GPT (Yandex Cloud) ---
-        sdk = YCloudML(
-            folder_id=settings.YANDEX_FOLDER_ID,
-            auth=settings.YANDEX_OAUTH_TOKEN,
-        )
+@celery_app.task(queue="processing")
+def parse_template_task(template_id):
+    """
+    Извлекает вопросы и карту ячеек ответов из Excel-файла шаблона.
+    Файл читается потоково прямо из хранилища, без копии на диске.
+    """
+    try:
+        template = CastTemplate.objects.get(id=template_id)
+        if not template.excel_file:
+            print(f"❌ У шаблона #{template_id} нет Excel-файла")
+            return
 
-        try:
-            tokenized = sdk.models.completions("yandexgpt").tokenize(messages)
-            print(f"🔢 Количество токенов: {len(tokenized)}")
-        except Exception as e:
-            print(f"⚠️ Не удалось подсчитать токены: {e}")
+        with template.excel_file.open("rb") as excel_file:
+            questions, cell_map = parse_template_questions(excel_file)
 
-        print("🤖 Отправляем запрос в YandexGPT...")
-        result = sdk.models.completions("yandexgpt").configure(temperature=0.3).run(messages)
+        template.questions = questions
+        template.excel_cell_map = cell_map
+        template.parse_status = TemplateParseStatusChoices.READY
+        template.save(update_fields=["questions", "excel_cell_map", "parse_status"])
+        print(f"✅ Шаблон #{template_id}: извлечено вопросов {len(questions)}")
 
-        gpt_raw_text = result[0].text if result else "{}"
-        print(f"=== 📝 Ответ GPT ===\n{gpt_raw_text}")
+    except CastTemplate.DoesNotExist:
+        print(f"❌ CastTemplate #{template_id} не найден")
+    except Exception as e:
+        print(f"❌ Ошибка разбора Excel шаблона #{template_id}: {e}")
+        CastTemplate.objects.filter(id=template_id).update(parse_status=TemplateParseStatusChoices.FAILED)
 
-        # --- Очистка и парсинг JSON ---
-        gpt_cleaned_text = gpt_raw_text.strip()
-        if gpt_cleaned_text.startswith("```") and gpt_cleaned_text.endswith("```"):
-            gpt_cleaned_text = gpt_cleaned_text.strip("`").strip()
 
-        try:
-            gpt_json = json.loads(gpt_cleaned_text)
-            print("✅ JSON успешно распознан")
-        except json.JSONDecodeError as e:
-            print(f"⚠️ Ошибка парсинга JSON: {e}")
-            gpt_json = None
+@celery_app.task(queue="processing")
+def extract_audio_task(media_task_id):
+    """
+    Извлекает аудиодорожку из загруженного видео в моно WAV для речи
+    и кладёт её в хранилище. Дальше задача идёт обычным путём аудио:
+    событие AUDIO_UPLOADED_TO_YANDEX ждёт выбора шаблона.
+    """
+    print(f"=== Запуск extract_audio_task для MediaTask #{media_task_id} ===")
+    try:
+        media_obj = MediaTask.objects.get(id=media_task_id)
+        file_name = media_obj.video_title_saved
+        if not file_name:
+            print(f"❌ Нет видеофайла у MediaTask #{media_obj.id}")
+            return
 
-        # --- Сохраняем результат ---
-        media_obj.gpt_raw_response = gpt_raw_text
-        media_obj.gpt_result = json.dumps(gpt_json, ensure_ascii=False, indent=2) if gpt_json else None
-        media_obj.status = MediaTaskStatusChoices.DATA_EXTRACTION_SUCCESS
-        media_obj.save(update_fields=["gpt_raw_response", "gpt_result", "status"])
+        local_file_path = os.path.join(settings.MEDIA_ROOT, "media_uploads", file_name)
+        audio_name = f"{os.path.splitext(media_obj.video_uploaded_title or file_name)[0]}.wav"
+        saved_name, key = media_upload_key(audio_name)
+
+        print(f"🎬 Извлекаем аудио из {local_file_path} в {key}...")
+        public_url, size, media_fields = extract_audio(
+            local_file_path,
+            key,
+            project=media_obj.project,
+            original_name=audio_name,
+            saved_name=saved_name,
+        )
+
+        media_obj.audio_uploaded_title = audio_name
+        media_obj.audio_title_saved = saved_name
+        media_obj.audio_extension_uploaded = "wav"
+        media_obj.audio_storage_url = public_url
+        for field, value in media_fields.items():
+            setattr(media_obj, field, value)
+        media_obj.save()
+        duration = media_fields.get("audio_duration_seconds") or 0
+        print(f"✅ Аудио извлечено: {size / 1024 / 1024:.1f} MB, {duration:.0f} сек — {public_url}")
 
-        # --- OutboxEvent ---
         OutboxEvent.objects.create(
             media_task=media_obj,
-            event_type=EventTypeChoices.GPT_RESULT_READY,
-            payload={"media_task_id": media_task_id},
+            event_type=EventTypeChoices.AUDIO_UPLOADED_TO_YANDEX,
+            payload={
+                "filename": saved_name,
+                "storage_url": public_url,
+                "source": "video",
+                "uploaded_by": "system_task",
+            }
         )
+        hash_upload_task.delay(media_obj.id, key)
 
-        print("✅ GPT-задача завершена успешно")
+    except MediaTask.DoesNotExist:
+        print(f"❌ MediaTask #{media_task_id} не найден")
+    except AudioExtractionError as e:
+        print(f"❌ Не удалось извлечь аудио MediaTask #{media_task_id}: {e}")
+        MediaTask.objects.filter(id=media_task_id).update(status=MediaTaskStatusChoices.FAILED)
+    except (BotoCoreError, ClientError) as e:
+        print(f"❌ Ошибка S3 при загрузке аудио MediaTask #{media_task_id}: {e}")
+    except Exception as e:
+        print(f"❌ Общая ошибка в extract_audio_task: {e}")
+
+
+@celery_app.task(queue="processing")
+def hash_upload_task(media_task_id, key):
+    """
+    Определяет по заголовку параметры загруженного напрямую из браузера
+    аудио (длительность, частота, каналы), затем считает его SHA-256
+    и регистрирует в StoredBlob, чтобы повторные загрузки того же файла
+    не передавались.
+    Если такое содержимое уже хранилось, задача переводится на существующий
+    объект, а её собственный удаляется с задержкой
+    DEDUP_DUPLICATE_DELETE_DELAY: обработка могла уже начать его читать.
+    """
+    try:
+        media_obj = MediaTask.objects.get(id=media_task_id)
+        if media_obj.audio_duration_seconds is None:
+            with storage.open_object(key) as stored_file:
+                media_fields = probe_media(stored_file, key)
+            if media_fields:
+                MediaTask.objects.filter(id=media_task_id).update(**media_fields)
+                print(f"📏 MediaTask #{media_task_id}: {media_fields}")
+
+        sha256, size = hash_object(key)
+        blob, duplicate = acquire_blob(sha256, key, size)
+        media_fields = {"audio_sha256": sha256}
+        if duplicate:
+            # Ссылка остаётся на существующем объекте, лишний объект key удаляется
+            media_fields["audio_storage_url"] = storage.object_url(blob.key)
+            delete_object_task.apply_async(args=[key], countdown=settings.DEDUP_DUPLICATE_DELETE_DELAY)
+            print(f"♻️ MediaTask #{media_task_id}: такой файл уже хранится под {blob.key}")
+        if not MediaTask.objects.filter(id=media_task_id).update(**media_fields):
+            # Задачу удалили, пока считался хэш: ссылку держать некому
+            release_blob(sha256, blob.key)
+            return
+        print(f"🔑 MediaTask #{media_task_id}: SHA-256 {sha256[:12]}")
 
     except MediaTask.DoesNotExist:
         print(f"❌ MediaTask #{media_task_id} не найден")
+    except (BotoCoreError, ClientError) as e:
+        print(f"❌ Ошибка S3 при подсчёте хэша MediaTask #{media_task_id}: {e}")
+    except Exception as e:
+        print(f"❌ Общая ошибка в hash_upload_task: {e}")
+
 
+@celery_app.task(queue="processing")
+def delete_object_task(key):
+    """
+    Отложенное удаление объекта из хранилища.
+    """
+    delete_object(key)
+
+
+@celery_app.task(queue="handler")
+def cleanup_uploads_task():
+    """
+    Периодическая уборка: отменяет брошенные составные загрузки,
+    чтобы их части не копились в бакете.
+    """
+    try:
+        aborted = abort_stale_uploads()
+        if aborted:
+            print(f"🧹 Отменено брошенных загрузок: {aborted}")
+    except (BotoCoreError, ClientError) as e:
+        print(f"❌ Ошибка S3 при уборке загрузок: {e}")
     except Exception as e:
-        print(f"❌ Ошибка при работе с gpt_task: {e}")
+        print(f"❌ Общая ошибка в cleanup_uploads_task: {e}")
+
+
+@celery_app.task(queue="processing")
+def gpt_reask_task(media_task_id, question_ids):
+    """
+    Переспрос только тех вопросов, ответы на которые не удалось извлечь.
+    """
+    print(f"=== Запуск gpt_reask_task: вопросы {', '.join(question_ids)} ===")
+
+    media_obj = None
+    try:
+        media_obj = MediaTask.objects.get(id=media_task_id)
+
+        messages = build_gpt_messages(media_obj, question_ids=question_ids)
+        if not messages:
+            finish_partial_gpt_result(media_obj)
+            return
+
+        response = get_llm_router().complete(messages)
+        record_llm_usage(
+            media_obj,
+            response.input_tokens,
+            response.output_tokens,
+            provider=response.provider,
+            unit_price=response.unit_price,
+        )
+        merge_gpt_reask_result(media_obj, response.text, question_ids)
+
+        print("✅ Переспрос завершён")
+
+    except MediaTask.DoesNotExist:
+        print(f"❌ MediaTask #{media_task_id} не найден")
+
+    except Exception as e:
+        print(f"❌ Ошибка при переспросе GPT: {e}")
+        # Задача не должна зависнуть: отчёт строится по уже полученным ответам
+        if media_obj is not None:
+            try:
+                finish_partial_gpt_result(media_obj)
+            except Exception as finish_error:
+                print(f"❌ Не удалось завершить MediaTask #{media_task_id}: {finish_error}")
+                MediaTask.objects.filter(id=media_task_id).update(status=MediaTaskStatusChoices.FAILED)
+
+
+@celery_app.task(queue="handler")
+def poll_gpt_operation_task(media_task_id, attempt=1):
+    """
+    Лёгкая задача опроса отложенной операции YandexGPT.
+    Пока операция выполняется — переставляет себя в очередь с задержкой.
+    """
+    try:
+        media_obj = MediaTask.objects.get(id=media_task_id)
+        operation_id = media_obj.gpt_operation_id
+        if not operation_id:
+            print(f"❌ У MediaTask #{media_task_id} нет gpt_operation_id")
+            return
+
+        model = get_completions_model(get_sdk())
+        operation = model.attach_deferred(operation_id)
+        status = operation.get_status()
+
+        if status.is_running:
+            if attempt >= settings.YANDEX_GPT_POLL_MAX_ATTEMPTS:
+                print(f"❌ Операция {operation_id} не завершилась за {attempt} попыток")
+                media_obj.status = MediaTaskStatusChoices.FAILED
+                media_obj.save(update_fields=["status"])
+                return
+            poll_gpt_operation_task.apply_async(
+                (media_task_id, attempt + 1),
+                countdown=settings.YANDEX_GPT_POLL_INTERVAL,
+            )
+            return
 
+        if status.is_failed:
+            print(f"❌ Операция {operation_id} завершилась с ошибкой: {status}")
+            media_obj.status = MediaTaskStatusChoices.FAILED
+            media_obj.save(update_fields=["status"])
+            return
+
+        result = operation.get_result()
+        record_gpt_result_usage(
+            media_obj, result, unit_price=settings.YANDEX_GPT_ASYNC_PRICE_PER_1K_TOKENS
+        )
+        gpt_raw_text = result[0].text if result else "{}"
+        missing_ids = save_gpt_result(media_obj, gpt_raw_text)
+        if missing_ids:
+            gpt_reask_task.delay(media_task_id, missing_ids)
+        print(f"✅ Результат операции {operation_id} получен")
+
+    except MediaTask.DoesNotExist:
+        print(f"❌ MediaTask #{media_task_id} не найден")
+
+    except Exception as e:
+        print(f"❌ Ошибка при опросе операции GPT: {e}")
 
 
 @celery_app.task(queue="processing")
-def save_excel_task_old(media_task_id):
+def gpt_batch_task(media_task_ids):
+    """
+    Пакетная обработка: отправляет транскрипты нескольких MediaTask
+    в YandexGPT одной batch-задачей.
+    """
+    print(f"=== Запуск gpt_batch_task для {len(media_task_ids)} задач ===")
 
-    # === S3 Конфигурация ===
-    AWS_ACCESS_KEY_ID = settings.AWS_ACCESS_KEY_ID
-    AWS_SECRET_ACCESS_KEY = settings.AWS_SECRET_ACCESS_KEY
-    BUCKET_NAME = settings.BUCKET_NAME
-    REGION = settings.REGION
-    ENDPOINT_URL = settings.ENDPOINT_URL
+    media_objs = []
+    lines = []
+    for media_obj in MediaTask.objects.filter(id__in=media_task_ids).select_related("cast_template"):
+        messages = build_gpt_messages(media_obj)
+        if not messages:
+            continue
+        media_objs.append(media_obj)
+        lines.append(batch_request_line(messages))
+
+    if not lines:
+        print("❌ Нет задач, пригодных для пакетной обработки")
+        return
 
+    tmp_path = None
+    try:
+        sdk = get_sdk()
+
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False, encoding="utf-8") as tmp:
+            tmp.write("\n".join(lines))
+            tmp_path = tmp.name
+
+        dataset = sdk.datasets.draft_from_path(
+            task_type="TextToTextGenerationRequest",
+            path=tmp_path,
+            upload_format="jsonlines",
+            name=f"icast-batch-{timezone.now().strftime('%Y%m%d%H%M%S')}",
+        ).upload()
+
+        operation = get_completions_model(sdk).batch.run_deferred(dataset)
+        print(f"📦 Batch-задача {operation.id} создана ({len(lines)} запросов)")
+
+        for media_obj in media_objs:
+            media_obj.gpt_batch_id = operation.id
+            media_obj.status = MediaTaskStatusChoices.PROCESS_DATA_EXTRACTION
+        MediaTask.objects.bulk_update(media_objs, ["gpt_batch_id", "status"])
+
+        poll_gpt_batch_task.apply_async(
+            (operation.id,),
+            countdown=settings.YANDEX_GPT_BATCH_POLL_INTERVAL,
+        )
+
+    except Exception as e:
+        print(f"❌ Ошибка при создании batch-задачи GPT: {e}")
+
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@celery_app.task(queue="handler")
+def poll_gpt_batch_task(batch_id, attempt=1):
+    """
+    Опрос batch-задачи YandexGPT; по готовности раскладывает ответы по MediaTask.
+    """
+    try:
+        media_objs = list(MediaTask.objects.filter(gpt_batch_id=batch_id))
+        if not media_objs:
+            print(f"❌ Нет MediaTask для batch-задачи {batch_id}")
+            return
+
+        sdk = get_sdk()
+        operation = sdk.batch.get(batch_id)
+        status = operation.get_status()
+
+        if status.is_running:
+            if attempt >= settings.YANDEX_GPT_POLL_MAX_ATTEMPTS:
+                print(f"❌ Batch-задача {batch_id} не завершилась за {attempt} попыток")
+                MediaTask.objects.filter(gpt_batch_id=batch_id).update(status=MediaTaskStatusChoices.FAILED)
+                return
+            poll_gpt_batch_task.apply_async(
+                (batch_id, attempt + 1),
+                countdown=settings.YANDEX_GPT_BATCH_POLL_INTERVAL,
+            )
+            return
+
+        if status.is_failed:
+            print(f"❌ Batch-задача {batch_id} завершилась с ошибкой: {status}")
+            MediaTask.objects.filter(gpt_batch_id=batch_id).update(status=MediaTaskStatusChoices.FAILED)
+            return
+
+        # --- Сопоставляем строки результата с MediaTask по тексту запроса ---
+        # Одинаковые запросы (один и тот же файл и шаблон у нескольких задач)
+        # получают по одной строке результата каждая
+        by_request = {}
+        for media_obj in media_objs:
+            messages = build_gpt_messages(media_obj)
+            if messages:
+                by_request.setdefault(batch_request_key(messages), []).append(media_obj)
+
+        result_dataset = operation.get_result()
+        processed = 0
+        for record in result_dataset.read():
+            pending = by_request.get(batch_record_request_key(record))
+            if not pending:
+                print("⚠️ Строка результата batch не сопоставлена с MediaTask")
+                continue
+            media_obj = pending.pop(0)
+            usage = batch_record_usage(record)
+            if usage:
+                record_llm_usage(
+                    media_obj, *usage, unit_price=settings.YANDEX_GPT_ASYNC_PRICE_PER_1K_TOKENS
+                )
+            missing_ids = save_gpt_result(media_obj, batch_record_text(record) or "{}")
+            if missing_ids:
+                gpt_reask_task.delay(media_obj.id, missing_ids)
+            processed += 1
+
+        for media_obj in (obj for pending in by_request.values() for obj in pending):
+            print(f"❌ Для MediaTask #{media_obj.id} нет ответа в batch-задаче {batch_id}")
+            media_obj.status = MediaTaskStatusChoices.FAILED
+            media_obj.save(update_fields=["status"])
+
+        print(f"✅ Batch-задача {batch_id} обработана: {processed} ответов")
+
+    except Exception as e:
+        print(f"❌ Ошибка при опросе batch-задачи GPT: {e}")
+
+
+@celery_app.task(queue="processing")
+def save_excel_task_old(media_task_id):
     try:
         media_obj = MediaTask.objects.get(id=media_task_id)
         media_obj.status = MediaTaskStatusChoices.SAVE_EXCEL_START
@@ -514,34 +846,20 @@ def save_excel_task_old(media_task_id):
             print(f"❌ Ошибка парсинга gpt_result: {e}")
             return
 
-        # === Загружаем вопросы из шаблона ===
-        template = getattr(media_obj, "cast_template", None)
-        if not template or not template.questions:
+        # === Загружаем вопросы из закреплённой версии шаблона ===
+        version = get_template_version(media_obj)
+        if not version or not version.questions:
             print(f"⚠️ У MediaTask #{media_obj.id} нет шаблона или вопросов")
             questions_dict = {}
         else:
-            # поле questions — это JSONField, может быть dict или str
-            if isinstance(template.questions, dict):
-                questions_dict = template.questions
-            elif isinstance(template.questions, str):
-                try:
-                    questions_dict = json.loads(template.questions)
-                except json.JSONDecodeError:
-                    print("⚠️ Ошибка парсинга JSON вопросов")
-                    questions_dict = {}
-            else:
-                print("⚠️ Неожиданный тип данных в questions")
-                questions_dict = {}
+            questions_dict = {q["id"]: q["text"] for q in version.questions}
 
-        # === Подготовка путей ===
-        os.makedirs(os.path.join(settings.MEDIA_ROOT, "excel_uploads"), exist_ok=True)
-        local_excel_file_path = os.path.join(
-            settings.MEDIA_ROOT, "excel_uploads", f"{file_base}.xlsx"
-        )
-        object_name = f"excel_uploads/{file_base}.xlsx"
+        # === Имя объекта: каталог задачи исключает перезапись чужих отчётов ===
+        object_name = report_object_name(media_obj)
 
-        # === Создание Excel ===
-        workbook = xlsxwriter.Workbook(local_excel_file_path)
+        # === Создание Excel в памяти ===
+        buffer = new_report_buffer()
+        workbook = xlsxwriter.Workbook(buffer, {"in_memory": True})
         worksheet = workbook.add_worksheet("Ответы")
 
         # Форматы
@@ -579,24 +897,12 @@ def save_excel_task_old(media_task_id):
         worksheet.set_column(2, 2, 100)   # Ответ
 
         workbook.close()
-        print(f"💾 Excel-файл успешно создан: {local_excel_file_path}")
+        print("💾 Excel-файл успешно создан в памяти")
 
-        # === Загрузка в Яндекс Object Storage ===
+        # === Загрузка в Яндекс Object Storage прямо из буфера ===
         print(f"📤 Загружаем файл {object_name} в хранилище...")
-
-        session = boto3.session.Session()
-        s3_client = session.client(
-            service_name="s3",
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-            endpoint_url=ENDPOINT_URL,
-            region_name=REGION,
-        )
-
-        with open(local_excel_file_path, "rb") as f:
-            s3_client.put_object(Bucket=BUCKET_NAME, Key=object_name, Body=f)
-
-        public_url = f"{ENDPOINT_URL}/{BUCKET_NAME}/{object_name}"
+        with buffer:
+            public_url = upload_report(buffer, object_name)
         media_obj.excel_path = public_url
         media_obj.status = MediaTaskStatusChoices.SAVE_EXCEL_FINISH
         media_obj.save(update_fields=["excel_path", "status"])
@@ -633,7 +939,8 @@ def save_excel_task(media_task_id):
         media_obj.save(update_fields=["status"])
 
         # Проверка данных
-        if not media_obj.cast_template or not media_obj.cast_template.excel_file:
+        version = get_template_version(media_obj)
+        if not version or not version.excel_file:
             print("❌ У задачи нет Excel-файла шаблона")
             return
         if not media_obj.gpt_result:
@@ -641,53 +948,16 @@ def save_excel_task(media_task_id):
             return
 
         try:
-            parsed_json = json.loads(media_obj.gpt_result)
+            json.loads(media_obj.gpt_result)
         except json.JSONDecodeError as e:
             print(f"❌ Ошибка парсинга gpt_result: {e}")
             return
 
-        # === Путь к шаблонному файлу Excel ===
-        template_excel_path = media_obj.cast_template.excel_file.path
-
-        # === Открытие Excel и запись ответов в столбец D ===
-        workbook = load_workbook(template_excel_path)
-        sheet = workbook.active
-
-        row = 4  # начинаем с 4 строки
-        for key in sorted(parsed_json.keys(), key=lambda x: int(x)):
-            answer = parsed_json[key]
-            sheet.cell(row=row, column=4).value = answer  # Колонка D = 4
-            row += 1
-
-        # === Сохранение Excel во временный файл ===
+        # === Отчёт из хранилища или рендеринг из закэшированного шаблона ===
         file_base = media_obj.audio_title_saved or f"media_task_{media_obj.id}"
-        local_excel_path = os.path.join(settings.MEDIA_ROOT, "excel_uploads", f"{file_base}.xlsx")
-        os.makedirs(os.path.dirname(local_excel_path), exist_ok=True)
-        workbook.save(local_excel_path)
-        workbook.close()
-
-        print(f"💾 Обновлённый Excel-файл сохранён: {local_excel_path}")
-
-        # === Загрузка в S3 ===
-        session = boto3.session.Session()
-        s3 = session.client(
-            service_name="s3",
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            endpoint_url=settings.ENDPOINT_URL,
-            region_name=settings.REGION,
-        )
-        object_name = f"excel_uploads/{file_base}.xlsx"
-
-        with open(local_excel_path, "rb") as f:
-            s3.put_object(Bucket=settings.BUCKET_NAME, Key=object_name, Body=f)
-
-        public_url = f"{settings.ENDPOINT_URL}/{settings.BUCKET_NAME}/{object_name}"
-        media_obj.excel_path = public_url
+        public_url = ensure_task_report(media_obj, version)
         media_obj.status = MediaTaskStatusChoices.SAVE_EXCEL_FINISH
-        media_obj.save(update_fields=["excel_path", "status"])
-
-        print(f"✅ Файл загружен в S3: {public_url}")
+        media_obj.save(update_fields=["status"])
 
         # === Событие ===
         OutboxEvent.objects.create(
@@ -704,4 +974,54 @@ def save_excel_task(media_task_id):
     except MediaTask.DoesNotExist:
         print(f"❌ MediaTask #{media_task_id} не найден")
     except Exception as e:
-        print(f"❌ Ошибка: {e}")
\ No newline at end of file
+        print(f"❌ Ошибка: {e}")
+
+
+@celery_app.task(queue="processing")
+def export_project_task(export_id):
+    """
+    Формирует сводную выгрузку проекта (ProjectExport) и загружает её в S3.
+    """
+    try:
+        export = ProjectExport.objects.select_related("project").get(id=export_id)
+        export.status = ProjectExportStatusChoices.PROCESSING
+        export.save(update_fields=["status"])
+
+        print(f"📊 Формируем выгрузку #{export.id} проекта #{export.project_id} ({export.export_format})")
+        build_project_export(export)
+
+    except ProjectExport.DoesNotExist:
+        print(f"❌ ProjectExport #{export_id} не найден")
+    except Exception as e:
+        print(f"❌ Ошибка выгрузки проекта: {e}")
+        ProjectExport.objects.filter(id=export_id).update(
+            status=ProjectExportStatusChoices.FAILED,
+            error=str(e),
+            finished_at=timezone.now(),
+        )
+
+
+@celery_app.task(queue="pdf")
+def save_pdf_task(media_task_id):
+    """
+    Формирует PDF-отчёт задачи. Очередь "pdf" отдельная: рендеринг
+    нагружает CPU и не должен задерживать задачи, ждущие провайдеров.
+    """
+    try:
+        media_obj = MediaTask.objects.select_related("project").get(id=media_task_id)
+
+        version = get_template_version(media_obj)
+        if not version or not version.questions:
+            print(f"❌ У MediaTask #{media_task_id} нет шаблона с вопросами")
+            return
+        if not media_obj.gpt_result:
+            print("❌ Нет результата от GPT")
+            return
+
+        public_url = ensure_task_pdf(media_obj, version)
+        print(f"✅ PDF для MediaTask #{media_task_id}: {public_url}")
+
+    except MediaTask.DoesNotExist:
+        print(f"❌ MediaTask #{media_task_id} не найден")
+    except Exception as e:
+        print(f"❌ Ошибка формирования PDF: {e}")
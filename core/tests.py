@@ -1,3 +1,150 @@
-from django.test import TestCase
+import codecs
+import csv
+import io
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from openpyxl import Workbook, load_workbook
+
+from core import excel, exports
+from core.models import CastTemplate, ExportFormatChoices, ExportKindChoices, MediaTask, MediaTaskAnswer, Project, \
+    ProjectExport, TemplateTypeChoices
+
+
+class BinaryOnlyBuffer:
+    """
+    Байтовый буфер без readable()/writable(), как SpooledTemporaryFile
+    в Python 3.10: TextIOWrapper поверх него не создаётся.
+    """
+
+    def __init__(self):
+        self._data = io.BytesIO()
+
+    def write(self, data):
+        return self._data.write(data)
+
+    def seek(self, *args):
+        return self._data.seek(*args)
+
+    def read(self, *args):
+        return self._data.read(*args)
+
+    def getvalue(self):
+        return self._data.getvalue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class ProjectExportCsvTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="exporter", password="x")
+        self.project = Project.objects.create(project_title="Проект", integration=self.user.integration)
+        self.task = MediaTask.objects.create(
+            project=self.project, integration=self.user.integration, audio_uploaded_title="Интервью.wav"
+        )
+
+    def add_answers(self, template_type, questions, answers):
+        template = CastTemplate.objects.create(
+            integration=self.user.integration, title="Шаблон", template_type=template_type, questions=questions
+        )
+        self.task.cast_template = template
+        self.task.template_version = template.current_version
+        self.task.save()
+        for qid, (answer, answer_number) in answers.items():
+            MediaTaskAnswer.objects.create(
+                media_task=self.task,
+                project=self.project,
+                template_version=template.current_version,
+                question_id=qid,
+                answer=answer,
+                answer_number=answer_number,
+            )
+
+    def build(self, **fields):
+        export = ProjectExport.objects.create(project=self.project, **fields)
+        buffer = BinaryOnlyBuffer()
+        with mock.patch.object(exports, "new_report_buffer", return_value=buffer), \
+                mock.patch.object(exports, "upload_report", return_value="https://s3/export.csv"):
+            exports.build_project_export(export)
+        return export, buffer.getvalue()
+
+    def test_report_csv(self):
+        export, data = self.build(export_format=ExportFormatChoices.CSV)
+
+        self.assertEqual(export.rows_count, 1)
+        self.assertTrue(data.startswith(codecs.BOM_UTF8))
+        rows = list(csv.reader(io.StringIO(data.decode("utf-8-sig"))))
+        self.assertEqual(rows[0], exports.FIXED_COLUMNS)
+        self.assertEqual(rows[1][1], "Интервью.wav")
+
+    def test_answer_matrix_csv(self):
+        self.add_answers(
+            TemplateTypeChoices.JTBD,
+            {"1": "Какая задача?", "2": "Что мешает?"},
+            {"1": ("Сэкономить время", None), "2": ("Цена", None)},
+        )
+        export, data = self.build(kind=ExportKindChoices.ANSWER_MATRIX, export_format=ExportFormatChoices.CSV)
+
+        self.assertEqual(export.rows_count, 1)
+        rows = list(csv.reader(io.StringIO(data.decode("utf-8"))))
+        self.assertEqual(rows, [
+            ["media_task_id", "Какая задача?", "Что мешает?"],
+            [str(self.task.id), "Сэкономить время", "Цена"],
+        ])
+
+    def test_answer_matrix_keeps_text_answers_of_score_template(self):
+        self.add_answers(
+            TemplateTypeChoices.SCORE,
+            {"1": "Оценка", "2": "Почему такая оценка?"},
+            {"1": ("8", 8.0), "2": ("Долго ждал ответа", None)},
+        )
+        columns, version_columns, numeric_columns = exports.project_question_columns(self.project)
+        self.assertEqual(numeric_columns, {columns.index("Оценка")})
+
+        export, data = self.build(kind=ExportKindChoices.ANSWER_MATRIX, export_format=ExportFormatChoices.CSV)
+        rows = list(csv.reader(io.StringIO(data.decode("utf-8"))))
+        self.assertEqual(rows[1], [str(self.task.id), "8.0", "Долго ждал ответа"])
+
+
+class TemplateMergedRangesTests(SimpleTestCase):
+    def template_file(self):
+        wb = Workbook()
+        sheet = wb.active
+        sheet["A4"], sheet["B4"], sheet["C4"] = "Тип", "Цель", "Вопрос"
+        sheet.merge_cells("A5:C6")
+        sheet["A5"] = "Объединённый вопрос"
+        sheet.merge_cells("D7:D8")
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        buffer.seek(0)
+        return buffer
+
+    def test_openpyxl_private_attributes(self):
+        # read_merged_ranges читает XML листа через закрытые атрибуты openpyxl:
+        # тест падает, если обновление openpyxl их уберёт
+        wb = load_workbook(self.template_file(), read_only=True)
+        try:
+            self.assertTrue(hasattr(wb, "_archive"))
+            self.assertTrue(hasattr(wb.active, "_worksheet_path"))
+            self.assertEqual(
+                sorted(excel.read_merged_ranges(wb, wb.active, None)),
+                [(1, 5, 3, 6), (4, 7, 4, 8)],
+            )
+        finally:
+            wb.close()
+
+    def test_fallback_without_private_attributes(self):
+        source = self.template_file()
+        ranges = excel.read_merged_ranges(object(), object(), source)
+        self.assertEqual(sorted(ranges), [(1, 5, 3, 6), (4, 7, 4, 8)])
+
+    def test_parse_template_questions(self):
+        questions, cell_map = excel.parse_template_questions(self.template_file())
+        self.assertEqual(list(questions), ["1", "2", "3"])
+        self.assertIn("Объединённый вопрос", questions["3"])
+        self.assertEqual(cell_map, {"1": "D4", "2": "D5", "3": "D6"})
@@ -0,0 +1,170 @@
+"""
+Обработчик загрузки, который передаёт тело запроса прямо в S3.
+
+Куски multipart-запроса копятся до размера части и сразу уходят
+в составную загрузку (ParallelUploader), поэтому файл не пишется
+ни во временный файл, ни целиком в память. Попутно считаются SHA-256
+и параметры WAV по заголовку (длительность, частота, каналы).
+"""
+import hashlib
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+from core.audio import WavHeaderParser
+from core.blobs import delete_object
+from core.uploads import ParallelUploader, media_upload_key
+
+
+class StreamedUploadedFile(UploadedFile):
+    """
+    Файл, который уже лежит в хранилище: данных в нём нет, только
+    ключ, публичный URL и посчитанные при загрузке параметры.
+    """
+
+    def __init__(self, name, content_type, size, charset, content_type_extra,
+                 saved_name, key, storage_url, sha256, media_fields):
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+        self.saved_name = saved_name
+        self.key = key
+        self.storage_url = storage_url
+        self.sha256 = sha256
+        self.media_fields = media_fields
+        self.claimed = False
+
+    def open(self, mode=None):
+        raise ValueError("Файл передан в хранилище и недоступен для чтения")
+
+    def close(self):
+        pass
+
+
+class S3StreamingUploadHandler(FileUploadHandler):
+    """
+    Берёт на себя файлы с разрешёнными расширениями; остальные уходят
+    стандартным обработчикам. Должен стоять первым в request.upload_handlers
+    и ставиться до первого обращения к request.POST / request.FILES.
+    Ошибка хранилища не прерывает разбор запроса: она сохраняется в error.
+
+    Загрузка завершается ещё при разборе тела — до проверки CSRF и формы.
+    Файлы, которые вьюха не забрала в задачу (claim), удаляются из
+    хранилища через discard_unclaimed().
+    """
+
+    def __init__(self, request=None, extensions=("wav",), **session_fields):
+        super().__init__(request)
+        self.extensions = extensions
+        self.session_fields = session_fields
+        self.uploader = None
+        self.active = False
+        self.error = None
+        self.files = []
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.uploader = None
+        self.active = False
+        if file_name.split(".")[-1].lower() not in self.extensions:
+            return
+
+        self.saved_name, self.key = media_upload_key(file_name)
+        self.digest = hashlib.sha256()
+        self.wav_header = WavHeaderParser()
+        self.size = 0
+        self.buffer = bytearray()
+        try:
+            uploader = ParallelUploader()
+            # Размер файла заранее неизвестен; длина запроса — его верхняя оценка
+            uploader.open(
+                self.key,
+                size_hint=int(self.request.META.get("CONTENT_LENGTH") or 0) or None,
+                original_name=file_name,
+                saved_name=self.saved_name,
+                **self.session_fields
+            )
+        except Exception as e:
+            # Хранилище недоступно — файл примут стандартные обработчики
+            print(f"⚠️ Потоковая загрузка {file_name} не началась: {e}")
+            return
+        self.uploader = uploader
+        self.active = True
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if self.uploader is None:
+            # Загрузка уже сорвалась: остаток файла отбрасывается
+            return None
+
+        self.digest.update(raw_data)
+        self.wav_header.feed(raw_data)
+        self.size += len(raw_data)
+        self.buffer.extend(raw_data)
+        try:
+            if len(self.buffer) >= self.uploader.next_part_size():
+                self.uploader.send_part(bytes(self.buffer))
+                self.buffer = bytearray()
+        except Exception as e:
+            self._fail(e)
+        return None
+
+    def file_complete(self, file_size):
+        if self.uploader is None:
+            return None
+        try:
+            if self.buffer:
+                self.uploader.send_part(bytes(self.buffer))
+                self.buffer = bytearray()
+            public_url = self.uploader.complete()
+        except Exception as e:
+            self._fail(e)
+            return None
+
+        uploader, self.uploader = self.uploader, None
+        uploader.session.total_size = self.size
+        uploader.session.save(update_fields=["total_size", "updated_at"])
+        streamed_file = StreamedUploadedFile(
+            name=self.file_name,
+            content_type=self.content_type,
+            size=self.size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+            saved_name=self.saved_name,
+            key=self.key,
+            storage_url=public_url,
+            sha256=self.digest.hexdigest(),
+            media_fields=self.wav_header.media_fields(self.size),
+        )
+        self.files.append(streamed_file)
+        return streamed_file
+
+    def claim(self, streamed_file):
+        streamed_file.claimed = True
+
+    def discard_unclaimed(self):
+        """
+        Удаляет загруженные объекты, по которым не создана задача: запрос
+        отклонён (CSRF, форма, тип файла) или обработка завершилась ошибкой.
+        """
+        for streamed_file in self.files:
+            if not streamed_file.claimed:
+                delete_object(streamed_file.key)
+        self.files = []
+
+    def upload_interrupted(self):
+        # Клиент оборвал запрос — части в хранилище больше не нужны
+        if self.uploader is not None:
+            self.uploader.abort()
+            self.uploader = None
+
+    def _fail(self, error):
+        print(f"❌ Ошибка потоковой загрузки {self.file_name}: {error}")
+        self.error = error
+        if self.uploader is not None:
+            try:
+                self.uploader.abort()
+            except Exception as e:
+                print(f"⚠️ Не удалось отменить загрузку: {e}")
+            self.uploader = None
+        self.buffer = bytearray()
@@ -0,0 +1,513 @@
+"""
+Загрузка медиафайлов в объектное хранилище.
+
+Любая составная загрузка ведётся через UploadSession: в ней хранятся
+UploadId и подтверждённые части с ETag. Незавершённую загрузку можно
+продолжить с последней подтверждённой части, а брошенные сессии
+(и multipart-загрузки без сессии) отменяет cleanup_uploads_task.
+
+Серверная загрузка (ParallelUploader): части отправляются параллельно
+пулом потоков, размер части подстраивается под размер файла и измеренную
+скорость, а объём прочитанных, но ещё не отправленных данных ограничен.
+
+Прямая загрузка из браузера: сервер открывает сессию и выдаёт подписанные
+URL частей, браузер отправляет части PUT-запросами прямо в S3, а после
+завершения сервер только собирает объект и создаёт MediaTask.
+"""
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core import storage
+from core.models import UploadSession, UploadSessionStatusChoices
+
+
+MB = 1024 * 1024
+# Ограничения S3 на составную загрузку
+MIN_PART_SIZE = 5 * MB
+MAX_PARTS = 10000
+
+MEDIA_UPLOADS_PREFIX = "media_uploads/"
+
+
+def media_upload_key(original_name):
+    """
+    Имя сохранённого файла и ключ объекта для загружаемого медиафайла.
+    """
+    saved_name = f"{timezone.now().strftime('%Y%m%d%H%M%S')}_{original_name}"
+    return saved_name, f"{MEDIA_UPLOADS_PREFIX}{saved_name}"
+
+
+# === Сессии составной загрузки ===
+def open_upload_session(key, total_size=None, part_size=None, **fields):
+    """
+    Открывает multipart-загрузку в S3 и сохраняет её сессию.
+    fields — project, user, original_name, saved_name.
+    """
+    response = storage.get_client().create_multipart_upload(
+        Bucket=settings.BUCKET_NAME,
+        Key=key,
+        ACL="public-read",
+    )
+    return UploadSession.objects.create(
+        key=key,
+        upload_id=response["UploadId"],
+        total_size=total_size,
+        part_size=part_size,
+        **fields
+    )
+
+
+def get_active_session(session_id, user):
+    """
+    Активная сессия пользователя; бросает UploadSession.DoesNotExist.
+    """
+    return UploadSession.objects.get(
+        pk=session_id,
+        user=user,
+        status=UploadSessionStatusChoices.ACTIVE,
+    )
+
+
+def record_session_parts(session, parts):
+    """
+    Добавляет подтверждённые части [{"PartNumber", "ETag", "Size"?}] в сессию.
+    Строка блокируется, чтобы параллельные запросы не затирали друг друга.
+    """
+    if not parts:
+        return session
+    with transaction.atomic():
+        locked = UploadSession.objects.select_for_update().get(pk=session.pk)
+        for part in parts:
+            locked.parts[str(part["PartNumber"])] = {
+                "ETag": part["ETag"],
+                "Size": part.get("Size") or _expected_part_size(locked, part["PartNumber"]),
+            }
+        locked.save(update_fields=["parts", "updated_at"])
+    session.parts = locked.parts
+    return session
+
+
+def _expected_part_size(session, part_number):
+    if not session.part_size or session.total_size is None:
+        return None
+    start = (part_number - 1) * session.part_size
+    return max(min(session.part_size, session.total_size - start), 0)
+
+
+def sync_session_parts(session):
+    """
+    Сверяет подтверждённые части сессии со списком частей в S3:
+    хранилище — источник истины (браузер мог не успеть сообщить о части).
+    """
+    s3_client = storage.get_client()
+    parts = {}
+    kwargs = {"Bucket": settings.BUCKET_NAME, "Key": session.key, "UploadId": session.upload_id}
+    while True:
+        response = s3_client.list_parts(**kwargs)
+        for part in response.get("Parts", []):
+            parts[str(part["PartNumber"])] = {"ETag": part["ETag"], "Size": part["Size"]}
+        if not response.get("IsTruncated"):
+            break
+        kwargs["PartNumberMarker"] = response["NextPartNumberMarker"]
+
+    session.parts = parts
+    session.save(update_fields=["parts", "updated_at"])
+    return session
+
+
+def session_parts_list(session):
+    return sorted(
+        ({"PartNumber": int(n), "ETag": part["ETag"]} for n, part in session.parts.items()),
+        key=lambda part: part["PartNumber"],
+    )
+
+
+def complete_upload_session(session, parts=None):
+    """
+    Собирает объект из частей сессии и возвращает его URL.
+    parts — список частей для сборки; по умолчанию все подтверждённые.
+    """
+    storage.get_client().complete_multipart_upload(
+        Bucket=settings.BUCKET_NAME,
+        Key=session.key,
+        UploadId=session.upload_id,
+        MultipartUpload={"Parts": parts or session_parts_list(session)},
+    )
+    session.status = UploadSessionStatusChoices.COMPLETED
+    session.save(update_fields=["status", "updated_at"])
+    return storage.object_url(session.key)
+
+
+def abort_upload_session(session):
+    storage.get_client().abort_multipart_upload(
+        Bucket=settings.BUCKET_NAME,
+        Key=session.key,
+        UploadId=session.upload_id,
+    )
+    session.status = UploadSessionStatusChoices.ABORTED
+    session.save(update_fields=["status", "updated_at"])
+    print(f"🗑 Составная загрузка {session.key} отменена")
+
+
+def abort_stale_uploads(max_age=None):
+    """
+    Отменяет брошенные загрузки старше max_age секунд: активные сессии,
+    которые давно не обновлялись, и multipart-загрузки в бакете, у которых
+    нет активной сессии. Возвращает число отменённых загрузок.
+    """
+    max_age = max_age or settings.UPLOAD_SESSION_MAX_AGE
+    threshold = timezone.now() - timedelta(seconds=max_age)
+    s3_client = storage.get_client()
+    aborted = 0
+
+    stale = UploadSession.objects.filter(status=UploadSessionStatusChoices.ACTIVE, updated_at__lt=threshold)
+    for session in stale.iterator():
+        try:
+            abort_upload_session(session)
+        except s3_client.exceptions.NoSuchUpload:
+            session.status = UploadSessionStatusChoices.ABORTED
+            session.save(update_fields=["status", "updated_at"])
+        aborted += 1
+
+    active_ids = set(
+        UploadSession.objects
+        .filter(status=UploadSessionStatusChoices.ACTIVE)
+        .values_list("upload_id", flat=True)
+    )
+    kwargs = {"Bucket": settings.BUCKET_NAME, "Prefix": MEDIA_UPLOADS_PREFIX}
+    while True:
+        response = s3_client.list_multipart_uploads(**kwargs)
+        for upload in response.get("Uploads", []):
+            if upload["UploadId"] in active_ids or upload["Initiated"] >= threshold:
+                continue
+            s3_client.abort_multipart_upload(
+                Bucket=settings.BUCKET_NAME,
+                Key=upload["Key"],
+                UploadId=upload["UploadId"],
+            )
+            print(f"🗑 Отменена брошенная загрузка без сессии: {upload['Key']}")
+            aborted += 1
+        if not response.get("IsTruncated"):
+            break
+        kwargs["KeyMarker"] = response["NextKeyMarker"]
+        kwargs["UploadIdMarker"] = response["NextUploadIdMarker"]
+
+    return aborted
+
+
+# === Прямая загрузка из браузера ===
+def direct_part_size(total_size):
+    """
+    Размер части: настроенный по умолчанию, но не меньше, чем нужно,
+    чтобы уложиться в MAX_PARTS частей. Округляется до мегабайта.
+    """
+    part_size = max(settings.DIRECT_UPLOAD_PART_SIZE, MIN_PART_SIZE, math.ceil(total_size / MAX_PARTS))
+    return math.ceil(part_size / MB) * MB
+
+
+def direct_session_state(session):
+    """
+    Параметры загрузки для браузера, включая уже подтверждённые части.
+    """
+    return {
+        "session_id": session.pk,
+        "part_size": session.part_size,
+        "part_count": max(1, math.ceil(session.total_size / session.part_size)),
+        "parts": {n: part["ETag"] for n, part in session.parts.items()},
+    }
+
+
+def start_direct_upload(project, user, original_name, total_size):
+    """
+    Открывает сессию прямой загрузки и возвращает параметры для браузера.
+    """
+    saved_name, key = media_upload_key(original_name)
+    part_size = direct_part_size(total_size)
+    session = open_upload_session(
+        key,
+        total_size=total_size,
+        part_size=part_size,
+        project=project,
+        user=user,
+        original_name=original_name,
+        saved_name=saved_name,
+    )
+    print(f"🧩 Прямая загрузка {key} открыта: {total_size} байт, части по {part_size // MB} MB")
+    return direct_session_state(session)
+
+
+def presign_part_urls(session, part_numbers):
+    return {
+        part_number: storage.presign(
+            "upload_part",
+            settings.DIRECT_UPLOAD_URL_EXPIRES,
+            Key=session.key,
+            UploadId=session.upload_id,
+            PartNumber=part_number,
+        )
+        for part_number in part_numbers
+    }
+
+
+class ThroughputMeter:
+    """
+    Скользящая (EMA) оценка скорости отправки одной части, байт/с.
+    Общая на процесс, чтобы следующая загрузка сразу брала удачный размер.
+    """
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.bytes_per_second = None
+        self._lock = threading.Lock()
+
+    def add(self, size, seconds):
+        if seconds <= 0:
+            return
+        sample = size / seconds
+        with self._lock:
+            if self.bytes_per_second is None:
+                self.bytes_per_second = sample
+            else:
+                self.bytes_per_second = self.alpha * sample + (1 - self.alpha) * self.bytes_per_second
+
+
+throughput = ThroughputMeter()
+
+
+class ParallelUploader:
+    """
+    Составная загрузка в S3 с параллельной отправкой частей.
+
+    Один экземпляр — одна загрузка. Данные можно отдавать двумя способами:
+    upload() сам читает файловый объект последовательно в вызывающем потоке
+    (объекты загрузки Django не потокобезопасны), а open()/send_part()/
+    complete() позволяют передавать части по мере поступления (см.
+    core.upload_handlers). Части отправляются пулом из max_workers потоков,
+    в памяти одновременно не больше max_in_flight_bytes данных.
+    """
+
+    def __init__(self, max_workers=None, max_in_flight_bytes=None, target_part_seconds=None, max_part_size=None):
+        self.max_workers = max_workers or settings.UPLOAD_MAX_WORKERS
+        self.max_in_flight_bytes = max_in_flight_bytes or settings.UPLOAD_MAX_IN_FLIGHT_BYTES
+        self.target_part_seconds = target_part_seconds or settings.UPLOAD_TARGET_PART_SECONDS
+        self.max_part_size = max_part_size or settings.UPLOAD_MAX_PART_SIZE
+        self.s3_client = storage.get_client()
+
+        self.session = None
+        self.size_hint = None
+        self.parts = []
+        self.in_flight = {}
+        self.reserved_parts = 0
+        self.uploaded_size = 0
+        self.resumed_size = 0
+        self._pool = None
+        self._started = None
+
+    def part_size(self, total_size, uploaded_size, parts_used):
+        """
+        Размер следующей части. Пока скорость неизвестна — файл делится
+        примерно на 4 части на поток; дальше часть должна отправляться
+        за target_part_seconds. Оставшиеся данные обязаны уложиться в MAX_PARTS.
+        """
+        if throughput.bytes_per_second:
+            size = throughput.bytes_per_second * self.target_part_seconds
+        elif total_size:
+            size = total_size / (self.max_workers * 4)
+        else:
+            size = MIN_PART_SIZE
+
+        size = min(max(size, MIN_PART_SIZE), self.max_part_size)
+        if total_size:
+            remaining = max(total_size - uploaded_size, 0)
+            size = max(size, math.ceil(remaining / max(MAX_PARTS - parts_used, 1)))
+        return math.ceil(size / MB) * MB
+
+    def parts_used(self):
+        return len(self.parts) + len(self.in_flight) + self.reserved_parts
+
+    def next_part_size(self):
+        return self.part_size(self.size_hint, self.uploaded_size, self.parts_used())
+
+    def _upload_part(self, key, upload_id, part_number, chunk):
+        started = time.monotonic()
+        response = self.s3_client.upload_part(
+            Bucket=settings.BUCKET_NAME,
+            Key=key,
+            PartNumber=part_number,
+            UploadId=upload_id,
+            Body=chunk,
+        )
+        throughput.add(len(chunk), time.monotonic() - started)
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def open(self, key, total_size=None, session=None, size_hint=None, **session_fields):
+        """
+        Начинает загрузку (или подхватывает переданную сессию).
+        size_hint — верхняя оценка размера, если точный неизвестен.
+        """
+        if session is None:
+            session = open_upload_session(key, total_size=total_size, **session_fields)
+        self.session = session
+        self.size_hint = total_size or size_hint
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="s3-part")
+        self._started = time.monotonic()
+        print(f"🧩 Составная загрузка {key}: до {self.max_workers} частей параллельно")
+        return session
+
+    def resume(self, fileobj):
+        """
+        Продолжение загрузки: берёт непрерывный префикс подтверждённых частей
+        (части после пропуска будут перезаписаны) и перематывает файл за него.
+        """
+        session = sync_session_parts(self.session)
+        for part_number, info in sorted(session.parts.items(), key=lambda item: int(item[0])):
+            if int(part_number) != len(self.parts) + 1:
+                break
+            self.parts.append({"PartNumber": int(part_number), "ETag": info["ETag"]})
+            self.uploaded_size += info["Size"]
+        self.resumed_size = self.uploaded_size
+        fileobj.seek(self.uploaded_size)
+        if self.parts:
+            print(
+                f"⏯ Продолжаем {session.key} с части {len(self.parts) + 1} "
+                f"({self.uploaded_size / MB:.1f} MB уже в хранилище)"
+            )
+
+    def wait_for_capacity(self, size):
+        """
+        Ждёт, пока отправляемые части освободят память под ещё size байт.
+        """
+        while self.in_flight and sum(self.in_flight.values()) + size > self.max_in_flight_bytes:
+            done, _ = wait(self.in_flight, return_when=FIRST_COMPLETED)
+            self._confirm(done)
+
+    def reserve_part(self):
+        """
+        Резервирует номер следующей части, чтобы отправить её позже через
+        send_part(chunk, part_number) — например, заголовок файла, который
+        становится известен только в конце.
+        """
+        self.reserved_parts += 1
+        return self.parts_used()
+
+    def send_part(self, chunk, part_number=None):
+        self.wait_for_capacity(len(chunk))
+        if part_number is None:
+            part_number = self.parts_used() + 1
+        else:
+            self.reserved_parts -= 1
+        future = self._pool.submit(self._upload_part, self.session.key, self.session.upload_id, part_number, chunk)
+        self.in_flight[future] = len(chunk)
+        self.uploaded_size += len(chunk)
+
+    def _confirm(self, futures):
+        """
+        Забирает результаты отправленных частей и сохраняет их в сессии.
+        """
+        confirmed = []
+        error = None
+        for future in futures:
+            size = self.in_flight.pop(future)
+            try:
+                confirmed.append(dict(future.result(), Size=size))
+            except Exception as e:
+                error = error or e
+        # Успешные части сохраняем даже при ошибке соседней — их не придётся перезагружать
+        record_session_parts(self.session, confirmed)
+        self.parts.extend({"PartNumber": part["PartNumber"], "ETag": part["ETag"]} for part in confirmed)
+        if error is not None:
+            raise error
+
+    def complete(self):
+        """
+        Дожидается всех частей, собирает объект и возвращает его URL.
+        """
+        self._confirm(list(self.in_flight))
+        self._pool.shutdown()
+        if not self.parts:
+            raise ValueError("Пустой файл")
+
+        public_url = complete_upload_session(
+            self.session, sorted(self.parts, key=lambda part: part["PartNumber"])
+        )
+        elapsed = time.monotonic() - self._started
+        sent_size = self.uploaded_size - self.resumed_size
+        print(
+            f"🎉 {self.session.key}: {self.uploaded_size / MB:.1f} MB, {len(self.parts)} частей "
+            f"за {elapsed:.1f} с ({sent_size / MB / max(elapsed, 0.001):.1f} MB/с)"
+        )
+        return public_url
+
+    def abort(self, keep_session=False):
+        """
+        Останавливает загрузку. С keep_session=True сессия остаётся активной,
+        чтобы следующая попытка продолжила её с подтверждённых частей.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+        if self.session is None:
+            return
+        if keep_session:
+            print(f"⏸ Загрузка {self.session.key} прервана, сессия #{self.session.pk} сохранена для продолжения")
+        else:
+            abort_upload_session(self.session)
+
+    def upload(self, fileobj, key, total_size=None, session=None, abort_on_error=True, **session_fields):
+        """
+        Загружает fileobj под ключом key и возвращает публичный URL.
+
+        session — ранее начатая сессия этого же файла: загрузка продолжается
+        с последней подтверждённой части. При abort_on_error=False сессия
+        после ошибки остаётся активной, чтобы следующая попытка её продолжила
+        (источник должен поддерживать seek).
+        """
+        if session is None and total_size is not None and total_size < 2 * MIN_PART_SIZE:
+            return storage.put_bytes(key, fileobj.read(), public=True)
+
+        resuming = session is not None
+        self.open(key, total_size=total_size, session=session, **session_fields)
+        try:
+            if resuming:
+                self.resume(fileobj)
+            while True:
+                size = self.next_part_size()
+                # Не читаем дальше, пока отправляемые части не освободят память
+                self.wait_for_capacity(size)
+                chunk = fileobj.read(size)
+                if not chunk:
+                    break
+                self.send_part(chunk)
+            return self.complete()
+        except BaseException:
+            self.abort(keep_session=not abort_on_error)
+            raise
+
+
+def upload_media_file(fileobj, key, total_size=None, resumable=False, **session_fields):
+    """
+    Загружает медиафайл через ParallelUploader. С resumable=True продолжает
+    активную сессию того же ключа и размера и не отменяет её при ошибке.
+    """
+    session = None
+    if resumable:
+        session = (
+            UploadSession.objects
+            .filter(key=key, total_size=total_size, status=UploadSessionStatusChoices.ACTIVE)
+            .order_by("-created_at")
+            .first()
+        )
+    return ParallelUploader().upload(
+        fileobj,
+        key,
+        total_size=total_size,
+        session=session,
+        abort_on_error=not resumable,
+        **session_fields
+    )
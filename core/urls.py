@@ -7,12 +7,22 @@ urlpatterns = [
     path('', views.HomeView.as_view(), name='home'),
     path('projects/create/', views.ProjectCreateView.as_view(), name='project-create'),
     path('projects/<int:pk>/', views.ProjectTaskListView.as_view(), name='project-tasks'),
+    path('projects/<int:pk>/export/', views.ProjectExportView.as_view(), name='project-export'),
+    path('projects/<int:pk>/uploads/init/', views.DirectUploadInitView.as_view(), name='direct-upload-init'),
+    path('projects/<int:pk>/uploads/check/', views.DirectUploadCheckView.as_view(), name='direct-upload-check'),
+    path('projects/<int:pk>/uploads/bulk/', views.BulkUploadView.as_view(), name='bulk-upload'),
+    path('uploads/parts/', views.DirectUploadPartsView.as_view(), name='direct-upload-parts'),
+    path('uploads/resume/', views.DirectUploadResumeView.as_view(), name='direct-upload-resume'),
+    path('uploads/complete/', views.DirectUploadCompleteView.as_view(), name='direct-upload-complete'),
+    path('uploads/abort/', views.DirectUploadAbortView.as_view(), name='direct-upload-abort'),
     path('main/', views.MainView.as_view(), name='main'),
     path('uploads/', views.MainUploadsView.as_view(), name='main-uploads'),
     path("upload-success/<int:pk>/", views.UploadSuccessView.as_view(), name="upload_success"),
     path("integration-settings/", views.IntegrationSettingsView.as_view(), name="integration_settings"),
     path("my-templates/", views.MyTemplatesView.as_view(), name="my_templates"),
     path("my-tasks/", views.MyTasksView.as_view(), name="my_tasks"),
+    path("tasks/<int:pk>/excel/", views.MediaTaskExcelView.as_view(), name="media_task_excel"),
+    path("tasks/<int:pk>/pdf/", views.MediaTaskPdfView.as_view(), name="media_task_pdf"),
     path("templates/create/", views.CastTemplateCreateView.as_view(), name="template_create"),
     path("templates/<int:pk>/edit/", views.CastTemplateUpdateView.as_view(), name="template_edit"),
     path('register/', views.RegisterView.as_view(), name='register'),
@@ -0,0 +1,140 @@
+"""
+Учёт токенов и стоимости обработки MediaTask.
+
+Каждый этап пишет UsageRecord, после чего итоги сворачиваются
+в MediaTask.token_count и MediaTask.total_price.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db.models import Count, F, Sum
+
+from core.models import UsageRecord, UsageStageChoices
+
+
+def _record(media_obj, stage, provider, unit_price, cost, **amounts):
+    record = UsageRecord.objects.create(
+        media_task=media_obj,
+        project_id=media_obj.project_id,
+        integration_id=media_obj.integration_id,
+        cast_template_id=media_obj.cast_template_id,
+        stage=stage,
+        provider=provider,
+        unit_price=unit_price,
+        cost=cost.quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP),
+        **amounts,
+    )
+    rollup_media_task_usage(media_obj)
+    return record
+
+
+def record_transcription_usage(media_obj, audio_seconds, provider="nexara"):
+    """
+    Стоимость транскрибации считается по минутам аудио.
+    """
+    audio_seconds = float(audio_seconds or 0)
+    unit_price = Decimal(settings.NEXARA_PRICE_PER_MINUTE)
+    cost = Decimal(str(audio_seconds)) / Decimal(60) * unit_price
+    return _record(
+        media_obj,
+        UsageStageChoices.TRANSCRIPTION,
+        provider,
+        unit_price,
+        cost,
+        audio_seconds=audio_seconds,
+    )
+
+
+def record_llm_usage(media_obj, input_tokens, output_tokens, provider="yandexgpt", unit_price=None):
+    """
+    Стоимость LLM считается за 1000 токенов (вход + выход).
+    """
+    input_tokens = int(input_tokens or 0)
+    output_tokens = int(output_tokens or 0)
+    if unit_price is None:
+        unit_price = settings.YANDEX_GPT_PRICE_PER_1K_TOKENS
+    unit_price = Decimal(unit_price)
+    cost = Decimal(input_tokens + output_tokens) / Decimal(1000) * unit_price
+    return _record(
+        media_obj,
+        UsageStageChoices.DATA_EXTRACTION,
+        provider,
+        unit_price,
+        cost,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+    )
+
+
+def record_gpt_result_usage(media_obj, result, unit_price=None):
+    """
+    Записывает потребление по результату YandexGPT (GPTModelResult.usage).
+    """
+    usage = getattr(result, "usage", None)
+    if usage is None:
+        print(f"⚠️ В ответе GPT нет статистики токенов для MediaTask #{media_obj.id}")
+        return None
+    print(f"🔢 Токены: вход {usage.input_text_tokens}, выход {usage.completion_tokens}")
+    return record_llm_usage(
+        media_obj,
+        usage.input_text_tokens,
+        usage.completion_tokens,
+        unit_price=unit_price,
+    )
+
+
+def rollup_media_task_usage(media_obj):
+    totals = media_obj.usage_records.aggregate(
+        tokens=Sum(F("input_tokens") + F("output_tokens")),
+        cost=Sum("cost"),
+    )
+    media_obj.token_count = totals["tokens"] or 0
+    media_obj.total_price = (totals["cost"] or Decimal(0)).quantize(
+        Decimal("0.01"), rounding=ROUND_HALF_UP
+    )
+    media_obj.save(update_fields=["token_count", "total_price"])
+
+
+def _usage_summary(queryset, group_field):
+    return (
+        queryset
+        .values(group_field)
+        .annotate(
+            tasks=Count("media_task", distinct=True),
+            input_tokens=Sum("input_tokens"),
+            output_tokens=Sum("output_tokens"),
+            audio_seconds=Sum("audio_seconds"),
+            cost=Sum("cost"),
+        )
+        .order_by("-cost")
+    )
+
+
+def usage_by_project(integration, since=None):
+    """
+    Итоги потребления по проектам интеграции, самые дорогие — первыми.
+    """
+    queryset = UsageRecord.objects.filter(integration=integration)
+    if since:
+        queryset = queryset.filter(created_at__gte=since)
+    return _usage_summary(queryset, "project")
+
+
+def usage_by_template(integration, since=None):
+    """
+    Итоги потребления по шаблонам интеграции, самые дорогие — первыми.
+    """
+    queryset = UsageRecord.objects.filter(integration=integration)
+    if since:
+        queryset = queryset.filter(created_at__gte=since)
+    return _usage_summary(queryset, "cast_template")
+
+
+def usage_by_media_task(project, since=None):
+    """
+    Самые дорогие интервью проекта.
+    """
+    queryset = UsageRecord.objects.filter(project=project)
+    if since:
+        queryset = queryset.filter(created_at__gte=since)
+    return _usage_summary(queryset, "media_task")
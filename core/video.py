@@ -0,0 +1,113 @@
+"""
+Извлечение аудиодорожки из видео для транскрибации.
+
+ffmpeg (локальный бинарник, settings.FFMPEG_BINARY) декодирует только
+аудиопоток контейнера и пишет в stdout компактный моно WAV для речи;
+вывод сразу уходит в хранилище составной загрузкой, без файла на диске.
+При записи в трубу ffmpeg не может вернуться и проставить размеры
+в заголовке, поэтому первая часть (с заголовком) отправляется последней,
+когда размер файла уже известен.
+"""
+import subprocess
+import tempfile
+
+from django.conf import settings
+
+from core import storage
+from core.audio import WavHeaderParser, patch_wav_sizes
+from core.uploads import ParallelUploader
+
+
+WAV_CONTENT_TYPE = "audio/wav"
+FFMPEG_ERROR_TAIL = 2000
+
+
+class AudioExtractionError(Exception):
+    pass
+
+
+def ffmpeg_command(path):
+    return [
+        settings.FFMPEG_BINARY,
+        "-nostdin",
+        "-hide_banner",
+        "-loglevel", "error",
+        "-i", path,
+        "-map", "0:a:0",
+        "-vn",
+        "-ac", "1",
+        "-ar", str(settings.AUDIO_EXTRACT_SAMPLE_RATE),
+        "-c:a", "pcm_s16le",
+        "-f", "wav",
+        "pipe:1",
+    ]
+
+
+def _upload_stream(stdout, key, **session_fields):
+    """
+    Загружает WAV из stdout ffmpeg. Возвращает (url, размер, парсер заголовка).
+    """
+    uploader = ParallelUploader()
+    header = stdout.read(uploader.next_part_size())
+    parser = WavHeaderParser()
+    parser.feed(header)
+    if not parser.valid:
+        return None, len(header), parser
+
+    chunk = stdout.read(uploader.next_part_size())
+    if not chunk:
+        # Короткая запись умещается в один запрос
+        total_size = len(header)
+        public_url = storage.put_bytes(
+            key, patch_wav_sizes(header, parser.data_offset, total_size), WAV_CONTENT_TYPE, public=True
+        )
+        return public_url, total_size, parser
+
+    uploader.open(key, **session_fields)
+    try:
+        header_part = uploader.reserve_part()
+        while chunk:
+            uploader.send_part(chunk)
+            size = uploader.next_part_size()
+            uploader.wait_for_capacity(size)
+            chunk = stdout.read(size)
+        total_size = uploader.uploaded_size + len(header)
+        uploader.send_part(patch_wav_sizes(header, parser.data_offset, total_size), part_number=header_part)
+        return uploader.complete(), total_size, parser
+    except BaseException:
+        uploader.abort()
+        raise
+
+
+def extract_audio(path, key, **session_fields):
+    """
+    Извлекает аудио из видеофайла path в объект key хранилища.
+    Возвращает (url, размер в байтах, поля MediaTask с параметрами аудио).
+    """
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            ffmpeg_command(path),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+        )
+        try:
+            public_url, total_size, parser = _upload_stream(process.stdout, key, **session_fields)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            process.stdout.close()
+        returncode = process.wait()
+
+        if returncode != 0 or public_url is None:
+            stderr.seek(0)
+            message = stderr.read().decode("utf-8", "replace")[-FFMPEG_ERROR_TAIL:].strip()
+            if public_url is not None:
+                storage.delete(key)
+            raise AudioExtractionError(
+                f"ffmpeg завершился с кодом {returncode}: {message or 'нет аудиодорожки'}"
+            )
+
+    return public_url, total_size, parser.media_fields(total_size)
@@ -1,25 +1,51 @@
+import json
 import os
 
 from botocore.exceptions import BotoCoreError, ClientError
 from django.contrib import messages
+from django.db import transaction
 from django.utils import timezone
-from mutagen import File as MutagenFile
-from boto3.session import Session
 from django import forms
 from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login
 from django.contrib.auth.views import LoginView
 from django.contrib.auth.forms import UserCreationForm
 from django.views import View
 from django.views.generic import CreateView, TemplateView, ListView, UpdateView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.views.generic.edit import FormMixin
-from openpyxl import load_workbook
 
+from core.audio import probe_media, probe_media_path
+from core.bulk import BulkUploadError, BulkUploader, collect_bulk_items
+from core.blobs import SHA256_RE, acquire_blob, dedupe_upload, find_blob, release_blob
+from core import storage
+from core.excel import ensure_task_report
+from core.gpt import get_template_version
+from core.pdf import ensure_task_pdf
+from core.upload_handlers import S3StreamingUploadHandler, StreamedUploadedFile
+from core.uploads import (
+    MAX_PARTS,
+    MB,
+    abort_upload_session,
+    complete_upload_session,
+    direct_session_state,
+    get_active_session,
+    media_upload_key,
+    presign_part_urls,
+    record_session_parts,
+    start_direct_upload,
+    sync_session_parts,
+    upload_media_file,
+)
 from core.models import MediaTask, OutboxEvent, EventTypeChoices, CastTemplate, Project, MediaTaskStatusChoices, \
-    IntegrationSettings, UploadChoices
+    IntegrationSettings, UploadChoices, ProjectExport, ExportFormatChoices, ExportKindChoices, \
+    TemplateParseStatusChoices, UploadSession
+from core.tasks import export_project_task, hash_upload_task, parse_template_task
 
 
 class HomeView(LoginRequiredMixin, ListView):
@@ -66,6 +92,41 @@ class VideoUploadForm(forms.Form):
     )
 
 
+def create_uploaded_media_task(project, user, original_name, saved_name, public_url, upload_mode, **media_fields):
+    """
+    Создаёт MediaTask для загруженного в хранилище аудио и событие
+    AUDIO_UPLOADED_TO_YANDEX, с которого начинается обработка.
+    media_fields — известные при загрузке поля задачи (хэш, длительность,
+    частота и каналы аудио).
+    """
+    ext = original_name.split(".")[-1].lower()
+    media_task = MediaTask.objects.create(
+        project=project,
+        integration=user.integration,
+        audio_uploaded_title=original_name,
+        audio_title_saved=saved_name,
+        audio_extension_uploaded=ext,
+        audio_storage_url=public_url,
+        status=MediaTaskStatusChoices.LOADED,
+        **media_fields
+    )
+
+    OutboxEvent.objects.create(
+        media_task=media_task,
+        event_type=EventTypeChoices.AUDIO_UPLOADED_TO_YANDEX,
+        payload={
+            "filename": saved_name,
+            "extension": ext,
+            "uploaded_by": user.username,
+            "project_id": project.pk,
+            "storage_url": public_url,
+            "upload_mode": upload_mode,
+        },
+    )
+    return media_task
+
+
+@method_decorator(csrf_exempt, name="dispatch")
 class ProjectTaskListView(LoginRequiredMixin, FormMixin, ListView):
     model = MediaTask
     template_name = "project_tasks.html"
@@ -84,6 +145,9 @@ class ProjectTaskListView(LoginRequiredMixin, FormMixin, ListView):
         context = super().get_context_data(**kwargs)
         context["project"] = self.project
         context["form"] = self.get_form()
+        context["exports"] = self.project.exports.all()[:5]
+        context["dedup_hash_max_bytes"] = settings.DEDUP_CLIENT_HASH_MAX_BYTES
+        context["bulk_form"] = BulkUploadForm(integration=self.request.user.integration)
         return context
 
     def post(self, request, *args, **kwargs):
@@ -92,8 +156,29 @@ class ProjectTaskListView(LoginRequiredMixin, FormMixin, ListView):
             pk=self.kwargs["pk"],
             integration=request.user.integration
         )
+        self.streaming_handler = None
+        if settings.UPLOAD_STREAMING:
+            # Обработчик ставится до разбора тела запроса, поэтому dispatch
+            # освобождён от CSRF, а проверка выполняется в upload()
+            self.streaming_handler = S3StreamingUploadHandler(request, project=self.project, user=request.user)
+            request.upload_handlers.insert(0, self.streaming_handler)
+        try:
+            return self.upload(request, *args, **kwargs)
+        finally:
+            # Объекты, загруженные до отказа в CSRF, валидации или при ошибке, не нужны
+            if self.streaming_handler:
+                self.streaming_handler.discard_unclaimed()
+
+    @method_decorator(csrf_protect)
+    def upload(self, request, *args, **kwargs):
+        # form_invalid рендерит страницу со списком задач
+        self.object_list = self.get_queryset()
         form = self.get_form()
 
+        if self.streaming_handler and self.streaming_handler.error:
+            messages.error(request, f"Ошибка загрузки в хранилище: {self.streaming_handler.error}")
+            return self.form_invalid(form)
+
         if not form.is_valid():
             return self.form_invalid(form)
 
@@ -114,123 +199,160 @@ class ProjectTaskListView(LoginRequiredMixin, FormMixin, ListView):
         upload_mode = integration_settings.upload_mode
         saved_name = f"{timezone.now().strftime('%Y%m%d%H%M%S')}_{original_name}"
         s3_key = f"media_uploads/{saved_name}"
+        media_fields = {}
+        blob_key = None
 
         try:
-            session = Session()
-            s3_client = session.client(
-                service_name="s3",
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                endpoint_url=settings.ENDPOINT_URL,
-                region_name=settings.REGION
-            )
-
-            if upload_mode == UploadChoices.FULL:
+            if isinstance(file, StreamedUploadedFile):
+                print(f"🌊 Файл передан в хранилище потоком при разборе запроса: {file.storage_url}")
+                saved_name = file.saved_name
+                public_url = dedupe_upload(file.sha256, file.key, file.size)
+                # Дальше объектом владеет StoredBlob: при ошибке снимается ссылка, а не удаляется key
+                self.streaming_handler.claim(file)
+                blob_key = public_url[len(storage.object_url("")):]
+                upload_mode = "stream"
+                media_fields = {"audio_sha256": file.sha256, **file.media_fields}
+
+            elif upload_mode == UploadChoices.FULL:
+                media_fields = probe_media(file, original_name, file.size)
                 print("📦 Загрузка файла целиком (FULL)...")
-                s3_client.upload_fileobj(file, settings.BUCKET_NAME, s3_key)
-                public_url = f"{settings.ENDPOINT_URL}/{settings.BUCKET_NAME}/{s3_key}"
+                public_url = storage.upload_fileobj(file, s3_key)
 
             elif upload_mode == UploadChoices.PARTS:
-                print("🧩 Составная загрузка (PARTS) начата...")
-
-                init_response = s3_client.create_multipart_upload(
-                    Bucket=settings.BUCKET_NAME,
-                    Key=s3_key,
-                    ACL="public-read"
+                media_fields = probe_media(file, original_name, file.size)
+                print(f"🧩 Составная загрузка (PARTS): {file.size / MB:.2f} MB")
+                public_url = upload_media_file(
+                    file,
+                    s3_key,
+                    total_size=file.size,
+                    project=self.project,
+                    user=request.user,
+                    original_name=original_name,
+                    saved_name=saved_name,
                 )
-                upload_id = init_response["UploadId"]
-                print(f"✅ Upload ID: {upload_id}")
-
-                part_size = 40 * 1024 * 1024  # 40MB
-                total_size = file.size
-                total_parts = (total_size + part_size - 1) // part_size
-                total_mb = total_size / (1024 * 1024)
-
-                print(f"📁 Общий размер файла: {total_mb:.2f} MB")
-                print(f"🔢 Будет разбит на {total_parts} частей (~{part_size // (1024 * 1024)}MB каждая)")
-
-                offset = 0
-                part_number = 1
-                parts = []
-
-                while offset < total_size:
-                    file.seek(offset)
-                    chunk = file.read(part_size)
-
-                    if len(chunk) < 5 * 1024 * 1024 and offset + len(chunk) != total_size:
-                        raise ValueError(f"❌ Размер части слишком мал: {len(chunk)} байт")
-
-                    print(f"📤 Загружаем часть {part_number}/{total_parts} ({len(chunk)} байт)...")
-
-                    response = s3_client.upload_part(
-                        Bucket=settings.BUCKET_NAME,
-                        Key=s3_key,
-                        PartNumber=part_number,
-                        UploadId=upload_id,
-                        Body=chunk
-                    )
-
-                    parts.append({
-                        "ETag": response["ETag"],
-                        "PartNumber": part_number
-                    })
-
-                    print(f"✅ Часть {part_number} загружена. ETag: {response['ETag']}")
-
-                    offset += len(chunk)
-                    part_number += 1
-
-                print("📦 Завершаем составную загрузку...")
-
-                s3_client.complete_multipart_upload(
-                    Bucket=settings.BUCKET_NAME,
-                    Key=s3_key,
-                    UploadId=upload_id,
-                    MultipartUpload={"Parts": parts}
-                )
-
-                public_url = f"{settings.ENDPOINT_URL}/{settings.BUCKET_NAME}/{s3_key}"
-                print(f"🎉 Загрузка завершена: {public_url}")
 
             else:
                 messages.error(request, f"❌ Неизвестный режим загрузки: {upload_mode}")
                 return self.form_invalid(form)
 
-            media_task = MediaTask.objects.create(
-                project=self.project,
-                integration=request.user.integration,
-                audio_uploaded_title=original_name,
-                audio_title_saved=saved_name,
-                audio_extension_uploaded=ext,
-                audio_storage_url=public_url,
-                status=MediaTaskStatusChoices.LOADED,
-            )
-
-            OutboxEvent.objects.create(
-                media_task=media_task,
-                event_type=EventTypeChoices.AUDIO_UPLOADED_TO_YANDEX,
-                payload={
-                    "filename": saved_name,
-                    "extension": ext,
-                    "uploaded_by": request.user.username,
-                    "project_id": self.project.pk,
-                    "storage_url": public_url,
-                    "upload_mode": upload_mode,
-                },
+            media_task = create_uploaded_media_task(
+                self.project, request.user, original_name, saved_name, public_url, upload_mode, **media_fields
             )
-
             return redirect("upload_success", pk=media_task.pk)
 
         except (BotoCoreError, ClientError) as e:
             print(f"❌ Ошибка S3: {e}")
             messages.error(request, f"Ошибка загрузки в хранилище: {e}")
+            self.release_streamed_blob(file, blob_key)
             return self.form_invalid(form)
 
         except Exception as e:
             print(f"❌ Общая ошибка: {e}")
             messages.error(request, f"Ошибка при обработке: {e}")
+            self.release_streamed_blob(file, blob_key)
             return self.form_invalid(form)
 
+    def release_streamed_blob(self, file, blob_key):
+        """
+        Снимает ссылку, взятую dedupe_upload, если задача так и не создана.
+        """
+        if blob_key is None:
+            return
+        try:
+            release_blob(file.sha256, blob_key)
+        except Exception as e:
+            print(f"⚠️ Не удалось освободить {blob_key}: {e}")
+
+
+# === Пакетная загрузка: несколько WAV или ZIP-архив ===
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    """
+    Поле для нескольких файлов: cleaned_data — список загруженных файлов.
+    """
+
+    def clean(self, data, initial=None):
+        if not isinstance(data, (list, tuple)):
+            data = [data]
+        return [super(MultipleFileField, self).clean(item, initial) for item in data or [None]]
+
+
+class BulkUploadForm(forms.Form):
+    files = MultipleFileField(
+        label="Несколько файлов или ZIP-архив",
+        widget=MultipleFileInput(attrs={
+            "class": "form-control",
+            "accept": "audio/wav,.zip",
+            "multiple": True,
+        }),
+        help_text="WAV-файлы или ZIP-архив с WAV-файлами"
+    )
+    cast_template = forms.ModelChoiceField(
+        queryset=CastTemplate.objects.none(),
+        required=False,
+        label="Шаблон для всех файлов",
+        empty_label="Выбрать позже",
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+
+    def __init__(self, *args, integration=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Шаблоны, вопросы которых ещё извлекаются, выбрать нельзя
+        self.fields["cast_template"].queryset = CastTemplate.objects.filter(
+            integration=integration,
+            parse_status=TemplateParseStatusChoices.READY,
+        )
+
+
+class BulkUploadView(LoginRequiredMixin, View):
+    """
+    Пакетная загрузка в проект: файлы передаются в хранилище параллельно,
+    задачи создаются одной транзакцией, шаблон (если выбран) — сразу для всех.
+    """
+
+    def post(self, request, *args, **kwargs):
+        project = get_object_or_404(
+            Project,
+            pk=self.kwargs["pk"],
+            integration=request.user.integration
+        )
+        form = BulkUploadForm(request.POST, request.FILES, integration=request.user.integration)
+        if not form.is_valid():
+            messages.error(request, "❌ Выберите файлы для загрузки и корректный шаблон.")
+            return redirect("project-tasks", pk=project.pk)
+
+        try:
+            items, skipped = collect_bulk_items(form.cleaned_data["files"])
+        except BulkUploadError as e:
+            messages.error(request, f"❌ Пакетная загрузка: {e}")
+            return redirect("project-tasks", pk=project.pk)
+
+        if skipped:
+            messages.warning(request, f"Пропущены неподдерживаемые файлы: {', '.join(skipped)}")
+        if not items:
+            messages.error(request, "❌ Не найдено WAV-файлов для загрузки.")
+            return redirect("project-tasks", pk=project.pk)
+
+        print(f"📚 Пакетная загрузка в проект #{project.pk}: {len(items)} файлов")
+        uploader = BulkUploader(project, request.user)
+        uploaded, failed = uploader.upload(items)
+        for item, error in failed:
+            messages.error(request, f"❌ {item.name}: {error}")
+
+        if uploaded:
+            try:
+                uploader.create_tasks(uploaded, template=form.cleaned_data["cast_template"])
+            except Exception as e:
+                print(f"❌ Ошибка создания задач пакетной загрузки: {e}")
+                messages.error(request, f"Ошибка при создании задач: {e}")
+                return redirect("project-tasks", pk=project.pk)
+            messages.success(request, f"Загружено файлов: {len(uploaded)} из {len(items)}.")
+
+        return redirect("project-tasks", pk=project.pk)
+
 
 # === Форма для загрузки файла ===
 class AudioUploadForm(forms.Form):
@@ -244,6 +366,256 @@ class AudioUploadForm(forms.Form):
     )
 
 
+# === Прямая загрузка из браузера в хранилище (presigned multipart) ===
+class DirectUploadView(LoginRequiredMixin, View):
+    """
+    Базовый JSON-эндпоинт прямой загрузки. Тело запроса — JSON,
+    загрузка определяется session_id активной UploadSession пользователя.
+    """
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return JsonResponse({"error": "Ожидается JSON-объект"}, status=400)
+
+        try:
+            return self.handle(request, data)
+        except UploadSession.DoesNotExist:
+            return JsonResponse({"error": "Сессия загрузки не найдена или уже завершена"}, status=404)
+        except (KeyError, TypeError, ValueError) as e:
+            return JsonResponse({"error": f"Некорректный запрос: {e}"}, status=400)
+        except (BotoCoreError, ClientError) as e:
+            print(f"❌ Ошибка S3: {e}")
+            return JsonResponse({"error": f"Ошибка хранилища: {e}"}, status=502)
+
+    def handle(self, request, data):
+        raise NotImplementedError
+
+    @staticmethod
+    def parse_parts(raw_parts):
+        return [
+            {"PartNumber": int(part["PartNumber"]), "ETag": str(part["ETag"])}
+            for part in raw_parts
+        ]
+
+
+class DirectUploadInitView(DirectUploadView):
+    def handle(self, request, data):
+        project = get_object_or_404(
+            Project,
+            pk=self.kwargs["pk"],
+            integration=request.user.integration
+        )
+        original_name = os.path.basename(str(data["filename"]))
+        total_size = int(data["size"])
+        ext = original_name.split(".")[-1].lower()
+        if ext != "wav":
+            return JsonResponse({"error": f"Пока неподдерживаемый тип файла: {ext}"}, status=400)
+        if total_size <= 0:
+            return JsonResponse({"error": "Пустой файл"}, status=400)
+
+        return JsonResponse(start_direct_upload(project, request.user, original_name, total_size))
+
+
+class DirectUploadPartsView(DirectUploadView):
+    """
+    Подписанные URL для следующих частей. Заодно браузер сообщает
+    о частях, загруженных с прошлого запроса (completed).
+    """
+    max_parts_per_request = 100
+
+    def handle(self, request, data):
+        session = get_active_session(data["session_id"], request.user)
+        record_session_parts(session, self.parse_parts(data.get("completed", [])))
+        part_numbers = [int(n) for n in data["part_numbers"]][:self.max_parts_per_request]
+        if any(n < 1 or n > MAX_PARTS for n in part_numbers):
+            raise ValueError("номер части вне диапазона")
+        return JsonResponse({"urls": presign_part_urls(session, part_numbers)})
+
+
+class DirectUploadResumeView(DirectUploadView):
+    """
+    Состояние прерванной загрузки: части, которые уже есть в хранилище.
+    Браузер догружает только недостающие.
+    """
+
+    def handle(self, request, data):
+        session = sync_session_parts(get_active_session(data["session_id"], request.user))
+        return JsonResponse(direct_session_state(session))
+
+
+class DirectUploadCompleteView(DirectUploadView):
+    def handle(self, request, data):
+        session = get_active_session(data["session_id"], request.user)
+        project = get_object_or_404(
+            Project,
+            pk=session.project_id,
+            integration=request.user.integration
+        )
+        record_session_parts(session, self.parse_parts(data.get("parts", [])))
+        if not session.parts:
+            raise ValueError("нет загруженных частей")
+
+        public_url = complete_upload_session(session)
+        print(f"🎉 Прямая загрузка завершена: {public_url}")
+        media_task = create_uploaded_media_task(
+            project, request.user, session.original_name, session.saved_name, public_url, "direct"
+        )
+
+        def enqueue():
+            try:
+                hash_upload_task.delay(media_task.id, session.key)
+            except Exception as e:
+                print(f"⚠️ Не удалось поставить подсчёт хэша MediaTask #{media_task.id}: {e}")
+
+        transaction.on_commit(enqueue)
+        return JsonResponse({"redirect_url": reverse("upload_success", kwargs={"pk": media_task.pk})})
+
+
+class DirectUploadCheckView(DirectUploadView):
+    """
+    Проверка по хэшу до загрузки: если такой файл уже загружала эта же
+    интеграция, задача создаётся сразу, без передачи байтов.
+    """
+
+    def handle(self, request, data):
+        project = get_object_or_404(
+            Project,
+            pk=self.kwargs["pk"],
+            integration=request.user.integration
+        )
+        sha256 = str(data["sha256"]).lower()
+        if not SHA256_RE.match(sha256):
+            raise ValueError("sha256 должен быть 64 шестнадцатеричными символами")
+        original_name = os.path.basename(str(data["filename"]))
+
+        blob = find_blob(sha256, request.user.integration, size=int(data["size"]))
+        if blob is None:
+            return JsonResponse({"exists": False})
+
+        blob, _ = acquire_blob(blob.sha256, blob.key, blob.size)
+        print(f"♻️ Файл {original_name} уже в хранилище, загрузка не нужна: {blob.key}")
+        # Общий у задач только объект аудио: от saved_name зависят ключи
+        # расшифровки и других артефактов задачи
+        saved_name, _ = media_upload_key(original_name)
+        media_task = create_uploaded_media_task(
+            project,
+            request.user,
+            original_name,
+            saved_name,
+            storage.object_url(blob.key),
+            "dedup",
+            audio_sha256=blob.sha256,
+        )
+        return JsonResponse({
+            "exists": True,
+            "redirect_url": reverse("upload_success", kwargs={"pk": media_task.pk}),
+        })
+
+
+class DirectUploadAbortView(DirectUploadView):
+    def handle(self, request, data):
+        abort_upload_session(get_active_session(data["session_id"], request.user))
+        return JsonResponse({"ok": True})
+
+
+class ProjectExportView(LoginRequiredMixin, View):
+    """
+    Запускает формирование сводной выгрузки по всем задачам проекта.
+    Файл собирается в фоне, ссылка появляется на странице проекта.
+    """
+    allowed_formats = {
+        ExportKindChoices.REPORT: {ExportFormatChoices.XLSX, ExportFormatChoices.CSV},
+        ExportKindChoices.ANSWER_MATRIX: {ExportFormatChoices.PARQUET, ExportFormatChoices.CSV},
+    }
+
+    def post(self, request, *args, **kwargs):
+        project = get_object_or_404(
+            Project,
+            pk=self.kwargs["pk"],
+            integration=request.user.integration
+        )
+        kind = request.POST.get("kind", ExportKindChoices.REPORT)
+        export_format = request.POST.get("export_format", ExportFormatChoices.XLSX)
+        if export_format not in self.allowed_formats.get(kind, ()):
+            messages.error(request, f"❌ Неизвестный формат выгрузки: {kind}/{export_format}")
+            return redirect("project-tasks", pk=project.pk)
+
+        export = ProjectExport.objects.create(project=project, kind=kind, export_format=export_format)
+
+        def enqueue():
+            try:
+                export_project_task.delay(export.id)
+            except Exception as e:
+                print(f"⚠️ Не удалось поставить выгрузку #{export.id} в очередь: {e}")
+
+        transaction.on_commit(enqueue)
+        messages.success(request, "Выгрузка формируется, ссылка появится на этой странице.")
+        return redirect("project-tasks", pk=project.pk)
+
+
+class MediaTaskExcelView(LoginRequiredMixin, View):
+    """
+    Скачивание Excel-отчёта задачи. Если отчёт ещё не сформирован
+    (ленивый режим) или устарел, он рендерится по запросу.
+    """
+
+    def get(self, request, *args, **kwargs):
+        media_obj = get_object_or_404(
+            MediaTask,
+            pk=self.kwargs["pk"],
+            integration=request.user.integration
+        )
+        version = get_template_version(media_obj)
+        if not media_obj.gpt_result or not version or not version.excel_file:
+            if media_obj.excel_path:
+                return redirect(media_obj.excel_path)
+            raise Http404("Excel-отчёт для задачи недоступен")
+
+        try:
+            public_url = ensure_task_report(media_obj, version)
+        except (BotoCoreError, ClientError) as e:
+            messages.error(request, f"Ошибка при формировании отчёта: {e}")
+            if media_obj.project_id:
+                return redirect("project-tasks", pk=media_obj.project_id)
+            return redirect("home")
+
+        if media_obj.status == MediaTaskStatusChoices.DATA_EXTRACTION_SUCCESS:
+            media_obj.status = MediaTaskStatusChoices.SAVE_EXCEL_FINISH
+            media_obj.save(update_fields=["status"])
+        return redirect(public_url)
+
+
+class MediaTaskPdfView(LoginRequiredMixin, View):
+    """
+    Скачивание PDF-отчёта задачи; при отсутствии он рендерится по запросу.
+    """
+
+    def get(self, request, *args, **kwargs):
+        media_obj = get_object_or_404(
+            MediaTask.objects.select_related("project"),
+            pk=self.kwargs["pk"],
+            integration=request.user.integration
+        )
+        version = get_template_version(media_obj)
+        if not media_obj.gpt_result or not version or not version.questions:
+            if media_obj.pdf_path:
+                return redirect(media_obj.pdf_path)
+            raise Http404("PDF-отчёт для задачи недоступен")
+
+        try:
+            public_url = ensure_task_pdf(media_obj, version)
+        except (BotoCoreError, ClientError) as e:
+            messages.error(request, f"Ошибка при формировании отчёта: {e}")
+            if media_obj.project_id:
+                return redirect("project-tasks", pk=media_obj.project_id)
+            return redirect("home")
+        return redirect(public_url)
+
+
 # === Основная вьюха для загрузки ===
 class MainUploadsView(LoginRequiredMixin, View):
     """
@@ -298,7 +670,8 @@ class MainUploadsView(LoginRequiredMixin, View):
             audio_title_saved=saved_name,
             audio_local_storage=file_path,
             audio_extension_uploaded=ext,
-            status="loaded"
+            status="loaded",
+            **probe_media_path(file_path, original_name)
         )
 
         # Создаем OutboxEvent
@@ -351,8 +724,10 @@ class MainView(LoginRequiredMixin, View):
                     destination.write(chunk)
 
             # === Создаем MediaTask (с привязкой к проекту, если передан) ===
+            # Длительность и параметры аудио — по заголовку сохранённого файла
             create_kwargs = {
                 "project": project,
+                **probe_media_path(full_path, original_name),
             }
 
             if ext in ["mp4", "mov", "avi", "mkv"]:
@@ -438,7 +813,11 @@ class UploadSuccessView(LoginRequiredMixin, UpdateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         integration = self.object.integration
-        context["cast_templates"] = CastTemplate.objects.filter(integration=integration)
+        # Шаблоны, вопросы которых ещё извлекаются, выбрать нельзя
+        context["cast_templates"] = CastTemplate.objects.filter(
+            integration=integration,
+            parse_status=TemplateParseStatusChoices.READY,
+        )
         context['integration'] = self.request.user.integration
         return context
 
@@ -451,6 +830,12 @@ class UploadSuccessView(LoginRequiredMixin, UpdateView):
 
         media_task = self.object  # уже сохранённый объект
         if media_task.cast_template:
+            # Закрепляем текущую версию шаблона, чтобы правки шаблона не влияли на задачу
+            if not media_task.cast_template.current_version_id:
+                media_task.cast_template.save()
+            media_task.template_version = media_task.cast_template.current_version
+            media_task.save(update_fields=["template_version"])
+
             # Создаём OutboxEvent, чтобы запустить обработку по выбранному шаблону
             OutboxEvent.objects.create(
                 media_task=media_task,
@@ -516,77 +901,27 @@ class CastTemplateCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         """
-        После сохранения формы — сохраняем файл локально
-        и парсим вопросы из Excel.
+        Сохраняет шаблон; вопросы из Excel извлекаются в фоне,
+        чтобы разбор большого файла не занимал веб-воркер.
         """
         template = form.save(commit=False)
         template.integration = self.request.user.integration
-
-        uploaded_file = self.request.FILES.get("excel_file")
-        if uploaded_file:
-            # === Сохраняем файл локально ===
-            file_path = os.path.join(settings.BASE_DIR, uploaded_file.name)
-            with open(file_path, "wb+") as destination:
-                for chunk in uploaded_file.chunks():
-                    destination.write(chunk)
-
-            print(f"📁 Файл сохранён локально: {file_path}")
-
-            # === Парсим Excel ===
-            questions_json = self.parse_excel_questions(file_path)
-            template.questions = questions_json
-
+        if template.excel_file:
+            template.parse_status = TemplateParseStatusChoices.PENDING
         template.save()
-        return super().form_valid(form)
 
-    def parse_excel_questions(self, file_path: str) -> dict:
-        """
-        Парсит Excel-файл и возвращает JSON вида:
-        {
-          "1": "Вопрос типа: ..., цель вопроса: ..., вопрос: ...",
-          ...
-        }
-        """
-        wb = load_workbook(file_path)
-        sheet = wb.active
-
-        # === собираем карту объединённых ячеек ===
-        merged_map = {}
-        for merged_range in sheet.merged_cells.ranges:
-            min_col, min_row, max_col, max_row = merged_range.bounds
-            top_left_value = sheet.cell(row=min_row, column=min_col).value
-            for r in range(min_row, max_row + 1):
-                for c in range(min_col, max_col + 1):
-                    merged_map[(r, c)] = top_left_value
-
-        all_rows = []
-        for row in sheet.iter_rows(min_row=4, min_col=1, max_col=3, values_only=False):
-            values = [
-                (cell.value or merged_map.get((cell.row, cell.column)))
-                for cell in row
-            ]
-            if not any(values):  # пропускаем пустые строки
-                continue
-            all_rows.append(values)
-
-        # === Формируем JSON ===
-        questions_dict = {}
-        for idx, (type_q, goal_q, question_text) in enumerate(all_rows, start=1):
-            type_q = type_q or "(не указан тип)"
-            goal_q = goal_q or "(не указана цель)"
-            question_text = question_text or "(текст вопроса не найден)"
-            text = (
-                f"Вопрос типа: {type_q}, "
-                f"цель вопроса: {goal_q}, "
-                f"вопрос: {question_text}"
-            )
-            questions_dict[str(idx)] = text
+        if template.parse_status == TemplateParseStatusChoices.PENDING:
+            def enqueue():
+                try:
+                    parse_template_task.delay(template.id)
+                except Exception as e:
+                    print(f"⚠️ Не удалось поставить разбор шаблона #{template.id}: {e}")
 
-        print("✅ Распарсенные вопросы:")
-        for k, v in questions_dict.items():
-            print(f"{k}: {v}")
+            transaction.on_commit(enqueue)
+            messages.success(self.request, "Шаблон сохранён, вопросы извлекаются из Excel.")
 
-        return questions_dict
+        self.object = template
+        return redirect(self.get_success_url())
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -613,7 +948,7 @@ class CastTemplateUpdateView(LoginRequiredMixin, UpdateView):
 
 class IntegrationSettingsView(LoginRequiredMixin, UpdateView):
     model = IntegrationSettings
-    fields = ["upload_mode"]  # укажи нужные поля настроек
+    fields = ["upload_mode", "excel_mode"]  # укажи нужные поля настроек
     template_name = "integration_settings.html"
     context_object_name = "settings"
 
@@ -32,6 +32,11 @@ cleanup() {
         echo "✅ Celery processing worker остановлен"
     fi
     
+    if [ ! -z "$CELERY_PDF_PID" ]; then
+        kill $CELERY_PDF_PID 2>/dev/null
+        echo "✅ Celery pdf worker остановлен"
+    fi
+    
     if [ ! -z "$CELERY_BEAT_PID" ]; then
         kill $CELERY_BEAT_PID 2>/dev/null
         echo "✅ Celery beat остановлен"
@@ -78,6 +83,13 @@ CELERY_PROCESSING_PID=$!
 # Ждем немного, чтобы processing worker запустился
 sleep 2
 
+echo "⚡ Запуск Celery worker для очереди pdf..."
+celery -A backend worker -Q pdf -n worker_pdf@%h --loglevel=INFO --concurrency=${PDF_WORKER_CONCURRENCY:-2} &
+CELERY_PDF_PID=$!
+
+# Ждем немного, чтобы pdf worker запустился
+sleep 2
+
 echo "⏰ Запуск Celery beat scheduler..."
 celery -A backend beat --loglevel=INFO &
 CELERY_BEAT_PID=$!
@@ -89,6 +101,7 @@ echo "📋 Статус сервисов:"
 echo "   🌐 Django: http://127.0.0.1:8000 (PID: $DJANGO_PID)"
 echo "   ⚡ Celery Handler Worker (PID: $CELERY_HANDLER_PID)"
 echo "   ⚡ Celery Processing Worker (PID: $CELERY_PROCESSING_PID)"
+echo "   ⚡ Celery PDF Worker (PID: $CELERY_PDF_PID)"
 echo "   ⏰ Celery Beat (PID: $CELERY_BEAT_PID)"
 echo ""
 echo "💡 Для остановки всех сервисов нажмите Ctrl+C"